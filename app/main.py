@@ -29,6 +29,10 @@ from app.routers import (
     super_user_http,
 )
 import utils.log_utils as lu
+from core.db import set_process_role
+
+# db connection pool sizes of the api
+set_process_role("api")
 
 # get log config
 logging.config.dictConfig(lu.get_log_config_dict())
@@ -20,6 +20,7 @@ import app.routers.dependencies as dpd
 from utils.comms import close_websocket_for_sherpa
 import utils.log_utils as lu
 import core.common as ccm
+import core.constants as cc
 # from utils.fleet_utils import save_map, strip_archive_extensions
 
 
@@ -118,10 +119,14 @@ async def switch_sherpa(
             async with aioredis.Redis.from_url(os.getenv("FM_REDIS_URI")) as aredis_conn:
                 await fu.update_fleet_conf_in_redis(dbsession, aredis_conn)
 
-            new_qs = [f"{sherpa_name}_update_handler", f"{sherpa_name}_trip_update_handler"]
-            for new_q in new_qs:
+            for new_q in rqu.get_sherpa_queue_names(sherpa_name):
                 rqu.Queues.add_queue(new_q)
-                process = Process(target=rqu.start_worker, args=(new_q,))
+
+            worker_mode = rqu.get_rq_config().get("worker_mode", rqu.WORKER_MODE_SIMPLE)
+            for q_names, worker_class in rqu.get_new_sherpa_worker_queues(
+                sherpa_name, worker_mode
+            ):
+                process = Process(target=rqu.start_worker, args=(q_names, worker_class))
                 process.start()
 
         except Exception as e:
@@ -169,10 +174,14 @@ async def add_edit_sherpa(
             async with aioredis.Redis.from_url(os.getenv("FM_REDIS_URI")) as aredis_conn:
                 await fu.update_fleet_conf_in_redis(dbsession, aredis_conn)
 
-            new_qs = [f"{sherpa_name}_update_handler", f"{sherpa_name}_trip_update_handler"]
-            for new_q in new_qs:
+            for new_q in rqu.get_sherpa_queue_names(sherpa_name):
                 rqu.Queues.add_queue(new_q)
-                process = Process(target=rqu.start_worker, args=(new_q,))
+
+            worker_mode = rqu.get_rq_config().get("worker_mode", rqu.WORKER_MODE_SIMPLE)
+            for q_names, worker_class in rqu.get_new_sherpa_worker_queues(
+                sherpa_name, worker_mode
+            ):
+                process = Process(target=rqu.start_worker, args=(q_names, worker_class))
                 process.start()
 
     return response
@@ -312,7 +321,7 @@ async def add_fleet(
         if new_fleet:
             async with aioredis.Redis.from_url(os.getenv("FM_REDIS_URI")) as aredis_conn:
                 await fu.update_fleet_conf_in_redis(dbsession, aredis_conn)
-                await aredis_conn.set("add_router_for", fleet_name)
+                await aredis_conn.rpush(cc.RouterJobQueues.MAP_UPDATE, fleet_name)
 
     return response
 
@@ -427,6 +436,6 @@ async def update_map(
 
         async with aioredis.Redis.from_url(os.getenv("FM_REDIS_URI")) as aredis_conn:
             await fu.update_fleet_conf_in_redis(dbsession, aredis_conn)
-            await aredis_conn.set("update_router_for", fleet_name)
+            await aredis_conn.rpush(cc.RouterJobQueues.MAP_UPDATE, fleet_name)
 
     return response
@@ -7,13 +7,13 @@ from fastapi import HTTPException
 from fastapi import Header
 from fastapi.param_functions import Query
 from rq.job import Job
-import redis
-import os
+import pickle
 import json
 
 # ati code imports
 import core.handler_configuration as hc
-from utils.rq_utils import enqueue, enqueue_at, Queues
+from utils.rq_utils import enqueue, enqueue_at, Queues, get_job_completion_key
+from utils.redis_pool import get_redis_conn, get_async_redis_conn
 from models.db_session import DBSession
 import models.request_models as rqm 
 
@@ -37,26 +37,29 @@ class UserDetails:
         self.user_check()
         self.role_check(role)
 
+# jobs being waited upon are registered in a redis set per source, so that they can be
+# cancelled by source, see utils.comms.cancel_jobs_from_user. Sets expire if not
+# written to for QUEUED_JOBS_TTL secs, in case a job never gets removed
+QUEUED_JOBS_TTL = 60 * 60
+
+
+def get_queued_jobs_key(source):
+    return f"queued_jobs:{source}"
+
+
 # upon assignment of a task, it gets added into the job queue
 def add_job_to_queued_jobs(job_id, source, redis_conn=None):
     close = False
     if redis_conn is None:
-        redis_conn = redis.from_url(os.getenv("FM_REDIS_URI"))
+        redis_conn = get_redis_conn()
         close = True
-    queued_jobs = redis_conn.get("queued_jobs")
-    if queued_jobs is None:
-        queued_jobs = b"{}"
 
-    queued_jobs = json.loads(queued_jobs)
+    queued_jobs_key = get_queued_jobs_key(source)
+    with redis_conn.pipeline(transaction=True) as pipe:
+        pipe.sadd(queued_jobs_key, job_id)
+        pipe.expire(queued_jobs_key, QUEUED_JOBS_TTL)
+        pipe.execute()
 
-    jobs_source = queued_jobs.get(source)
-
-    if jobs_source is None:
-        jobs_source = []
-    jobs_source.append(job_id)
-
-    queued_jobs.update({source: jobs_source})
-    redis_conn.set("queued_jobs", json.dumps(queued_jobs))
     if close:
         redis_conn.close()
 
@@ -65,24 +68,10 @@ def add_job_to_queued_jobs(job_id, source, redis_conn=None):
 def remove_job_from_queued_jobs(job_id, source, redis_conn=None):
     close = False
     if redis_conn is None:
-        redis_conn = redis.from_url(os.getenv("FM_REDIS_URI"))
+        redis_conn = get_redis_conn()
         close = True
 
-    queued_jobs = redis_conn.get("queued_jobs")
-    if queued_jobs is None:
-        return
-
-    queued_jobs = json.loads(queued_jobs)
-
-    jobs_source = queued_jobs.get(source)
-    if jobs_source is None:
-        return
-
-    if job_id in jobs_source:
-        jobs_source.remove(job_id)
-
-    queued_jobs.update({source: jobs_source})
-    redis_conn.set("queued_jobs", json.dumps(queued_jobs))
+    redis_conn.srem(get_queued_jobs_key(source), job_id)
 
     if close:
         redis_conn.close()
@@ -143,7 +132,7 @@ def get_forwarded_for_from_header(x_forwarded_for: str = Header(None)):
     return x_forwarded_for
 
 def get_number_of_request(times=1, seconds=60,fleet_name=None):
-    redis_conn = redis.from_url(os.getenv("FM_REDIS_URI"))
+    redis_conn = get_redis_conn()
     number_of_request = redis_conn.get(f"{fleet_name}_number_of_request")
     if number_of_request is None:
         redis_conn.setex(
@@ -172,7 +161,7 @@ def get_number_of_request(times=1, seconds=60,fleet_name=None):
 
 
 def decode_token(token: str):
-    redis_conn = redis.from_url(os.getenv("FM_REDIS_URI"))
+    redis_conn = get_redis_conn()
     try:
         details = jwt.decode(
             token,
@@ -186,7 +175,7 @@ def decode_token(token: str):
         return None
     
 def decode_user_details(token: str):
-    redis_conn = redis.from_url(os.getenv("FM_REDIS_URI"))
+    redis_conn = get_redis_conn()
     userdetails = UserDetails()
     try:
         details = jwt.decode(
@@ -203,7 +192,7 @@ def decode_user_details(token: str):
     return userdetails
 
 def generate_jwt_token(username: str, role=None, expiry_interval=None):
-    redis_conn = redis.from_url(os.getenv("FM_REDIS_URI"))
+    redis_conn = get_redis_conn()
     if expiry_interval is None:
         expiry_interval = int(redis_conn.get("token_expiry_time_sec").decode())
     access_token = jwt.encode(
@@ -227,12 +216,12 @@ async def check_token_expiry(token, client_ip, check_freq=30):
 
 
 # processes the requests in the job queue.
-def process_req(queue, req, user, redis_conn=None, dt=None):
+def process_req(queue, req, user, redis_conn=None, dt=None, notify_completion=False):
     if not user:
         raise HTTPException(status_code=403, detail=f"Unknown requester {user}")
 
     if redis_conn is None:
-        redis_conn = redis.from_url(os.getenv("FM_REDIS_URI"))
+        redis_conn = get_redis_conn()
 
     job = None
     req.source = user
@@ -260,6 +249,10 @@ def process_req(queue, req, user, redis_conn=None, dt=None):
 
     kwargs.update({"job_timeout": timeout})
 
+    # report_success/report_failure push the completion to get_job_completion_key(job.id)
+    if notify_completion:
+        kwargs.update({"meta": {"notify_completion": True}})
+
     if dt:
         job = enqueue_at(queue, dt, handle, *args, **kwargs)
         return job
@@ -269,6 +262,10 @@ def process_req(queue, req, user, redis_conn=None, dt=None):
     return job
 
 
+# secs to block on a job completion before checking the job status
+COMPLETION_POLL_INTERVAL = 1
+
+
 def relay_error_details(e: Exception):
     error_detail = "Unable to process request"
     status_code = 500
@@ -283,39 +280,48 @@ def relay_error_details(e: Exception):
     raise_error(detail=error_detail, code=status_code)
 
 
-async def process_req_with_response(queue, req, user: str):
-    redis_conn = redis.from_url(os.getenv("FM_REDIS_URI"))
-    job = process_req(queue, req, user, redis_conn)
-    add_job_to_queued_jobs(job.id, req.source, redis_conn)
+async def wait_for_job_completion(job, redis_conn, aredis_conn):
+    # blocks on the completion list of the job, job status is checked every
+    # COMPLETION_POLL_INTERVAL secs in case the completion was never pushed(worker died)
+    job_completion_key = get_job_completion_key(job.id)
+    while True:
+        completion = await aredis_conn.blpop(
+            job_completion_key, timeout=COMPLETION_POLL_INTERVAL
+        )
+        if completion is not None:
+            completion = pickle.loads(completion[1])
+            if not completion.get("fetch_job"):
+                return completion
 
-    status = ""
-    while status not in ["finished", "failed"]:
         job = Job.fetch(job.id, connection=redis_conn)
-        job.refresh()
         status = job.get_status()
-        logging.debug(f"Job id: {Job.id}, Job status: {status}")
-        await asyncio.sleep(0.01)
+        logging.debug(f"Job id: {job.id}, Job status: {status}")
+        if status == "canceled":
+            # cancelled by source, see utils.comms.cancel_jobs_from_user
+            return {"status": "failed", "error_value": Exception(f"job {job.id} cancelled")}
+        if status in ["finished", "failed"]:
+            return {
+                "status": status,
+                "result": job.result,
+                "error_value": job.get_meta(refresh=True).get("error_value"),
+            }
+
+
+async def process_req_with_response(queue, req, user: str):
+    redis_conn = get_redis_conn()
+    job = process_req(queue, req, user, redis_conn, notify_completion=True)
+    add_job_to_queued_jobs(job.id, req.source, redis_conn)
+
+    async with get_async_redis_conn() as aredis_conn:
+        completion = await wait_for_job_completion(job, redis_conn, aredis_conn)
 
     remove_job_from_queued_jobs(job.id, req.source, redis_conn)
 
-    if status == "failed":
-        await asyncio.sleep(0.1)
-        job_meta = job.get_meta(refresh=True)
-        error_value = job_meta.get("error_value")
+    if completion["status"] == "failed":
         job.cancel()
-        relay_error_details(error_value)
-
-    # Fetching the job result
-    response = job.result
-    if response is None:
-        job = Job.fetch(job.id, connection=redis_conn)
-        job.refresh()
-        response = job.result
-        logging.getLogger("fm_debug").warning(
-            f"Got a null response from rq initially, req: {req}, new_response after refesh {response}"
-        )
+        relay_error_details(completion["error_value"])
 
-    return response
+    return completion["result"]
 
 
 def handle(handler, msg, **kwargs):
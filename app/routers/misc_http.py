@@ -1,6 +1,5 @@
 import json
 import os
-import asyncio
 from fastapi.encoders import jsonable_encoder
 import aioredis
 import subprocess
@@ -25,8 +24,12 @@ import app.routers.dependencies as dpd
 import utils.util as utils_util
 import core.common as ccm
 import core.constants as cc
+from core.db import GOVERNOR_INTERVAL
 import utils.fleet_utils as fu
 from utils.rq_utils import Queues
+from utils.route_length_cache import get_stats_key
+from utils.handler_db_stats import get_handler_db_stats
+from optimal_dispatch.scheduler import get_metrics_key
 
 
 router = APIRouter(
@@ -240,22 +243,27 @@ async def get_route_wps(
             stations_poses.append(station.pose)
         job_id = utils_util.generate_random_job_id()
         control_router_wps_job = [stations_poses, fleet_name, job_id]
-        await redis_conn.setex(
-            f"control_router_wps_job_{job_id}",
-            5 * int((await redis_conn.get("default_job_timeout_ms"))),
+        shard = await redis_conn.hget(cc.RouterPoolKeys.FLEET_SHARDS, fleet_name)
+        if shard is None:
+            dpd.raise_error(f"No router worker serves {fleet_name}, unknown fleet")
+        await redis_conn.rpush(
+            f"{cc.RouterJobQueues.ROUTE_WPS}:{int(shard)}",
             json.dumps(control_router_wps_job),
         )
 
-        while not await redis_conn.get(f"result_wps_job_{job_id}"):
-            await asyncio.sleep(0.005)
+        job_timeout = 5 * int(await redis_conn.get("default_job_timeout_ms")) / 1000
+        result = await redis_conn.blpop(
+            f"result_wps_job_{job_id}", timeout=max(1, math.ceil(job_timeout))
+        )
+        if result is None:
+            dpd.raise_error("Timed out waiting for route preview")
 
-        wps_list = json.loads(await redis_conn.get(f"result_wps_job_{job_id}"))
+        wps_list = json.loads(result[1])
 
         if not len(wps_list):
             dpd.raise_error("Cannot find route")
 
         response.update({"wps_list": wps_list})
-        await redis_conn.delete(f"result_wps_job_{job_id}")
 
     return response
 
@@ -603,11 +611,59 @@ async def fm_health_stats(
     with redis.from_url(os.getenv("FM_REDIS_URI")) as redis_conn:
         fm_backup_path = os.path.join(os.getenv("FM_STATIC_DIR"), "data_backup")
         current_data = redis_conn.get("current_data_folder").decode()
+
+        router_pool_health = redis_conn.get(cc.RouterPoolKeys.POOL_HEALTH)
+
+        # db pool metrics per process, entries of processes which have exited are dropped
+        db_pool_stats = {}
+        for key, val in redis_conn.hgetall(cc.DBPoolKeys.STATS).items():
+            stats = json.loads(val)
+            if time.time() - stats["updated_at"] > 3 * GOVERNOR_INTERVAL:
+                redis_conn.hdel(cc.DBPoolKeys.STATS, key)
+                continue
+            db_pool_stats[key.decode()] = stats
+
+        # target/published rate, build time per msg type of periodic updates
+        periodic_updates_stats = {
+            key.decode(): json.loads(val)
+            for key, val in redis_conn.hgetall(cc.PeriodicUpdatesKeys.STATS).items()
+        }
+
+        # route length cache hits/misses per fleet
+        rl_cache_stats = {}
+        # optimal dispatch triggers/runs/coalesced triggers per fleet
+        optimal_dispatch_stats = {}
+        for fleet_name in json.loads(redis_conn.get("all_fleet_names")):
+            stats = redis_conn.hgetall(get_stats_key(fleet_name))
+            rl_cache_stats[fleet_name] = {
+                key.decode(): int(val) for key, val in stats.items()
+            }
+            stats = redis_conn.hgetall(get_metrics_key(fleet_name))
+            optimal_dispatch_stats[fleet_name] = {
+                key.decode(): val.decode() for key, val in stats.items()
+            }
+
     response["current_data_folder"] = os.path.join(fm_backup_path, current_data)
+    response["route_length_cache"] = rl_cache_stats
+    response["router_pool"] = json.loads(router_pool_health) if router_pool_health else []
+    response["optimal_dispatch"] = optimal_dispatch_stats
+    response["periodic_updates"] = periodic_updates_stats
+    response["db_pools"] = db_pool_stats
 
     return response
 
 
+@router.get("/handler_db_stats")
+async def handler_db_stats(
+    user_name=Depends(dpd.get_user_from_header),
+):
+    # statements, rows, db time, slowest statements per handler msg type, last 24 hours
+    if not user_name:
+        dpd.raise_error("Unknown requester", 401)
+
+    return get_handler_db_stats()
+
+
 @router.get("/get_downloads")
 async def get_downloads(
     user_name=Depends(dpd.get_user_from_header),
@@ -1,13 +1,11 @@
 import asyncio
 import logging
 import logging.config
-import aioredis
-import os
-import ast
 from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect, status
 from sqlalchemy.orm.attributes import flag_modified
 
 # ati code imports
+from utils.redis_subscriber import get_redis_subscriber
 import app.routers.dependencies as dpd
 from models.db_session import DBSession
 import utils.log_utils as lu
@@ -158,21 +156,17 @@ async def reader(websocket, token, x_real_ip):
 
 
 async def writer(websocket, token, x_real_ip, user_name):
-    redis = aioredis.Redis.from_url(
-        os.getenv("FM_REDIS_URI"), max_connections=10, decode_responses=True
-    )
-    psub = redis.pubsub()
-    await psub.subscribe("channel:notifications")
+    channel = "channel:notifications"
+    redis_subscriber = get_redis_subscriber()
+    queue = await redis_subscriber.subscribe(channel)
 
-    
     fleet_names = get_all_fleets_list_as_per_user(user_name)
 
-    while True:
-        message = await psub.get_message(ignore_subscribe_messages=True, timeout=5)
-        if message:
+    try:
+        while True:
+            data = await queue.get()
             try:
                 notification = {}
-                data = ast.literal_eval(message["data"])
                 fleet_name = data.get("fleet_name", None)
                 if fleet_name in fleet_names or fleet_name is None:
                     all_modules = data.get("modules", [])
@@ -185,8 +179,15 @@ async def writer(websocket, token, x_real_ip, user_name):
                         if id in all_modules:
                             for notif_id, notif_val in details.items():
                                 if token not in notif_val.get("cleared_by", []):
-                                    notif_val["num_actions"] = len(notif_val["cleared_by"])
-                                    del notif_val["cleared_by"]
+                                    # data is shared with the other subscribers, copy
+                                    notif_val = {
+                                        key: val
+                                        for key, val in notif_val.items()
+                                        if key != "cleared_by"
+                                    }
+                                    notif_val["num_actions"] = len(
+                                        details[notif_id]["cleared_by"]
+                                    )
                                     notification[module].update({notif_id: notif_val})
                         else:
                             notification.update({id: details})
@@ -198,3 +199,5 @@ async def writer(websocket, token, x_real_ip, user_name):
                     f"Exception in notification webSocket writer for {x_real_ip}, Exception: {e}"
                 )
                 raise e
+    finally:
+        redis_subscriber.unsubscribe(channel, queue)
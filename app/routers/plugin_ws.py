@@ -1,14 +1,13 @@
-import ast
 import asyncio
 import logging
 import logging.config
-import os
 import json
-import aioredis
 from fastapi import APIRouter, Depends, WebSocket, status, WebSocketDisconnect
 
 
 # ati code imports
+from utils.redis_subscriber import get_redis_subscriber
+from utils.redis_pool import get_async_redis_conn
 import app.routers.dependencies as dpd
 import utils.log_utils as lu
 
@@ -59,9 +58,7 @@ async def plugin_comms_ws(
 
 
 async def reader(websocket, x_real_ip):
-    redis = aioredis.Redis.from_url(
-        os.getenv("FM_REDIS_URI"), max_connections=10, decode_responses=True
-    )
+    redis = get_async_redis_conn(decode_responses=True)
     while True:
         try:
             msg = await websocket.receive_json()
@@ -74,15 +71,12 @@ async def reader(websocket, x_real_ip):
 
 
 async def writer(websocket, x_real_ip):
-    redis = aioredis.Redis.from_url(
-        os.getenv("FM_REDIS_URI"), max_connections=10, decode_responses=True
-    )
-    psub = redis.pubsub()
-    await psub.subscribe("channel:plugin_comms")
-    while True:
-        message = await psub.get_message(ignore_subscribe_messages=True, timeout=5)
-        if message:
-            data = ast.literal_eval(message["data"])
+    channel = "channel:plugin_comms"
+    redis_subscriber = get_redis_subscriber()
+    queue = await redis_subscriber.subscribe(channel)
+    try:
+        while True:
+            data = await queue.get()
             try:
                 await websocket.send_json(data)
             except WebSocketDisconnect as e:
@@ -90,3 +84,5 @@ async def writer(websocket, x_real_ip):
                     f"websocket connection(plugin) disconnected client_ip: {x_real_ip}"
                 )
                 raise e
+    finally:
+        redis_subscriber.unsubscribe(channel, queue)
@@ -1,17 +1,16 @@
-import ast
 import asyncio
 import logging
 import logging.config
 import math
 import os
 from datetime import timedelta
-import aioredis
 from sqlalchemy.orm.attributes import flag_modified
 from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect, status
 from redis import Redis
 
 
 # ati code imports
+from utils.redis_subscriber import get_redis_subscriber
 import core.handler_configuration as hc
 from core.constants import MessageType, WebSocketCloseCode
 from models.db_session import DBSession
@@ -20,7 +19,8 @@ import models.request_models as rqm
 import app.routers.dependencies as dpd
 import utils.log_utils as lu
 import utils.util as utils_util
-from utils.rq_utils import Queues, enqueue
+from utils.rq_utils import Queues
+from utils.status_ingest import push_status_msg
 import core.common as ccm
 
 
@@ -228,8 +228,7 @@ async def reader(websocket, sherpa):
                 trip_status_msg.stoppages.extra_info = rqm.StoppageInfo.from_dict(
                     msg["stoppages"]["extra_info"]
                 )
-                args = [handler_obj, trip_status_msg]
-                enqueue(sherpa_trip_q, handle, *args, **kwargs)
+                push_status_msg(sherpa_trip_q, handler_obj, trip_status_msg, **kwargs)
             except Exception as e:
                 logging.error(f"Unable to enqueue trip status message, Exception: {e}")
 
@@ -250,8 +249,7 @@ async def reader(websocket, sherpa):
 
             try:
                 status_msg = rqm.SherpaStatusMsg.from_dict(msg)
-                args = [handler_obj, status_msg]
-                enqueue(sherpa_update_q, handle, *args, **kwargs)
+                push_status_msg(sherpa_update_q, handler_obj, status_msg, **kwargs)
             except Exception as e:
                 logging.getLogger().info(
                     f"Unable to enqueue status msg of type {msg_type} for {sherpa}, exception: {e}"
@@ -259,20 +257,15 @@ async def reader(websocket, sherpa):
         else:
             logging.error(f"Unsupported message type {msg_type}")
 
-        await asyncio.sleep(0.01)
-
 
 async def writer(websocket, sherpa):
-    redis = aioredis.Redis.from_url(
-        os.getenv("FM_REDIS_URI"), max_connections=10, decode_responses=True
-    )
-    psub = redis.pubsub()
-    await psub.subscribe(f"channel:{sherpa}")
-
-    while True:
-        message = await psub.get_message(ignore_subscribe_messages=True, timeout=0.5)
-        if message:
-            data = ast.literal_eval(message["data"])
+    channel = f"channel:{sherpa}"
+    redis_subscriber = get_redis_subscriber()
+    # requests to the sherpa are never dropped silently, see utils/redis_subscriber.py
+    queue = await redis_subscriber.subscribe(channel, lossless=True)
+    try:
+        while True:
+            data = await queue.get()
 
             # close WebSocket message
             if data.get("close_ws", False):
@@ -283,8 +276,8 @@ async def writer(websocket, sherpa):
             except WebSocketDisconnect as e:
                 logger.error(f"websocket connection with {sherpa} disconnected")
                 raise e
-
-        await asyncio.sleep(0.01)
+    finally:
+        redis_subscriber.unsubscribe(channel, queue)
 
 
 def handle(handler, msg, **kwargs):
@@ -1,6 +1,7 @@
 import logging
 from typing import Union
 from fastapi import APIRouter, Depends
+from fastapi.concurrency import run_in_threadpool
 from fastapi.encoders import jsonable_encoder
 from fastapi.responses import StreamingResponse
 from sqlalchemy.orm.attributes import flag_modified
@@ -198,32 +199,27 @@ async def trip_status_with_type(
     else:
         dpd.raise_error("Query sent for an invalid trip type")
 
-    with DBSession(engine=ccm.engine) as dbsession:
-        if trip_status_req.from_dt and trip_status_req.to_dt:
-            trip_status_req.from_dt = str_to_dt(trip_status_req.from_dt)
-            trip_status_req.to_dt = str_to_dt(trip_status_req.to_dt)
-
-            all_trips = dbsession.get_trips_with_timestamp_and_status(
-                trip_status_req.from_dt, trip_status_req.to_dt, valid_status
-            )
-
-        else:
-            if not trip_status_req.trip_ids:
-                return response
-
-            all_trips = dbsession.get_trips_with_ids_and_status(
-                trip_status_req.trip_ids, valid_status
-            )
-            # dpd.raise_error("no trip id given or available in the given timeframe")
-
-        count = 0
-        for trip in all_trips:
-            response.update({trip.id: tu.get_trip_status(trip)})
+    if trip_status_req.from_dt and trip_status_req.to_dt:
+        trip_status_req.from_dt = str_to_dt(trip_status_req.from_dt)
+        trip_status_req.to_dt = str_to_dt(trip_status_req.to_dt)
+    elif not trip_status_req.trip_ids:
+        return response
+        # dpd.raise_error("no trip id given or available in the given timeframe")
+
+    def get_trips_status():
+        with DBSession(engine=ccm.engine) as dbsession:
+            if trip_status_req.from_dt and trip_status_req.to_dt:
+                all_trips = dbsession.get_trips_with_timestamp_and_status(
+                    trip_status_req.from_dt, trip_status_req.to_dt, valid_status
+                )
+            else:
+                all_trips = dbsession.get_trips_with_ids_and_status(
+                    trip_status_req.trip_ids, valid_status
+                )
+            return tu.get_trips_status(dbsession, all_trips)
 
-            # introducing sleep to allow other endpoints to work simultaneously
-            count = count + 1
-            if count % 50 == 0:
-                await asyncio.sleep(100e-3)
+    # queries, serialization run in the threadpool, other endpoints are not held up
+    response = await run_in_threadpool(get_trips_status)
 
     return response
 
@@ -301,28 +297,24 @@ async def trip_status(
     if not user_name:
         dpd.raise_error("Unknown requester", 401)
 
-    with DBSession(engine=ccm.engine) as dbsession:
-        all_trips = None
-        if trip_status_req.from_dt and trip_status_req.to_dt:
-            trip_status_req.from_dt = str_to_dt(trip_status_req.from_dt)
-            trip_status_req.to_dt = str_to_dt(trip_status_req.to_dt)
-            all_trips = dbsession.get_trips_with_timestamp(
-                trip_status_req.from_dt, trip_status_req.to_dt
-            )
-
-        else:
-            if not trip_status_req.trip_ids:
-                return response
-            all_trips = dbsession.get_trips_with_ids(trip_status_req.trip_ids)
-
-        count = 0
-        for trip in all_trips:
-            response.update({trip.id: tu.get_trip_status(trip)})
-            count = count + 1
+    if trip_status_req.from_dt and trip_status_req.to_dt:
+        trip_status_req.from_dt = str_to_dt(trip_status_req.from_dt)
+        trip_status_req.to_dt = str_to_dt(trip_status_req.to_dt)
+    elif not trip_status_req.trip_ids:
+        return response
+
+    def get_trips_status():
+        with DBSession(engine=ccm.engine) as dbsession:
+            if trip_status_req.from_dt and trip_status_req.to_dt:
+                all_trips = dbsession.get_trips_with_timestamp(
+                    trip_status_req.from_dt, trip_status_req.to_dt
+                )
+            else:
+                all_trips = dbsession.get_trips_with_ids(trip_status_req.trip_ids)
+            return tu.get_trips_status(dbsession, all_trips)
 
-            # introducing sleep to allow other endpoints to work simultaneously
-            if count % 50 == 0:
-                await asyncio.sleep(100e-3)
+    # queries, serialization run in the threadpool, other endpoints are not held up
+    response = await run_in_threadpool(get_trips_status)
 
     return response
 
@@ -338,8 +330,9 @@ async def ongoing_trip_status(user_name=Depends(dpd.get_user_from_header)):
     response = {}
     with DBSession(engine=ccm.engine) as dbsession:
         all_ongoing_trips = dbsession.get_all_ongoing_trips()
-        for ongoing_trip in all_ongoing_trips:
-            response.update({ongoing_trip.trip_id: tu.get_trip_status(ongoing_trip.trip)})
+        response = tu.get_trips_status(
+            dbsession, [ongoing_trip.trip for ongoing_trip in all_ongoing_trips]
+        )
 
     return response
 
@@ -1,13 +1,11 @@
-import ast
 import asyncio
 import logging
 import logging.config
-import os
-import aioredis
 from fastapi import APIRouter, Depends, WebSocket, status, WebSocketDisconnect
 
 
 # ati code imports
+from app.updates_hub import UpdatesClient, get_updates_hub
 import app.routers.dependencies as dpd
 import utils.log_utils as lu
 
@@ -43,10 +41,18 @@ async def update_ws(
         f"websocket connection(generic updates) established successfully with client {x_real_ip}"
     )
 
+    # optional filters, comma separated, can be changed with a subscribe msg
+    # deltas=true - fleet_status, ongoing_trips_status are sent as keyframes and deltas
+    client = UpdatesClient(
+        get_query_list(websocket, "fleet_names"),
+        get_query_list(websocket, "msg_types"),
+        websocket.query_params.get("deltas", "false").lower() == "true",
+    )
+
     rw = [
-        asyncio.create_task(reader(websocket, x_real_ip)),
+        asyncio.create_task(reader(websocket, x_real_ip, client)),
         asyncio.create_task(
-            writer(websocket, x_real_ip),
+            writer(websocket, x_real_ip, client),
         ),
         asyncio.create_task(
             dpd.check_token_expiry(token, x_real_ip),
@@ -63,31 +69,40 @@ async def update_ws(
     )
 
 
-async def reader(websocket, x_real_ip):
+def get_query_list(websocket, name):
+    value = websocket.query_params.get(name)
+    if not value:
+        return None
+    return [item for item in value.split(",") if item]
+
+
+async def reader(websocket, x_real_ip, client: UpdatesClient):
     while True:
         try:
-            _ = await websocket.receive_json()
+            msg = await websocket.receive_json()
         except WebSocketDisconnect as e:
             logger.info(
-                f"websocket connection(generic updates) established successfully with client {x_real_ip}"
+                f"websocket connection(generic updates) disconnected with client {x_real_ip}"
             )
             raise e
 
+        # {"type": "subscribe", "fleet_names": [...], "msg_types": [...]}
+        if isinstance(msg, dict) and msg.get("type") == "subscribe":
+            client.set_filters(msg.get("fleet_names"), msg.get("msg_types"))
 
-async def writer(websocket, x_real_ip):
-    redis = aioredis.Redis.from_url(
-        os.getenv("FM_REDIS_URI"), max_connections=10, decode_responses=True
-    )
-    psub = redis.pubsub()
-    await psub.subscribe("channel:status_updates")
-    while True:
-        message = await psub.get_message(ignore_subscribe_messages=True, timeout=5)
-        if message:
-            data = ast.literal_eval(message["data"])
-            try:
-                await websocket.send_json(data)
-            except WebSocketDisconnect as e:
-                logger.info(
-                    f"websocket connection(generic updates) disconnected with client {x_real_ip} "
-                )
-                raise e
+
+async def writer(websocket, x_real_ip, client: UpdatesClient):
+    updates_hub = get_updates_hub()
+    updates_hub.add_client(client)
+    try:
+        while True:
+            for encoded_msg in await client.get():
+                try:
+                    await websocket.send_text(encoded_msg)
+                except WebSocketDisconnect as e:
+                    logger.info(
+                        f"websocket connection(generic updates) disconnected with client {x_real_ip} "
+                    )
+                    raise e
+    finally:
+        updates_hub.remove_client(client)
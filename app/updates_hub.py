@@ -0,0 +1,159 @@
+import asyncio
+import logging
+from collections import OrderedDict
+
+# ati code imports
+import utils.comms as utils_comms
+from utils.redis_subscriber import get_redis_subscriber
+from utils.fleet_state_diff import SnapshotTracker, DELTA_SUFFIX, without_seq
+
+
+# Broadcast hub of the /ws/api/v1/updates websocket. A single task per API process reads
+# channel:status_updates, encodes every msg once and hands the encoded msg to the clients
+# which want it(fleet_names, msg_types filters of the client).
+# Msgs on the channel are snapshots(fleet_status, ongoing_trips_status of a fleet, visas
+# held ...), a newer snapshot makes an unsent older one of the same type and fleet stale.
+# So a client keeps only the latest unsent snapshot per (msg type, fleet), a slow client
+# skips the stale snapshots instead of queuing them up.
+# fleet_status, ongoing_trips_status are published as keyframes and deltas(see
+# utils/fleet_state_diff.py), the hub rebuilds the full snapshots. Clients get the full
+# snapshots(without seq) unless they ask for deltas, clients getting deltas are sent the
+# full snapshot instead whenever they'd miss a delta(joined late, changed filters, a
+# pending delta would have been replaced).
+
+STATUS_UPDATES_CHANNEL = "channel:status_updates"
+
+# max unsent snapshots per client, the oldest is dropped beyond this
+MAX_PENDING_SNAPSHOTS = 200
+
+logger = logging.getLogger("uvicorn")
+
+
+class UpdatesClient:
+    def __init__(self, fleet_names=None, msg_types=None, deltas=False):
+        self.pending = OrderedDict()
+        self.has_pending = asyncio.Event()
+        self.num_dropped = 0
+        self.deltas = deltas
+        # (msg type, fleet) the client has the full snapshot of, deltas can be sent
+        self.synced = set()
+        self.set_filters(fleet_names, msg_types)
+
+    def set_filters(self, fleet_names=None, msg_types=None):
+        # None - no filter, msgs which aren't specific to a fleet are sent to all
+        self.fleet_names = set(fleet_names) if fleet_names else None
+        self.msg_types = set(msg_types) if msg_types else None
+        # deltas of keys filtered out aren't sent, the client gets the full snapshot of
+        # such a key once it is wanted again
+        self.synced = {key for key in self.synced if self.wants(*key)}
+
+    def wants(self, msg_type, fleet_name):
+        if self.msg_types is not None and msg_type not in self.msg_types:
+            return False
+        if self.fleet_names is not None and fleet_name is not None:
+            return fleet_name in self.fleet_names
+        return True
+
+    def put(self, key, encoded_msg):
+        if key in self.pending:
+            # stale snapshot, replaced by the new one
+            del self.pending[key]
+            self.num_dropped += 1
+        elif len(self.pending) >= MAX_PENDING_SNAPSHOTS:
+            dropped_key, _ = self.pending.popitem(last=False)
+            self.synced.discard(dropped_key)
+            self.num_dropped += 1
+        self.pending[key] = encoded_msg
+        self.has_pending.set()
+
+    async def get(self):
+        # all the pending msgs, oldest first
+        await self.has_pending.wait()
+        self.has_pending.clear()
+        encoded_msgs = list(self.pending.values())
+        self.pending.clear()
+        return encoded_msgs
+
+
+class UpdatesHub:
+    def __init__(self):
+        self.clients = set()
+        self.snapshot_tracker = SnapshotTracker()
+        self.task = None
+
+    def add_client(self, client: UpdatesClient):
+        self.clients.add(client)
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+        # latest snapshots right away, instead of waiting for the next keyframe
+        for msg_type, fleet_name in self.snapshot_tracker.get_keys():
+            if client.wants(msg_type, fleet_name):
+                snapshot = self.snapshot_tracker.get_snapshot(msg_type, fleet_name)
+                self.put_snapshot(client, (msg_type, fleet_name), snapshot, {})
+
+    def remove_client(self, client: UpdatesClient):
+        self.clients.discard(client)
+
+    def put_snapshot(self, client, key, snapshot, encoded):
+        # encoded - encoded msgs of this broadcast, every msg is encoded once
+        if client.deltas:
+            if "snapshot" not in encoded:
+                encoded["snapshot"] = utils_comms.dumps_json(snapshot)
+            client.put(key, encoded["snapshot"])
+            client.synced.add(key)
+        else:
+            if "legacy" not in encoded:
+                encoded["legacy"] = utils_comms.dumps_json(without_seq(snapshot))
+            client.put(key, encoded["legacy"])
+
+    def broadcast(self, data):
+        msg_type = data.get("type", "")
+        fleet_name = data.get("fleet_name")
+        snapshot = self.snapshot_tracker.update(data)
+
+        is_delta = msg_type.endswith(DELTA_SUFFIX)
+        if is_delta:
+            msg_type = msg_type[: -len(DELTA_SUFFIX)]
+        key = (msg_type, fleet_name)
+
+        encoded = {}
+        for client in self.clients:
+            if not client.wants(msg_type, fleet_name):
+                continue
+
+            if client.deltas and is_delta:
+                if key in client.synced and key not in client.pending:
+                    if "delta" not in encoded:
+                        encoded["delta"] = utils_comms.dumps_json(data)
+                    client.put(key, encoded["delta"])
+                elif snapshot is not None:
+                    self.put_snapshot(client, key, snapshot, encoded)
+            elif snapshot is not None:
+                self.put_snapshot(client, key, snapshot, encoded)
+
+    async def run(self):
+        redis_subscriber = get_redis_subscriber()
+        queue = await redis_subscriber.subscribe(STATUS_UPDATES_CHANNEL)
+        try:
+            while True:
+                data = await queue.get()
+                try:
+                    self.broadcast(data)
+                except Exception as e:
+                    logger.error(f"unable to broadcast {data.get('type')} msg, {e}")
+        finally:
+            redis_subscriber.unsubscribe(STATUS_UPDATES_CHANNEL, queue)
+
+
+# event loop: UpdatesHub
+_hubs = {}
+
+
+def get_updates_hub() -> UpdatesHub:
+    loop = asyncio.get_running_loop()
+    hub = _hubs.get(loop)
+    if hub is None:
+        hub = UpdatesHub()
+        _hubs[loop] = hub
+    return hub
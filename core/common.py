@@ -1,32 +1,75 @@
 import os
-import logging
-import time
 
 # ati code imports
-from core.db import get_engine
+from core.db import get_pooled_engine
 
 
-def get_db_pool_config():
-    ## Have made pool limits a factor for PSQL_MAX_CONNECTIONS
-    pool_config = {
+# pool size, max overflow per process role(core.db.set_process_role), can be set with
+# FM_DB_POOL_SIZE_{ROLE}, FM_DB_MAX_OVERFLOW_{ROLE} env variables
+# api - uvicorn, many requests at a time
+# rq_worker - rq workers, a job at a time
+# periodic - main.py processes(periodic updates, assigner ..)
+# dynamic_pooling - pools are resized by the pool governor(core/db.py), pid_based - sized
+# by the number of pids in the container, else overflow is raised only under pressure
+DB_POOL_SIZES = {
+    "api": {
         "pool_size": 30,
         "max_overflow": 10,
+        "dynamic_pooling": True,
+        "pid_based": True,
+    },
+    "rq_worker": {
+        "pool_size": 2,
+        "max_overflow": 3,
+        "dynamic_pooling": True,
+        "pid_based": False,
+    },
+    "periodic": {
+        "pool_size": 2,
+        "max_overflow": 3,
+        "dynamic_pooling": False,
+        "pid_based": False,
+    },
+    "default": {
+        "pool_size": 5,
+        "max_overflow": 5,
+        "dynamic_pooling": False,
+        "pid_based": False,
+    },
+}
+
+
+def get_db_pool_config(role=None):
+    ## Have made pool limits a factor for PSQL_MAX_CONNECTIONS
+    role = role if role in DB_POOL_SIZES else "default"
+    pool_sizes = DB_POOL_SIZES[role]
+    pool_config = {
+        "pool_size": int(
+            os.getenv(f"FM_DB_POOL_SIZE_{role.upper()}", pool_sizes["pool_size"])
+        ),
+        "max_overflow": int(
+            os.getenv(f"FM_DB_MAX_OVERFLOW_{role.upper()}", pool_sizes["max_overflow"])
+        ),
         "pool_timeout": 10,
         "pool_recycle": 30,
         "pool_limit": int(int(os.getenv("PSQL_MAX_CONNECTIONS")) / 5),
         "overflow_limit": int(int(os.getenv("PSQL_MAX_CONNECTIONS")) / 10),
-        "dynamic_pooling": True,
-        "pid_based": True,
+        "dynamic_pooling": pool_sizes["dynamic_pooling"],
+        "pid_based": pool_sizes["pid_based"],
         "pid_pool_factor": 0.25,
         "pid_overflow_factor": 0.1,
     }
     return pool_config
 
 
-t1 = time.time()
-engine = get_engine(
-    os.path.join(os.getenv("FM_DATABASE_URI"), os.getenv("PGDATABASE")),
-    pool=True,
-    pool_config=get_db_pool_config(),
-)
-logging.getLogger("fm_debug").info(f"Engine import time: {(time.time()-t1)*1000} ms")
+def get_fm_engine():
+    # pooled engine of the fm database for this process, built on first use
+    database_uri = os.path.join(os.getenv("FM_DATABASE_URI"), os.getenv("PGDATABASE"))
+    return get_pooled_engine(database_uri, get_db_pool_config)
+
+
+def __getattr__(name):
+    # core.common.engine - engine of this process, not of the process which imported it
+    if name == "engine":
+        return get_fm_engine()
+    raise AttributeError(f"module {__name__} has no attribute {name}")
@@ -42,6 +42,53 @@ OptimalDispatchInfluencers = [
 
 UpdateMsgs = [MessageType.SHERPA_STATUS, MessageType.TRIP_STATUS]
 
+
+# redis lists served by the router module (optimal_dispatch/router.py), jobs are
+# pushed with RPUSH and popped with BLPOP. Results are pushed back on per job lists.
+# Route jobs go to the queue of the router worker serving the fleet - {queue}:{shard},
+# map updates to MAP_UPDATE, which restarts the worker serving the fleet
+class RouterJobQueues:
+    MAP_UPDATE = "control_router_map_updates"
+    ROUTE_LENGTH = "control_router_rl_jobs"
+    ROUTE_LENGTH_MATRIX = "control_router_rl_matrix_jobs"
+    ROUTE_LENGTH_PAIRS = "control_router_rl_pairs_jobs"
+    ROUTE_WPS = "control_router_wps_jobs"
+    DENSE_PATH = "control_router_dp_rl_jobs"
+
+
+# redis keys of the router worker pool
+class RouterPoolKeys:
+    FLEET_SHARDS = "router_fleet_shards"
+    POOL_HEALTH = "router_pool_health"
+    WORKER = "router_worker"
+
+
+# redis keys of the periodic updates process, see scripts/periodic_updates.py
+class PeriodicUpdatesKeys:
+    # list, pushed by handlers, periodic_updates blocks on it till the next update is due
+    DIRTY_FLEETS = "periodic_updates_dirty_fleets_list"
+    STATS = "periodic_updates_stats"
+
+
+# redis keys of the sherpa_status, trip_status fast path, see utils/status_ingest.py
+class StatusIngestKeys:
+    STATS = "status_ingest_stats"
+
+
+# redis keys of the db pool governors, see core/db.py
+class DBPoolKeys:
+    # f"{process role}:{pid}": pool metrics of the process
+    STATS = "db_pool_stats"
+
+
+# redis keys of the handler db stats, see utils/handler_db_stats.py
+class HandlerDBStatsKeys:
+    # msg types with db stats
+    MSG_TYPES = "handler_db_stats_msg_types"
+    # msg type: max db time of a msg(ms)
+    MAX_DB_TIME = "handler_db_stats_max_db_time"
+
+
 MAX_NUM_NOTIFICATIONS = 20
 MAX_NUM_POP_UP_NOTIFICATIONS = 5
 
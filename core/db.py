@@ -1,33 +1,244 @@
+import os
+import json
+import logging
+import threading
+import time
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy import create_engine
-from sqlalchemy.pool import NullPool
+from sqlalchemy import exc as sqla_exc
+from sqlalchemy.pool import NullPool, QueuePool
 import psutil
-from sqlalchemy import event
 
+# ati code imports
+import core.constants as cc
+from utils.redis_pool import get_redis_conn
 
-def modify_pool_settings_dynamically(engine, pool_config):
-    if pool_config.get("pid_based", False):
 
-        @event.listens_for(engine, "before_cursor_execute")
-        def before_cursor_execute(
-            conn, cursor, statement, parameters, context, executemany
-        ):
+# Per process engine registry. A process has one pooled engine per database, built on
+# first use with the pool config of the process role(set_process_role). Engines inherited
+# through fork(main.py processes, rq work horses) are dropped in the child without
+# closing the connections of the parent, the child builds its own on first use.
 
-            num_pids = len(psutil.pids())
+DEFAULT_PROCESS_ROLE = "default"
 
-            dyn_pool_size = min(
-                int(pool_config["pid_pool_factor"] * num_pids),
-                pool_config["pool_limit"],
+_process_role = DEFAULT_PROCESS_ROLE
+
+# database uri: engine
+_engines = {}
+
+# PoolGovernor of the process, started with the first pooled engine
+_governor = None
+
+
+def _reset_engines():
+    global _governor
+    for engine in _engines.values():
+        engine.dispose(close=False)
+    _engines.clear()
+    # the governor thread isn't running in the child
+    _governor = None
+
+
+os.register_at_fork(after_in_child=_reset_engines)
+
+
+def set_process_role(role):
+    global _process_role
+    _process_role = role
+
+
+def get_process_role():
+    return _process_role
+
+
+class MeteredQueuePool(QueuePool):
+    # QueuePool which records the time spent getting a connection, can be resized.
+    # The underlying QueuePool keeps the size it was built with and an unlimited
+    # overflow, the governed limit(pool_size + max_overflow) is enforced here with a
+    # counter of checked out connections. At most min(pool_size, size the pool was built
+    # with) connections are kept idle, the others are closed when they are returned.
+    def __init__(self, *args, max_overflow=10, **kwargs):
+        super().__init__(*args, max_overflow=-1, **kwargs)
+        self.pool_size = self._pool.maxsize
+        self.max_overflow = max(0, max_overflow)
+        self.num_checked_out = 0
+        self.limit_cond = threading.Condition()
+        self.metrics_lock = threading.Lock()
+        self.reset_metrics()
+
+    def reset_metrics(self):
+        self.num_checkouts = 0
+        self.num_timeouts = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def get_limit(self):
+        return self.pool_size + self.max_overflow
+
+    def acquire_slot(self):
+        with self.limit_cond:
+            acquired = self.limit_cond.wait_for(
+                lambda: self.num_checked_out < self.get_limit(), timeout=self._timeout
             )
-            dyn_overflow = min(
+            if not acquired:
+                raise sqla_exc.TimeoutError(
+                    f"QueuePool limit of size {self.pool_size} overflow "
+                    f"{self.max_overflow} reached, connection timed out, timeout "
+                    f"{self._timeout:.2f}",
+                    code="3o7r",
+                )
+            self.num_checked_out += 1
+
+    def release_slot(self):
+        with self.limit_cond:
+            self.num_checked_out -= 1
+            self.limit_cond.notify()
+
+    def _do_get(self):
+        t1 = time.perf_counter()
+        timed_out = False
+        try:
+            self.acquire_slot()
+            try:
+                return super()._do_get()
+            except Exception:
+                self.release_slot()
+                raise
+        except sqla_exc.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            wait_time = time.perf_counter() - t1
+            with self.metrics_lock:
+                self.num_checkouts += 1
+                self.num_timeouts += int(timed_out)
+                self.wait_time += wait_time
+                self.max_wait_time = max(self.max_wait_time, wait_time)
+
+    def _do_return_conn(self, conn):
+        try:
+            if self._pool.qsize() >= self.pool_size:
+                # pool was shrunk, don't keep the connection idle
+                try:
+                    conn.close()
+                finally:
+                    self._dec_overflow()
+            else:
+                super()._do_return_conn(conn)
+        finally:
+            self.release_slot()
+
+    def recreate(self):
+        # dispose() builds a new pool, keep the governed size
+        pool = super().recreate()
+        pool.resize(self.pool_size, self.max_overflow)
+        return pool
+
+    def pop_metrics(self):
+        with self.metrics_lock:
+            metrics = {
+                "num_checkouts": self.num_checkouts,
+                "num_timeouts": self.num_timeouts,
+                "wait_ms_avg": (
+                    round(self.wait_time * 1000 / self.num_checkouts, 3)
+                    if self.num_checkouts
+                    else 0
+                ),
+                "wait_ms_max": round(self.max_wait_time * 1000, 3),
+            }
+            self.reset_metrics()
+        return metrics
+
+    def get_status(self):
+        checked_out = self.num_checked_out
+        return {
+            "pool_size": self.pool_size,
+            "max_overflow": self.max_overflow,
+            "checked_out": checked_out,
+            "checked_in": self.checkedin(),
+            "overflow": max(0, checked_out - self.pool_size),
+        }
+
+    def resize(self, pool_size, max_overflow):
+        # checkouts over the new limit wait in acquire_slot, extra idle connections are
+        # closed as they are returned
+        with self.limit_cond:
+            self.pool_size = pool_size
+            self.max_overflow = max(0, max_overflow)
+            self.limit_cond.notify_all()
+
+
+# Pools are resized by a thread per process every GOVERNOR_INTERVAL secs instead of on
+# every statement. Pool size, overflow scale with the number of pids in the container
+# (pid_pool_factor, pid_overflow_factor), capped at pool_limit, overflow_limit. A pool
+# under pressure(a checkout timed out/waited over PRESSURE_WAIT_MS) gets overflow_limit.
+# Pool metrics of every process are saved to redis, cc.DBPoolKeys.STATS.
+GOVERNOR_INTERVAL = 5
+PRESSURE_WAIT_MS = 100
+
+
+class PoolGovernor:
+    def __init__(self, interval=GOVERNOR_INTERVAL):
+        self.interval = interval
+        # database uri: (engine, pool_config)
+        self.engines = {}
+        self.thread = None
+
+    def add_engine(self, database_uri, engine, pool_config):
+        self.engines[database_uri] = (engine, pool_config)
+        if self.thread is None:
+            self.thread = threading.Thread(
+                target=self.run, name="db_pool_governor", daemon=True
+            )
+            self.thread.start()
+
+    def get_target_size(self, pool_config, num_pids, metrics):
+        pool_size = pool_config["pool_size"]
+        max_overflow = pool_config["max_overflow"]
+        if pool_config.get("pid_based", False):
+            pool_size = min(
+                int(pool_config["pid_pool_factor"] * num_pids), pool_config["pool_limit"]
+            )
+            max_overflow = min(
                 int(pool_config["pid_overflow_factor"] * num_pids),
                 pool_config["overflow_limit"],
             )
 
-            engine.pool.size = dyn_pool_size
-            engine.pool._max_overflow = dyn_overflow
+        if metrics["num_timeouts"] or metrics["wait_ms_max"] > PRESSURE_WAIT_MS:
+            max_overflow = max(max_overflow, pool_config["overflow_limit"])
 
-    return
+        return max(1, pool_size), max_overflow
+
+    def govern(self):
+        num_pids = len(psutil.pids())
+        all_metrics = {}
+        for database_uri, (engine, pool_config) in list(self.engines.items()):
+            pool = engine.pool
+            metrics = pool.pop_metrics()
+            if pool_config.get("dynamic_pooling", False):
+                pool.resize(*self.get_target_size(pool_config, num_pids, metrics))
+
+            metrics.update(pool.get_status())
+            all_metrics[database_uri.rsplit("/", 1)[-1]] = metrics
+
+        stats = {
+            "role": _process_role,
+            "pid": os.getpid(),
+            "num_pids": num_pids,
+            "pools": all_metrics,
+            "updated_at": time.time(),
+        }
+        get_redis_conn().hset(
+            cc.DBPoolKeys.STATS, f"{_process_role}:{os.getpid()}", json.dumps(stats)
+        )
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.govern()
+            except Exception as e:
+                logging.getLogger().warning(f"db pool governor failed, {e}")
 
 
 def get_engine(database_uri, pool=False, pool_config={}):
@@ -35,6 +246,7 @@ def get_engine(database_uri, pool=False, pool_config={}):
     kwargs = {"poolclass": NullPool}
     if pool:
         kwargs = {
+            "poolclass": MeteredQueuePool,
             "pool_pre_ping": True,
             "pool_size": pool_config["pool_size"],
             "max_overflow": pool_config["max_overflow"],
@@ -42,10 +254,20 @@ def get_engine(database_uri, pool=False, pool_config={}):
             "pool_recycle": pool_config["pool_recycle"],
         }
     engine = create_engine(database_uri, **kwargs)
+    return engine
 
-    if pool and pool_config.get("dynamic_pooling", False):
-        modify_pool_settings_dynamically(engine, pool_config)
 
+def get_pooled_engine(database_uri, get_pool_config):
+    # get_pool_config(role) is called only when the engine is built
+    global _governor
+    engine = _engines.get(database_uri)
+    if engine is None:
+        pool_config = get_pool_config(_process_role)
+        engine = get_engine(database_uri, pool=True, pool_config=pool_config)
+        _engines[database_uri] = engine
+        if _governor is None:
+            _governor = PoolGovernor()
+        _governor.add_engine(database_uri, engine, pool_config)
     return engine
 
 
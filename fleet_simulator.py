@@ -1,6 +1,5 @@
 import time
 import requests
-import ast
 import redis
 import json
 import os
@@ -10,9 +9,12 @@ from typing import List
 import threading
 
 # ati code
+import utils.comms as utils_comms
 import core.handler_configuration as hc
 from utils.rq_utils import Queues, enqueue
-from utils.util import generate_random_job_id
+from utils.status_ingest import push_status_msg
+from utils.util import generate_random_job_id, wait_for_job_result, get_router_job_queue
+from core.constants import RouterJobQueues
 from models.request_models import (
     SherpaStatusMsg,
     TripStatusMsg,
@@ -169,7 +171,7 @@ class MuleWS:
         while True:
             message = psub.get_message(ignore_subscribe_messages=True, timeout=0.5)
             if message:
-                req = ast.literal_eval(message["data"].decode())
+                req = utils_comms.decode_msg(message["data"])
                 req_id = req.get("req_id")
                 if req_id:
                     # ws_ack_url = (
@@ -363,10 +365,9 @@ class FleetSimulator:
 
             if sherpa.status.pose or pose:
                 msg = SherpaStatusMsg.from_dict(msg)
-                args = [self.handler_obj, msg]
-                kwargs = {"ttl": 1}
-                kwargs.update({"job_timeout": TIMEOUT})
-                enqueue(sherpa_update_q, handle, *args, **kwargs)
+                push_status_msg(
+                    sherpa_update_q, self.handler_obj, msg, ttl=1, job_timeout=TIMEOUT
+                )
 
     def send_trip_status(self, sherpa_name):
 
@@ -394,16 +395,18 @@ class FleetSimulator:
 
             job_id = generate_random_job_id()
             control_router_get_route_job = [from_pose, to_pose, sherpa.fleet.name, job_id]
-            redis_conn.setex(
-                f"control_router_dp_rl_job_{job_id}",
-                int(redis_conn.get("default_job_timeout_ms").decode()),
+            redis_conn.rpush(
+                get_router_job_queue(
+                    redis_conn, RouterJobQueues.DENSE_PATH, sherpa.fleet.name
+                ),
                 json.dumps(control_router_get_route_job),
             )
-            while not redis_conn.get(f"result_dp_rl_job_{job_id}"):
-                time.sleep(0.005)
-
             x_vals, y_vals, t_vals, route_length = json.loads(
-                redis_conn.get(f"result_dp_rl_job_{job_id}")
+                wait_for_job_result(
+                    redis_conn,
+                    f"result_dp_rl_job_{job_id}",
+                    int(redis_conn.get("default_job_timeout_ms").decode()),
+                )
             )
             eta_at_start = route_length
 
@@ -524,10 +527,13 @@ class FleetSimulator:
                 final_trip_status_msg.stoppages.extra_info = StoppageInfo.from_dict(
                     trip_status_msg["stoppages"]["extra_info"]
                 )
-                args = [self.handler_obj, final_trip_status_msg]
-                kwargs = {"ttl": 1}
-                kwargs.update({"job_timeout": TIMEOUT})
-                enqueue(sherpa_trip_q, handle, *args, **kwargs)
+                push_status_msg(
+                    sherpa_trip_q,
+                    self.handler_obj,
+                    final_trip_status_msg,
+                    ttl=1,
+                    job_timeout=TIMEOUT,
+                )
                 time.sleep(1)
                 session.session.expire_all()
 
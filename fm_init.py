@@ -67,6 +67,15 @@ def populate_redis_with_basic_info(dbsession: DBSession):
         redis_conn.set("generic_handler_job_timeout_ms", generic_handler_job_timeout * 1000)
         redis_conn.set("token_expiry_time_sec", app_security_params["token_expiry_time"])
 
+        # route lengths cached by older builds as rl_{pose_1}_{pose_2}, not used anymore
+        for key in redis_conn.scan_iter("rl_\\[*"):
+            redis_conn.delete(key)
+
+        # jobs queued before the restart, queued_jobs was a single json blob in older builds
+        redis_conn.delete("queued_jobs")
+        for key in redis_conn.scan_iter("queued_jobs:*"):
+            redis_conn.delete(key)
+
 
 def check_if_run_host_service_is_setup(dbsession):
     if not os.path.exists("/app/static/run_on_host_fifo") or not os.path.exists(
@@ -1,6 +1,5 @@
 import logging
 import logging.config
-import redis
 import os
 import numpy as np
 from typing import List
@@ -65,44 +64,48 @@ def start_trip(
     start_pose = sherpa_status.pose
     fleet_name = ongoing_trip.trip.fleet_name
 
-    with redis.from_url(os.getenv("FM_REDIS_URI")) as redis_conn:
-        etas_at_start = []
-        route_lengths = []
-        start_station_name = None
-        for station in all_stations:
-            if station.status.disabled is True:
-                reason = f"{station.name} is disabled"
-                trip_failed_log = f"{ongoing_trip.sherpa_name} failed to do trip with trip_id: {ongoing_trip.trip.id} , reason: {reason}"
-                fail_trip(dbsession, ongoing_trip, sherpa, trip_failed_log)
-                return
-
-            end_pose = station.pose
-            end_station_name = station.name
-            route_length = utils_util.get_route_length(
-                start_pose, end_pose, fleet_name, redis_conn
-            )
+    for station in all_stations:
+        if station.status.disabled is True:
+            reason = f"{station.name} is disabled"
+            trip_failed_log = f"{ongoing_trip.sherpa_name} failed to do trip with trip_id: {ongoing_trip.trip.id} , reason: {reason}"
+            fail_trip(dbsession, ongoing_trip, sherpa, trip_failed_log)
+            return
+
+    # route lengths of all the legs of the trip in a single router job,
+    # leg i goes from leg_start_poses[i] to station_poses[i]
+    station_poses = [station.pose for station in all_stations]
+    leg_start_poses = [start_pose] + station_poses[:-1]
+    leg_route_lengths = utils_util.get_route_lengths_pairs(
+        leg_start_poses, station_poses, fleet_name
+    )
 
-            if route_length == np.inf:
-                start_station_info = (
-                    start_station_name if start_station_name is not None else start_pose
-                )
-                reason = f"no route from {start_station_info} to {end_station_name}"
-                trip_failed_log = f"{ongoing_trip.sherpa_name} failed to do trip with trip_id: {ongoing_trip.trip.id}, reason: {reason}"
-                fail_trip(dbsession, ongoing_trip, sherpa, trip_failed_log)
-                return
-
-            eta = (
-                0
-                if route_length == 0
-                else dbsession.get_expected_trip_time(start_station_name, end_station_name)
+    etas_at_start = []
+    route_lengths = []
+    start_station_name = None
+    for station, route_length in zip(all_stations, leg_route_lengths):
+        end_station_name = station.name
+        route_length = float(route_length)
+
+        if route_length == np.inf:
+            start_station_info = (
+                start_station_name if start_station_name is not None else start_pose
             )
-            if eta is None:
-                eta = route_length
+            reason = f"no route from {start_station_info} to {end_station_name}"
+            trip_failed_log = f"{ongoing_trip.sherpa_name} failed to do trip with trip_id: {ongoing_trip.trip.id}, reason: {reason}"
+            fail_trip(dbsession, ongoing_trip, sherpa, trip_failed_log)
+            return
+
+        eta = (
+            0
+            if route_length == 0
+            else dbsession.get_expected_trip_time(start_station_name, end_station_name)
+        )
+        if eta is None:
+            eta = route_length
 
-            route_lengths.append(route_length)
-            etas_at_start.append(eta)
-            start_pose = station.pose
-            start_station_name = station.name
+        route_lengths.append(route_length)
+        etas_at_start.append(eta)
+        start_station_name = station.name
 
     ongoing_trip.trip.route_lengths = route_lengths
     ongoing_trip.trip.etas_at_start = etas_at_start
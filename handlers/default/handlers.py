@@ -24,9 +24,10 @@ import utils.log_utils as lu
 import utils.comms as utils_comms
 import utils.util as utils_util
 import utils.visa_utils as utils_visa
+from utils.handler_db_stats import trace_msg
 import core.constants as cc
 import core.common as ccm
-from optimal_dispatch.dispatcher import OptimalDispatch
+from optimal_dispatch.scheduler import trigger_optimal_dispatch
 import handlers.default.handler_utils as hutils
 
 
@@ -38,6 +39,9 @@ class RequestContext:
     msg_type: str
     sherpa_name: str
     fleet_names: List[str]
+    dispatch_fleet_names: List[str]
+    # DBSession.get_sherpa_working_set of the sherpa, loaded for sherpa_status, trip_status
+    sherpa_working_set: tuple
 
 
 req_ctxt = RequestContext()
@@ -47,6 +51,8 @@ def init_request_context(req):
     req_ctxt.msg_type = req.type
     req_ctxt.source = req.source
     req_ctxt.fleet_names = []
+    req_ctxt.dispatch_fleet_names = []
+    req_ctxt.sherpa_working_set = None
     if isinstance(req, rqm.SherpaReq) or isinstance(req, rqm.SherpaMsg):
         req_ctxt.sherpa_name = req.source
         req_ctxt.source = req.source
@@ -55,12 +61,22 @@ def init_request_context(req):
 
 
 class Handlers:
+    # set while a batch of status msgs is applied in a single transaction
+    batching = False
+
+    def end_transaction(self):
+        if not self.batching:
+            self.dbsession.session.commit()
+
     def should_handle_msg(self, msg):
         sherpa_name = req_ctxt.sherpa_name
         if not sherpa_name:
             return True, None
 
-        sherpa: fm.Sherpa = self.dbsession.get_sherpa(sherpa_name)
+        if msg.type in cc.UpdateMsgs:
+            sherpa: fm.Sherpa = self.get_sherpa_working_set(sherpa_name)[0]
+        else:
+            sherpa: fm.Sherpa = self.dbsession.get_sherpa(sherpa_name)
         fleet: fm.Fleet = sherpa.fleet
 
         if fleet.name not in req_ctxt.fleet_names:
@@ -118,14 +134,20 @@ class Handlers:
         # have not seperated queries and update DB - Need to be done
         hutils.update_sherpa_oee(self.dbsession)
 
+    def get_sherpa_working_set(self, sherpa_name):
+        # loaded once per msg, should_handle_msg and the handler share it
+        working_set = req_ctxt.sherpa_working_set
+        if working_set is None or working_set[0] is None or working_set[0].name != sherpa_name:
+            working_set = self.dbsession.get_sherpa_working_set(sherpa_name)
+            req_ctxt.sherpa_working_set = working_set
+        return working_set
+
     def get_sherpa_trips(self, sherpa_name):
-        sherpa: fm.Sherpa = self.dbsession.get_sherpa(sherpa_name)
+        sherpa, ongoing_trip, pending_trip, _ = self.get_sherpa_working_set(sherpa_name)
 
         if sherpa is None:
             raise ValueError(f"{sherpa_name} not found in DB")
 
-        ongoing_trip: tm.OngoingTrip = self.dbsession.get_ongoing_trip(sherpa.name)
-        pending_trip: tm.PendingTrip = self.dbsession.get_pending_trip(sherpa.name)
         return sherpa, ongoing_trip, pending_trip
 
     def initialize_sherpa(self, sherpa: fm.Sherpa):
@@ -417,6 +439,8 @@ class Handlers:
 
     # maybe run optimal_dispatch
     def maybe_run_optimal_dispatch(self, msg):
+        # optimal dispatch is run by the optimal dispatch scheduler, handlers only mark
+        # the fleets dirty once the request has been committed
         try:
             run_opt_d = False
             if msg.type in cc.OptimalDispatchInfluencers:
@@ -425,31 +449,27 @@ class Handlers:
                     if not isinstance(msg, rqm.ResetPoseReq):
                         run_opt_d = False
             if run_opt_d:
-                with DBSession(engine=ccm.engine) as dbsession:
-                    self.dbsession = dbsession
-                    self.run_optimal_dispatch(req_ctxt.fleet_names)
+                self.run_optimal_dispatch(req_ctxt.fleet_names)
+            trigger_optimal_dispatch(req_ctxt.dispatch_fleet_names)
         except Exception as e:
-            logging.getLogger().error(f"couldn't run optimal dispatch, {e}")
+            logging.getLogger().error(f"couldn't trigger optimal dispatch, {e}")
             optimal_dispatch_fail = (
-                f"Unable to run optimal dispatch for fleet {req_ctxt.fleet_names}"
+                f"Unable to run optimal dispatch for fleet {req_ctxt.dispatch_fleet_names}"
             )
             with DBSession(engine=ccm.engine) as dbsession:
                 utils_util.maybe_add_notification(
                     dbsession,
-                    req_ctxt.fleet_names,
+                    req_ctxt.dispatch_fleet_names,
                     optimal_dispatch_fail,
                     mm.NotificationLevels.alert,
                     mm.NotificationModules.optimal_dispatch,
                 )
 
     def run_optimal_dispatch(self, fleet_names):
-        with FMMongo() as fm_mongo:
-            optimal_dispatch_config = fm_mongo.get_document_from_fm_config(
-                "optimal_dispatch"
-            )
-
-        optimal_dispatch = OptimalDispatch(optimal_dispatch_config)
-        optimal_dispatch.run(self.dbsession, fleet_names)
+        # triggers are coalesced per request, sent in maybe_run_optimal_dispatch
+        for fleet_name in fleet_names:
+            if fleet_name not in req_ctxt.dispatch_fleet_names:
+                req_ctxt.dispatch_fleet_names.append(fleet_name)
 
     def do_pre_actions(self, ongoing_trip: tm.OngoingTrip):
         curr_station = ongoing_trip.curr_station()
@@ -1325,7 +1345,7 @@ class Handlers:
             )
 
         # end transaction
-        self.dbsession.session.commit()
+        self.end_transaction()
 
         # update db
         status.pose = req.current_pose
@@ -1382,10 +1402,14 @@ class Handlers:
     def handle_trip_status(self, req: rqm.TripStatusMsg):
 
         # query db
-        sherpa: fm.Sherpa = self.dbsession.get_sherpa(req.source)
-        ongoing_trip: tm.OngoingTrip = self.dbsession.get_ongoing_trip_with_trip_id(
-            req.trip_id
-        )
+        sherpa, ongoing_trip, _, trip_analytics = self.get_sherpa_working_set(req.source)
+        if ongoing_trip is None or ongoing_trip.trip_id != req.trip_id:
+            ongoing_trip: tm.OngoingTrip = self.dbsession.get_ongoing_trip_with_trip_id(
+                req.trip_id
+            )
+            trip_analytics = None
+            if ongoing_trip:
+                trip_analytics = self.dbsession.get_trip_analytics(ongoing_trip.trip_leg_id)
 
         if not ongoing_trip:
             logging.getLogger("status_updates").info(
@@ -1393,8 +1417,6 @@ class Handlers:
             )
             return
 
-        trip_analytics = self.dbsession.get_trip_analytics(ongoing_trip.trip_leg_id)
-
         if req.trip_leg_id != ongoing_trip.trip_leg_id:
             logging.getLogger("status_updates").info(
                 f"Trip status sent by {sherpa.name} is invalid sherpa_trip_leg_id: {req.trip_leg_id} FM_trip_leg_id: {ongoing_trip.trip_leg_id}"
@@ -1408,7 +1430,7 @@ class Handlers:
             return
 
         # end transaction
-        self.dbsession.session.commit()
+        self.end_transaction()
 
         # update db
         ongoing_trip.trip.update_etas(float(req.trip_info.eta), ongoing_trip.next_idx_aug)
@@ -2259,35 +2281,83 @@ class Handlers:
         self.dbsession = None
         init_request_context(msg)
 
-        with DBSession(engine=ccm.engine) as dbsession:
-            self.dbsession = dbsession
+        # db statements, time of the msg recorded per msg type
+        with trace_msg(msg.type):
+            with DBSession(engine=ccm.engine) as dbsession:
+                self.dbsession = dbsession
 
-            if msg.type == cc.MessageType.FM_HEALTH_CHECK:
-                self.run_health_check()
-                return
+                if msg.type == cc.MessageType.FM_HEALTH_CHECK:
+                    self.run_health_check()
+                    return
 
-            if msg.type == cc.MessageType.MISC_PROCESS:
-                self.run_misc_processes()
-                return
+                if msg.type == cc.MessageType.MISC_PROCESS:
+                    self.run_misc_processes()
+                    return
 
-            # log, add msg to sherpa events
-            self.record_msg_received(msg, cc.UpdateMsgs)
-            handle_ok, reason = self.should_handle_msg(msg)
+                # log, add msg to sherpa events
+                self.record_msg_received(msg, cc.UpdateMsgs)
+                handle_ok, reason = self.should_handle_msg(msg)
 
-            if not handle_ok:
-                self.ignore_msg(msg, cc.UpdateMsgs, reason)
-                return
+                if not handle_ok:
+                    self.ignore_msg(msg, cc.UpdateMsgs, reason)
+                    return
 
-            # get handler
-            msg_handler = getattr(self, "handle_" + msg.type, None)
+                # get handler
+                msg_handler = getattr(self, "handle_" + msg.type, None)
 
-            if not msg_handler:
-                logging.getLogger().error(f"no handler defined for {msg.type}")
-                return
+                if not msg_handler:
+                    logging.getLogger().error(f"no handler defined for {msg.type}")
+                    return
+
+                response = msg_handler(msg)
 
-            response = msg_handler(msg)
+        # status updates of the fleets changed by the request are published early
+        if msg.type not in cc.UpdateMsgs:
+            utils_comms.mark_fleets_dirty(req_ctxt.fleet_names)
 
-        # run optimal dispatch if needs be - need not be coupled with handler
+        # trigger optimal dispatch if needs be - need not be coupled with handler
         self.maybe_run_optimal_dispatch(msg)
 
         return response
+
+    def handle_batch(self, msgs):
+        # sherpa_status, trip_status msgs of a sherpa(utils/status_ingest.py), applied in
+        # order in one transaction, a failing msg is rolled back to its savepoint only
+        dispatch_fleet_names = []
+        with DBSession(engine=ccm.engine) as dbsession:
+            self.dbsession = dbsession
+            self.batching = True
+            try:
+                for msg in msgs:
+                    init_request_context(msg)
+                    try:
+                        with trace_msg(msg.type), dbsession.session.begin_nested():
+                            self.handle_batch_msg(msg)
+                    except Exception as e:
+                        logging.getLogger("status_updates").error(
+                            f"unable to handle {msg.type} of {req_ctxt.sherpa_name}, {e}"
+                        )
+                    for fleet_name in req_ctxt.dispatch_fleet_names:
+                        if fleet_name not in dispatch_fleet_names:
+                            dispatch_fleet_names.append(fleet_name)
+            finally:
+                self.batching = False
+
+        req_ctxt.dispatch_fleet_names = dispatch_fleet_names
+        self.maybe_run_optimal_dispatch(msgs[-1])
+
+    def handle_batch_msg(self, msg):
+        self.record_msg_received(msg, cc.UpdateMsgs)
+        handle_ok, reason = self.should_handle_msg(msg)
+
+        if not handle_ok:
+            self.ignore_msg(msg, cc.UpdateMsgs, reason)
+            return
+
+        msg_handler = getattr(self, "handle_" + msg.type, None)
+
+        if not msg_handler:
+            logging.getLogger().error(f"no handler defined for {msg.type}")
+            return
+
+        msg_handler(msg)
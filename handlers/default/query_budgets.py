@@ -0,0 +1,74 @@
+import time
+
+# ati code imports
+import core.constants as cc
+import models.request_models as rqm
+from handlers.default.handlers import init_request_context
+from models.db_session import DBSession
+from utils.query_counter import QueryCounter
+
+
+# Statement budgets of the sherpa_status, trip_status handlers, checked by
+# tests/test_handler_query_budgets.py and scripts/bench_handler_queries.py. Msgs repeat
+# the current state of the sherpa(pose, mode, trip progress), count_queries rolls back
+# the changes.
+
+# statements per msg, no mode change, no new task assigned
+QUERY_BUDGETS = {cc.MessageType.SHERPA_STATUS: 6, cc.MessageType.TRIP_STATUS: 8}
+
+
+def get_sherpa_status_msg(sherpa):
+    return rqm.SherpaStatusMsg(
+        source=sherpa.name,
+        timestamp=time.time(),
+        sherpa_name=sherpa.name,
+        current_pose=sherpa.status.pose,
+        battery_status=sherpa.status.battery_status,
+        mode=sherpa.status.mode,
+    )
+
+
+def get_trip_status_msg(sherpa, ongoing_trip, trip_analytics):
+    trip_info = rqm.TripInfo(
+        current_pose=sherpa.status.pose,
+        destination_pose=sherpa.status.pose,
+        total_route_length=0.0,
+        remaining_route_length=0.0,
+        cte=0.0,
+        te=0.0,
+        eta_at_start=0.0,
+        eta=0.0,
+        progress=trip_analytics.progress if trip_analytics else 0.0,
+    )
+    stoppage_info = rqm.StoppageInfo(
+        velocity_speed_factor=1.0,
+        obstacle_speed_factor=1.0,
+        local_obstacle=[],
+        time_elapsed_stoppages=0.0,
+        time_elapsed_obstacle_stoppages=0.0,
+        time_elapsed_visa_stoppages=0.0,
+        time_elapsed_other_stoppages=0.0,
+    )
+    return rqm.TripStatusMsg(
+        source=sherpa.name,
+        timestamp=time.time(),
+        trip_id=ongoing_trip.trip_id,
+        trip_leg_id=ongoing_trip.trip_leg_id,
+        trip_info=trip_info,
+        stoppages=rqm.Stoppages(type="", extra_info=stoppage_info),
+    )
+
+
+def count_queries(handler, msg):
+    with DBSession() as dbsession:
+        handler.dbsession = dbsession
+        handler.batching = True
+        init_request_context(msg)
+        try:
+            with QueryCounter() as query_counter:
+                handler.handle_batch_msg(msg)
+                dbsession.session.flush()
+        finally:
+            handler.batching = False
+            dbsession.session.rollback()
+    return query_counter
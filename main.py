@@ -7,6 +7,7 @@ import time
 
 # ati code imports
 import utils.rq_utils as rqu
+from core.db import set_process_role
 from scripts.periodic_updates import send_periodic_updates
 from scripts.periodic_backup import backup_data
 from scripts.periodic_assigner import assign_next_task
@@ -16,6 +17,7 @@ from scripts.alerts import send_slack_alerts
 from scripts.conditional_trips import book_conditional_trips
 from scripts.fm_errors_check import periodic_error_check
 from optimal_dispatch.router import start_router_module
+from optimal_dispatch.scheduler import start_optimal_dispatch_scheduler
 from master_fm_comms.send_updates_to_mfm import send_mfm_updates
 from master_fm_comms.send_ws_updates_to_mfm import send_ws_msgs_to_mfm
 
@@ -31,17 +33,23 @@ func_handles = {
     "misc_processes": misc_processes,
     "book_conditional_trips": book_conditional_trips,
     "start_router_module": start_router_module,
+    "start_optimal_dispatch_scheduler": start_optimal_dispatch_scheduler,
     "periodic_error_check": periodic_error_check,
 }
 
 
+def run_process(proc_name):
+    set_process_role("periodic")
+    func_handles[proc_name]()
+
+
 class FMProcessesHandler:
     def __init__(self):
         self.all_processes = []
 
     def start_all_processes(self):
-        for proc_name, proc_handle in func_handles.items():
-            proc = Process(target=proc_handle, name=proc_name)
+        for proc_name in func_handles:
+            proc = Process(target=run_process, args=(proc_name,), name=proc_name)
             try:
                 proc.start()
                 logging.info(f"Started process: {proc.name}")
@@ -51,7 +59,7 @@ class FMProcessesHandler:
 
     def restart_process(self, proc):
         self.all_processes.remove(proc)
-        new_proc = Process(target=func_handles[proc.name], name=proc.name)
+        new_proc = Process(target=run_process, args=(proc.name,), name=proc.name)
         new_proc.start()
         self.all_processes.append(new_proc)
 
@@ -73,8 +81,13 @@ if __name__ == "__main__":
     redis_conn = redis.from_url(os.getenv("FM_REDIS_URI"))
     logging.info(f"all queues {rqu.Queues.get_queues()}")
 
-    for q in rqu.Queues.get_queues():
-        process = Process(target=rqu.start_worker, args=(q,))
+    rq_config = rqu.get_rq_config()
+    worker_queues = rqu.get_worker_queues(
+        rq_config.get("worker_mode", rqu.WORKER_MODE_SIMPLE),
+        rq_config.get("sherpa_workers", rqu.DEFAULT_NUM_SHERPA_WORKERS),
+    )
+    for q_names, worker_class in worker_queues:
+        process = Process(target=rqu.start_worker, args=(q_names, worker_class))
         process.start()
 
     fm_processes_handler = FMProcessesHandler()
@@ -1,27 +1,28 @@
 import websockets
-import ast
 import logging
 import ssl
 import asyncio
-import aioredis
-import os
 import datetime
 import json
 
 # ati code imports
+from utils.redis_subscriber import get_redis_subscriber
+from utils.redis_pool import get_async_redis_conn
+from utils.fleet_state_diff import SnapshotTracker, without_seq
 import master_fm_comms.mfm_utils as mu
 import utils.util as utils_util
 
 
 # @utils_util.async_report_error
 async def send_ongoing_trip_status(ws, mfm_context: mu.MFMContext):
-    async with aioredis.Redis.from_url(
-        os.getenv("FM_REDIS_URI"), max_connections=10, decode_responses=True
-    ) as redis_conn:
-        psub = redis_conn.pubsub()
-        await psub.subscribe("channel:status_updates")
-
-        all_fleet_names = await redis_conn.get("all_fleet_names")
+    channel = "channel:status_updates"
+    redis_subscriber = get_redis_subscriber()
+    queue = await redis_subscriber.subscribe(channel)
+    snapshot_tracker = SnapshotTracker()
+    try:
+        all_fleet_names = await get_async_redis_conn(decode_responses=True).get(
+            "all_fleet_names"
+        )
         all_fleet_names = json.loads(all_fleet_names)
 
         last_update_dt = {}
@@ -29,45 +30,46 @@ async def send_ongoing_trip_status(ws, mfm_context: mu.MFMContext):
             last_update_dt.update({fleet_name: datetime.datetime.now()})
 
         while True:
-            message = await psub.get_message(ignore_subscribe_messages=True, timeout=5)
-            if message:
-                data = ast.literal_eval(message["data"])
-
-                if data.get("type") != "ongoing_trips_status":
-                    continue
+            # status updates are deltas, rebuild the full snapshot
+            data = snapshot_tracker.update(await queue.get())
+            if data is None or data.get("type") != "ongoing_trips_status":
+                continue
 
-                elif not data.get("fleet_name"):
-                    continue
+            elif not data.get("fleet_name"):
+                continue
 
-                fleet_name = data.get("fleet_name")
-                temp = last_update_dt.get(fleet_name)
+            fleet_name = data.get("fleet_name")
+            temp = last_update_dt.get(fleet_name)
 
-                if temp is None:
-                    logging.getLogger("mfm_updates_ws").info(
-                        "New fleet has been added, reconnect again"
-                    )
-                    await ws.close()
-                    return
+            if temp is None:
+                logging.getLogger("mfm_updates_ws").info(
+                    "New fleet has been added, reconnect again"
+                )
+                await ws.close()
+                return
 
-                time_delta = datetime.datetime.now() - temp
+            time_delta = datetime.datetime.now() - temp
 
-                if time_delta.seconds > mfm_context.ws_update_freq:
-                    await ws.send(json.dumps(data))
-                    last_update_dt.update({fleet_name: datetime.datetime.now()})
-                    logging.getLogger("mfm_updates_ws").info(
-                        f"sent an ongoing_trip status msg for {fleet_name} to master fm"
-                    )
+            if time_delta.seconds > mfm_context.ws_update_freq:
+                await ws.send(json.dumps(without_seq(data)))
+                last_update_dt.update({fleet_name: datetime.datetime.now()})
+                logging.getLogger("mfm_updates_ws").info(
+                    f"sent an ongoing_trip status msg for {fleet_name} to master fm"
+                )
+    finally:
+        redis_subscriber.unsubscribe(channel, queue)
 
 
 # @utils_util.async_report_error
 async def send_fleet_status(ws, mfm_context: mu.MFMContext):
-    async with aioredis.Redis.from_url(
-        os.getenv("FM_REDIS_URI"), max_connections=10, decode_responses=True
-    ) as redis_conn:
-        psub = redis_conn.pubsub()
-        await psub.subscribe("channel:status_updates")
-
-        all_fleet_names = await redis_conn.get("all_fleet_names")
+    channel = "channel:status_updates"
+    redis_subscriber = get_redis_subscriber()
+    queue = await redis_subscriber.subscribe(channel)
+    snapshot_tracker = SnapshotTracker()
+    try:
+        all_fleet_names = await get_async_redis_conn(decode_responses=True).get(
+            "all_fleet_names"
+        )
         all_fleet_names = json.loads(all_fleet_names)
 
         last_update_dt = {}
@@ -75,37 +77,37 @@ async def send_fleet_status(ws, mfm_context: mu.MFMContext):
             last_update_dt.update({fleet_name: datetime.datetime.now()})
 
         while True:
-            message = await psub.get_message(ignore_subscribe_messages=True, timeout=5)
-            if message:
-                data = ast.literal_eval(message["data"])
-
-                if data.get("type") != "fleet_status":
-                    continue
+            # status updates are deltas, rebuild the full snapshot
+            data = snapshot_tracker.update(await queue.get())
+            if data is None or data.get("type") != "fleet_status":
+                continue
 
-                elif not data.get("fleet_name"):
-                    continue
+            elif not data.get("fleet_name"):
+                continue
 
-                fleet_name = data.get("fleet_name")
+            fleet_name = data.get("fleet_name")
 
-                temp = last_update_dt.get(fleet_name)
-                if temp is None:
-                    logging.getLogger("mfm_updates_ws").info(
-                        "New fleet has been added, reconnect again"
-                    )
-                    await ws.close()
-                    return
+            temp = last_update_dt.get(fleet_name)
+            if temp is None:
+                logging.getLogger("mfm_updates_ws").info(
+                    "New fleet has been added, reconnect again"
+                )
+                await ws.close()
+                return
 
-                time_delta = datetime.datetime.now() - temp
+            time_delta = datetime.datetime.now() - temp
 
-                if time_delta.seconds > mfm_context.ws_update_freq:
-                    pruned_fleet_status = mu.prune_fleet_status(data)
+            if time_delta.seconds > mfm_context.ws_update_freq:
+                pruned_fleet_status = mu.prune_fleet_status(data)
 
-                    await ws.send(json.dumps(pruned_fleet_status))
+                await ws.send(json.dumps(pruned_fleet_status))
 
-                    last_update_dt.update({fleet_name: datetime.datetime.now()})
-                    logging.getLogger("mfm_updates_ws").info(
-                        f"sent a fleet_status msg for {fleet_name} to master fm"
-                    )
+                last_update_dt.update({fleet_name: datetime.datetime.now()})
+                logging.getLogger("mfm_updates_ws").info(
+                    f"sent a fleet_status msg for {fleet_name} to master fm"
+                )
+    finally:
+        redis_subscriber.unsubscribe(channel, queue)
 
 
 # @utils_util.async_report_error
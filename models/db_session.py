@@ -1,15 +1,15 @@
 import datetime
 import logging
-import os
 from typing import List
 from sqlalchemy import select, func, any_, or_, and_, extract, text, literal_column, alias, cast
-from sqlalchemy.orm import Session, aliased
+from sqlalchemy.orm import Session, aliased, joinedload, contains_eager
 from sqlalchemy.types import Numeric
 from fastapi.encoders import jsonable_encoder
 
 
 # ati code imports
-from core.db import get_session, get_session_with_engine
+from core.db import get_session_with_engine
+from core.common import get_fm_engine
 import models.misc_models as mm
 import models.fleet_models as fm
 import models.trip_models as tm
@@ -18,14 +18,30 @@ import models.user_models as um
 from utils.util import check_if_timestamp_has_passed, str_to_dt, get_table_as_dict
 
 
+class DispatchSnapshot:
+    # everything optimal dispatch needs for a fleet, see DBSession.get_dispatch_snapshot
+    def __init__(
+        self, sherpas, current_trips, pending_trips, station_poses, exclude_stations
+    ):
+        # available sherpas, with status and fleet loaded
+        self.sherpas: List[fm.Sherpa] = sherpas
+        # trip_id: ongoing trip of an available sherpa
+        self.current_trips: dict = current_trips
+        # pending trips of the fleet, with trip loaded
+        self.pending_trips: List[tm.PendingTrip] = pending_trips
+        # station_name: pose, of the final stations of current trips and the
+        # first stations of pending trips
+        self.station_poses: dict = station_poses
+        # sherpa_name: stations the sherpa is restricted from going to
+        self.exclude_stations: dict = exclude_stations
+
+
 class DBSession:
     def __init__(self, engine=None):
-        if engine:
-            self.session: Session = get_session_with_engine(engine)
-        else:
-            self.session: Session = get_session(
-                os.path.join(os.getenv("FM_DATABASE_URI"), os.getenv("PGDATABASE"))
-            )
+        # pooled engine of the process by default, see core/db.py
+        if engine is None:
+            engine = get_fm_engine()
+        self.session: Session = get_session_with_engine(engine)
 
     def __enter__(self):
         return self
@@ -212,6 +228,31 @@ class DBSession:
     def get_sherpa(self, name: str) -> fm.Sherpa:
         return self.session.query(fm.Sherpa).filter(fm.Sherpa.name == name).one_or_none()
     
+    def get_sherpa_working_set(self, sherpa_name: str):
+        # sherpa(status, fleet, parked_at), its ongoing trip(trip, leg) with the trip
+        # analytics of the leg in one query, pending trip in another
+        row = (
+            self.session.query(fm.Sherpa, tm.OngoingTrip, tm.TripAnalytics)
+            .outerjoin(tm.OngoingTrip, tm.OngoingTrip.sherpa_name == fm.Sherpa.name)
+            .outerjoin(
+                tm.TripAnalytics, tm.TripAnalytics.trip_leg_id == tm.OngoingTrip.trip_leg_id
+            )
+            .filter(fm.Sherpa.name == sherpa_name)
+            .options(
+                joinedload(fm.Sherpa.status),
+                joinedload(fm.Sherpa.fleet),
+                joinedload(fm.Sherpa.parked_at),
+                joinedload(tm.OngoingTrip.trip),
+                joinedload(tm.OngoingTrip.trip_leg),
+            )
+            .one_or_none()
+        )
+        if row is None:
+            return None, None, None, None
+
+        sherpa, ongoing_trip, trip_analytics = row
+        return sherpa, ongoing_trip, self.get_pending_trip(sherpa_name), trip_analytics
+
     def get_sherpa_without_return_class(self, name: str):
         return self.session.query(fm.Sherpa).filter(fm.Sherpa.name == name).one_or_none()
 
@@ -267,6 +308,17 @@ class DBSession:
     def get_all_sherpa_status(self) -> List[fm.SherpaStatus]:
         return self.session.query(fm.SherpaStatus).all()
 
+    def get_all_sherpa_status_in_fleet(self, fleet_name: str) -> List[fm.SherpaStatus]:
+        # with sherpa loaded
+        return (
+            self.session.query(fm.SherpaStatus)
+            .join(fm.SherpaStatus.sherpa)
+            .join(fm.Sherpa.fleet)
+            .filter(fm.Fleet.name == fleet_name)
+            .options(contains_eager(fm.SherpaStatus.sherpa))
+            .all()
+        )
+
     def get_all_stale_sherpa_status(self, heartbeat_interval):
         filter_time = datetime.datetime.now() + datetime.timedelta(
             seconds=-heartbeat_interval
@@ -313,11 +365,17 @@ class DBSession:
         )
 
     def delete_stale_sherpa_events(self, sherpa_name: str):
-        stale_sherpa_events = self.session.query(fm.SherpaEvent).filter(
-            fm.SherpaEvent.sherpa_name == sherpa_name
-        )[:-10]
-        for stale_sherpa_event in stale_sherpa_events:
-            self.session.delete(stale_sherpa_event)
+        # keeps the last 10 events, in a single DELETE
+        last_sherpa_event_ids = (
+            self.session.query(fm.SherpaEvent.id)
+            .filter(fm.SherpaEvent.sherpa_name == sherpa_name)
+            .order_by(fm.SherpaEvent.id.desc())
+            .limit(10)
+        )
+        self.session.query(fm.SherpaEvent).filter(
+            fm.SherpaEvent.sherpa_name == sherpa_name,
+            fm.SherpaEvent.id.not_in(last_sherpa_event_ids.scalar_subquery()),
+        ).delete(synchronize_session="fetch")
 
     def get_station_if_present(self, name: str) -> fm.Station:
         return self.session.query(fm.Station).filter(fm.Station.name == name).one_or_none()
@@ -352,6 +410,17 @@ class DBSession:
     def get_all_station_status(self) -> List[fm.StationStatus]:
         return self.session.query(fm.StationStatus).all()
 
+    def get_all_station_status_in_fleet(self, fleet_name: str) -> List[fm.StationStatus]:
+        # with station loaded
+        return (
+            self.session.query(fm.StationStatus)
+            .join(fm.StationStatus.station)
+            .join(fm.Station.fleet)
+            .filter(fm.Fleet.name == fleet_name)
+            .options(contains_eager(fm.StationStatus.station))
+            .all()
+        )
+
     def get_fleet_name_from_route(self, route: List):
         prev_fleet_name = None
         fleet_name = None
@@ -378,6 +447,7 @@ class DBSession:
         pending_trips = (
             self.session.query(tm.PendingTrip)
             .filter(tm.PendingTrip.sherpa_name == sherpa_name)
+            .options(joinedload(tm.PendingTrip.trip))
             .all()
         )
 
@@ -398,6 +468,57 @@ class DBSession:
             .all()
         )
 
+    def get_dispatch_snapshot(self, fleet_name: str) -> DispatchSnapshot:
+        # constant number of queries irrespective of the number of sherpas/trips
+        sherpas = (
+            self.session.query(fm.Sherpa)
+            .join(fm.AvailableSherpas, fm.AvailableSherpas.sherpa_name == fm.Sherpa.name)
+            .filter(fm.AvailableSherpas.fleet_name == fleet_name)
+            .filter(fm.AvailableSherpas.available.is_(True))
+            .options(joinedload(fm.Sherpa.status), joinedload(fm.Sherpa.fleet))
+            .all()
+        )
+
+        trip_ids = [sherpa.status.trip_id for sherpa in sherpas if sherpa.status.trip_id]
+        current_trips = {}
+        if trip_ids:
+            current_trips = {
+                trip.id: trip
+                for trip in self.session.query(tm.Trip).filter(tm.Trip.id.in_(trip_ids))
+            }
+
+        pending_trips = (
+            self.session.query(tm.PendingTrip)
+            .join(tm.PendingTrip.trip)
+            .filter(tm.Trip.fleet_name == fleet_name)
+            .options(contains_eager(tm.PendingTrip.trip))
+            .all()
+        )
+
+        station_names = {trip.augmented_route[-1] for trip in current_trips.values()}
+        station_names.update(pending_trip.trip.route[0] for pending_trip in pending_trips)
+        station_poses = {}
+        if station_names:
+            stations = self.session.query(fm.Station.name, fm.Station.pose).filter(
+                fm.Station.name.in_(station_names)
+            )
+            station_poses = {name: pose for name, pose in stations}
+
+        exclude_stations = {sherpa.name: [] for sherpa in sherpas}
+        if sherpas:
+            saved_routes = self.session.query(tm.SavedRoutes).filter(
+                tm.SavedRoutes.tag.in_(
+                    [f"exclude_stations_{sherpa.name}" for sherpa in sherpas]
+                )
+            )
+            for saved_route in saved_routes:
+                sherpa_name = saved_route.tag[len("exclude_stations_") :]
+                exclude_stations[sherpa_name] = saved_route.route
+
+        return DispatchSnapshot(
+            sherpas, current_trips, pending_trips, station_poses, exclude_stations
+        )
+
     def get_sherpas_with_pending_trip(self):
         sherpas = []
         temp = self.session.query(tm.PendingTrip.sherpa_name).all()
@@ -428,13 +549,18 @@ class DBSession:
         )
 
     def get_all_ongoing_trips(self):
-        return self.session.query(tm.OngoingTrip).all()
+        return (
+            self.session.query(tm.OngoingTrip)
+            .options(joinedload(tm.OngoingTrip.trip))
+            .all()
+        )
 
     def get_all_ongoing_trips_fleet(self, fleet_name: str):
         return (
             self.session.query(tm.OngoingTrip)
             .join(tm.OngoingTrip.trip)
             .filter(tm.Trip.fleet_name == fleet_name)
+            .options(contains_eager(tm.OngoingTrip.trip))
             .all()
         )
 
@@ -445,6 +571,18 @@ class DBSession:
             .one_or_none()
         )
 
+    def get_ongoing_trips_with_analytics(self, trip_ids):
+        # (ongoing trip with its leg, trip analytics of the leg) of the trips, one query
+        return (
+            self.session.query(tm.OngoingTrip, tm.TripAnalytics)
+            .outerjoin(
+                tm.TripAnalytics, tm.TripAnalytics.trip_leg_id == tm.OngoingTrip.trip_leg_id
+            )
+            .filter(tm.OngoingTrip.trip_id.in_(trip_ids))
+            .options(joinedload(tm.OngoingTrip.trip_leg))
+            .all()
+        )
+
     def get_pending_trip_with_trip_id(self, trip_id):
         return (
             self.session.query(tm.PendingTrip)
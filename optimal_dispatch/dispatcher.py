@@ -2,6 +2,8 @@ import numpy as np
 import logging
 import logging.config
 import redis
+import json
+import hashlib
 from typing import List
 from sqlalchemy.sql import or_
 import os
@@ -15,6 +17,8 @@ from core.constants import FleetStatus
 from models.fleet_models import Fleet, AvailableSherpas, OptimalDispatchState
 from models.trip_models import Trip, PendingTrip, TripStatus
 from optimal_dispatch.hungarian import hungarian_assignment
+from optimal_dispatch.linear_sum_assignment import lsa_assignment, sparse_lsa_assignment
+from utils.route_length_cache import get_map_version
 
 # get log config
 logging.config.dictConfig(lu.get_log_config_dict())
@@ -24,6 +28,18 @@ logging.config.dictConfig(lu.get_log_config_dict())
 # while ensuring the bookings and trips are valid(eg.start time of the trip should be greater than
 # or equal to the current time)
 
+# route lengths and the assignment of the last run of a fleet are saved to redis, the next
+# run reuses them for the sherpas/trips which haven't changed
+DISPATCH_STATE_TTL_SEC = 60 * 60
+
+
+def get_dispatch_state_key(fleet_name):
+    return f"optimal_dispatch_state:{fleet_name}"
+
+
+def get_pose_key(pose):
+    return json.dumps(pose)
+
 
 class OptimalDispatch:
     def __init__(self, optimal_dispatch_config: dict):
@@ -37,15 +53,10 @@ class OptimalDispatch:
         self.fleets: List[Fleet] = []
         self.router_utils = {}
         self.ptrip_first_station = []
-
-    def get_exclude_stations_for_sherpa(self, dbsession, sherpa_name):
-        saved_route = dbsession.get_saved_route(f"exclude_stations_{sherpa_name}")
-        if saved_route is None:
-            route = []
-        else:
-            route = saved_route.route
-
-        return route
+        self.pending_trips = {}
+        self.route_lengths = None
+        self.prev_state = None
+        self.map_version = None
 
     def get_last_assignment_time(self, dbsession):
         self.last_assignment_time = {}
@@ -78,12 +89,9 @@ class OptimalDispatch:
 
         raise ValueError("power factors are not valid, need to be in the range of 0-1")
 
-    def all_data_available(self, dbsession, fleet_name):
-        available_sherpas = dbsession.get_all_available_sherpa_names(fleet_name)
-        for available_sherpa_name in available_sherpas:
-            available_sherpa = dbsession.get_sherpa(available_sherpa_name)
-            pose = available_sherpa.status.pose
-            if pose is None:
+    def all_data_available(self, snapshot):
+        for available_sherpa in snapshot.sherpas:
+            if available_sherpa.status.pose is None:
                 return False
         return True
 
@@ -152,11 +160,28 @@ class OptimalDispatch:
     def hungarian(self, cost_matrix, pickups, sherpas):
         return hungarian_assignment(cost_matrix, pickups, sherpas)
 
-    def update_sherpa_q(self, dbsession, fleet_name):
+    def linear_sum_assignment(self, cost_matrix, pickups, sherpas):
+        try:
+            return lsa_assignment(cost_matrix, pickups, sherpas)
+        except Exception as e:
+            self.logger.info(
+                f"linear_sum_assignment failed, will use hungarian, exception: {e}"
+            )
+            return self.hungarian(cost_matrix, pickups, sherpas)
+
+    def sparse_linear_sum_assignment(self, cost_matrix, pickups, sherpas):
+        try:
+            return sparse_lsa_assignment(cost_matrix, pickups, sherpas)
+        except Exception as e:
+            self.logger.info(
+                f"sparse_linear_sum_assignment failed, will use hungarian, exception: {e}"
+            )
+            return self.hungarian(cost_matrix, pickups, sherpas)
+
+    def update_sherpa_q(self, snapshot):
         self.sherpa_q = {}
-        available_sherpas = dbsession.get_all_available_sherpa_names(fleet_name)
-        for available_sherpa_name in available_sherpas:
-            available_sherpa = dbsession.get_sherpa(available_sherpa_name)
+        for available_sherpa in snapshot.sherpas:
+            exclude_stations = snapshot.exclude_stations[available_sherpa.name]
             trip_id = available_sherpa.status.trip_id
             pose = available_sherpa.status.pose
             parking_mode = False
@@ -165,21 +190,17 @@ class OptimalDispatch:
             remaining_eta = 0
 
             if trip_id:
-                trip: Trip = dbsession.get_trip(trip_id)
+                trip: Trip = snapshot.current_trips[trip_id]
                 remaining_eta = np.sum(trip.etas)
                 final_dest = trip.augmented_route[-1]
-                try:
-                    final_pose = dbsession.get_station(final_dest).pose
-                except Exception as e:
-                    raise Exception(
-                        f"Unable to get pose, details of station: {final_dest}, exception: {e}"
-                    )
+                if final_dest not in snapshot.station_poses:
+                    raise Exception(f"Unable to get pose, details of station: {final_dest}")
 
-                pose = final_pose
+                pose = snapshot.station_poses[final_dest]
 
             if not pose:
                 raise ValueError(
-                    f"{available_sherpa_name} pose is None, cannot assemble_cost_matrix"
+                    f"{available_sherpa.name} pose is None, cannot assemble_cost_matrix"
                 )
 
             # sherpas with pending trips can't be assigned anotther pending trip
@@ -189,9 +210,7 @@ class OptimalDispatch:
                     available_sherpa.name: {
                         "pose": pose,
                         "remaining_eta": remaining_eta,
-                        "exclude_stations": self.get_exclude_stations_for_sherpa(
-                            dbsession, available_sherpa.name
-                        ),
+                        "exclude_stations": exclude_stations,
                         "fleet_status": available_sherpa.fleet.status,
                         "parking_mode": parking_mode,
                     }
@@ -212,12 +231,12 @@ class OptimalDispatch:
 
         return valid_pending_trips
 
-    def update_pickup_q(self, dbsession, fleet_name):
+    def update_pickup_q(self, snapshot):
         self.pickup_q = {}
         self.ptrip_first_station = []
+        self.pending_trips = {}
 
-        pending_trips = dbsession.get_pending_trips_with_fleet_name(fleet_name)
-        pending_trips = self.get_valid_pending_trips(pending_trips)
+        pending_trips = self.get_valid_pending_trips(snapshot.pending_trips)
 
         waiting_time_priorities = [1] * len(pending_trips)
         if self.config.get("prioritise_waiting_stations", True):
@@ -236,12 +255,11 @@ class OptimalDispatch:
             if trip_metadata is not None:
                 sherpa_name = trip_metadata.get("sherpa_name")
 
-            try:
-                pose = dbsession.get_station(pending_trip.trip.route[0]).pose
-            except Exception as e:
+            if pending_trip.trip.route[0] not in snapshot.station_poses:
                 raise Exception(
-                    f"Unable to get pose, details of station: {pending_trip.trip.route[0]}, exception: {e}"
+                    f"Unable to get pose, details of station: {pending_trip.trip.route[0]}"
                 )
+            pose = snapshot.station_poses[pending_trip.trip.route[0]]
 
             if not pose:
                 raise ValueError(
@@ -270,102 +288,234 @@ class OptimalDispatch:
                 }
             )
             self.ptrip_first_station.append(pending_trip.trip.augmented_route[0])
+            self.pending_trips[pending_trip.trip_id] = pending_trip
             count += 1
 
-    def assemble_cost_matrix(self, fleet_name):
+    def get_feasibility_mask(self):
+        # feasible[i, j] - trip i of pickup_q can be assigned to sherpa j of sherpa_q
+        pickup_ids = list(self.pickup_q.keys())
+        pickup_q_vals = list(self.pickup_q.values())
+        sherpa_names = list(self.sherpa_q.keys())
+        sherpa_q_vals = list(self.sherpa_q.values())
+        shape = (len(pickup_ids), len(sherpa_names))
+
+        # trip route x station, sherpa x excluded station incidence matrices
+        stations = {}
+        for pickup_q_val in pickup_q_vals:
+            for station in pickup_q_val["route"]:
+                stations.setdefault(station, len(stations))
+        in_route = np.zeros((shape[0], len(stations)), dtype=np.int32)
+        for i, pickup_q_val in enumerate(pickup_q_vals):
+            in_route[i, [stations[station] for station in pickup_q_val["route"]]] = 1
+        is_excluded = np.zeros((shape[1], len(stations)), dtype=np.int32)
+        for j, sherpa_q_val in enumerate(sherpa_q_vals):
+            excluded = [
+                stations[station]
+                for station in sherpa_q_val["exclude_stations"]
+                if station in stations
+            ]
+            is_excluded[j, excluded] = 1
+
+        # parking trips of a sherpa can be assigned even if the fleet is stopped
+        # or the sherpa is in parking mode
+        park_booking = np.zeros(shape, dtype=bool)
+        for i, pickup_q_val in enumerate(pickup_q_vals):
+            booked_by = pickup_q_val["booked_by"]
+            if booked_by.find("park_") == -1:
+                continue
+            park_booking[i] = [
+                booked_by.find(f"park_{sherpa_name}") != -1 for sherpa_name in sherpa_names
+            ]
+
+        fleet_status = np.array(
+            [val["fleet_status"] for val in sherpa_q_vals], dtype=object
+        )
+        parking_mode = np.array(
+            [val["parking_mode"] is True for val in sherpa_q_vals], dtype=bool
+        )
+        pinned_sherpa = np.array(
+            [val["sherpa_name"] for val in pickup_q_vals], dtype=object
+        )
+
+        infeasible = {
+            "sherpa restricted from going to a station in the route": (
+                in_route @ is_excluded.T
+            )
+            > 0,
+            "fleet in maintenance mode": np.broadcast_to(
+                fleet_status == FleetStatus.MAINTENANCE, shape
+            ),
+            "fleet stopped": (fleet_status == FleetStatus.STOPPED)[None, :] & ~park_booking,
+            "sherpa in parking mode": parking_mode[None, :] & ~park_booking,
+            "num trips greater than max_trips_to_consider": np.broadcast_to(
+                (np.arange(shape[0]) >= self.config["max_trips_to_consider"])[:, None],
+                shape,
+            ),
+            "trip can be assigned only to the booked sherpa": (
+                pinned_sherpa.astype(bool)[:, None]
+                & (pinned_sherpa[:, None] != np.array(sherpa_names, dtype=object)[None, :])
+            ),
+        }
+
+        feasible = np.ones(shape, dtype=bool)
+        for reason, mask in infeasible.items():
+            # reasons are checked in order, a cell is logged against the first reason only
+            mask = mask & feasible
+            if mask.any():
+                rows, cols = np.nonzero(mask)
+                self.logger.info(
+                    f"cannot assign {int(mask.sum())} sherpa, trip combinations, reason: {reason}, "
+                    f"sherpas: {sorted({sherpa_names[j] for j in cols})}, "
+                    f"trip_ids: {sorted({pickup_ids[i] for i in rows})}"
+                )
+            feasible &= ~mask
+
+        return feasible
+
+    def get_cost_matrices(self, feasible, route_lengths):
         w1 = self.config["eta_power_factor"]
         w2 = self.config["priority_power_factor"]
         MIN_ACCEPTABLE_ETA = 100
-        max_trips_to_consider = self.config["max_trips_to_consider"]
-        with redis.from_url(os.getenv("FM_REDIS_URI")) as redis_conn:
-            cost_matrix = np.zeros((len(self.pickup_q), len(self.sherpa_q))) 
-            priority_normalised_cost_matrix = (
-                np.zeros((len(self.pickup_q), len(self.sherpa_q)))
-            )
-            priority_matrix = np.zeros((len(self.pickup_q), len(self.sherpa_q)))
-            i = 0
-            for pickup_q, pickup_q_val in self.pickup_q.items():
-                j = 0
-                for sherpa_q, sherpa_q_val in self.sherpa_q.items():
-                    pose_1 = sherpa_q_val["pose"]
-                    pose_2 = pickup_q_val["pose"]
-                    pickup_priority = pickup_q_val["priority"]
-                    route = pickup_q_val["route"]
-                    sherpa_name = pickup_q_val["sherpa_name"]
-                    temp_stations = [
-                        station
-                        for station in pickup_q_val["route"]
-                        if station in sherpa_q_val["exclude_stations"]
-                    ]
-
-                    if len(temp_stations) > 0:
-                        self.logger.info(
-                            f"cannot use {sherpa_q} for trip_id: {pickup_q}, reason: sherpa restricted from going to {temp_stations}"
-                        )
-                        total_eta = np.inf
-                    elif sherpa_q_val["fleet_status"] == FleetStatus.MAINTENANCE:
-                        self.logger.info(
-                            f"cannot send {sherpa_q} to {route}, fleet in maintenance mode"
-                        )
-                        total_eta = np.inf
-                    elif (
-                        sherpa_q_val["fleet_status"] == FleetStatus.STOPPED
-                        and pickup_q_val["booked_by"].find(f"park_{sherpa_q}") == -1
-                    ):
-                        self.logger.info(
-                            f"cannot send {sherpa_q} to {route}, fleet stopped"
-                        )
-                        total_eta = np.inf
-                    elif (
-                        sherpa_q_val["parking_mode"] is True
-                        and pickup_q_val["booked_by"].find(f"park_{sherpa_q}") == -1
-                    ):
-                        self.logger.info(
-                            f"cannot send {sherpa_q} to {route}, sherpa in parking mode"
-                        )
-                        total_eta = np.inf
-                    elif i + 1 > max_trips_to_consider:
-                        self.logger.info(
-                            f"cannot send {sherpa_q} to {route}, num trips greater than max_trips_to_consider, num_trips: {i+1}"
-                        )
-                        total_eta = np.inf
-                    elif sherpa_name and sherpa_name != sherpa_q:
-                        self.logger.info(
-                            f"cannot assign {sherpa_q} for trip_id: {pickup_q}, can be assigned only to {sherpa_name} "
-                        )
-                        total_eta = np.inf
-                    else:
-                        route_length = utils_util.get_route_length(
-                            pose_1, pose_2, fleet_name, redis_conn
-                        )
-                        total_eta = route_length + sherpa_q_val["remaining_eta"] + MIN_ACCEPTABLE_ETA
-                
-                    # to handle w1 == 0  and eta == np.inf case
-                    weighted_total_eta = (
-                        (total_eta**w1) if (total_eta != np.inf) else total_eta
-                    )
-                    weighted_pickup_priority = (
-                        (pickup_priority**w2)
-                        if (pickup_priority != np.inf)
-                        else pickup_priority
-                    )
-                    cost_matrix[i, j] = total_eta
-                    priority_matrix[i, j] = pickup_priority
 
-                    if total_eta != np.inf:
-                        priority_normalised_cost_matrix[i, j] = (
-                            weighted_pickup_priority / weighted_total_eta 
-                        )
+        remaining_etas = np.array(
+            [val["remaining_eta"] for val in self.sherpa_q.values()], dtype=float
+        )
+        priorities = np.array(
+            [val["priority"] for val in self.pickup_q.values()], dtype=float
+        )
 
-                    j += 1
-                i += 1
+        cost_matrix = np.where(
+            feasible, route_lengths + remaining_etas[None, :] + MIN_ACCEPTABLE_ETA, np.inf
+        )
+        priority_matrix = np.broadcast_to(priorities[:, None], feasible.shape).copy()
+
+        # to handle w1 == 0  and eta == np.inf case
+        finite = np.isfinite(cost_matrix)
+        with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            weighted_total_eta = np.where(finite, cost_matrix**w1, np.inf)
+            weighted_pickup_priority = np.where(
+                np.isinf(priority_matrix), priority_matrix, priority_matrix**w2
+            )
+            priority_normalised_cost_matrix = np.where(
+                finite, weighted_pickup_priority / weighted_total_eta, 0.0
+            )
 
         return cost_matrix, priority_matrix, priority_normalised_cost_matrix
 
-    def update_pending_trips(self, dbsession, assignments):
+    def get_config_hash(self):
+        return hashlib.sha1(json.dumps(self.config, sort_keys=True).encode()).hexdigest()
+
+    def load_dispatch_state(self, redis_conn, fleet_name):
+        # state of the last run, None if a full rebuild is required(map/config changed)
+        state = redis_conn.get(get_dispatch_state_key(fleet_name))
+        if state is None:
+            return None
+
+        state = json.loads(state)
+        if state["config_hash"] != self.get_config_hash():
+            self.logger.info(
+                f"optimal dispatch config changed, full rebuild for {fleet_name}"
+            )
+            return None
+        if state["map_version"] != self.map_version:
+            self.logger.info(f"map changed, full rebuild for {fleet_name}")
+            return None
+        return state
+
+    def save_dispatch_state(self, redis_conn, fleet_name, cost_matrix_hash, assignments):
+        state = {
+            "config_hash": self.get_config_hash(),
+            "map_version": self.map_version,
+            "pickup_poses": [get_pose_key(val["pose"]) for val in self.pickup_q.values()],
+            "sherpa_poses": [get_pose_key(val["pose"]) for val in self.sherpa_q.values()],
+            "route_lengths": self.route_lengths.tolist(),
+            "cost_matrix_hash": cost_matrix_hash,
+            "assignments": [[pickup, sherpa] for pickup, sherpa in assignments.items()],
+        }
+        redis_conn.set(
+            get_dispatch_state_key(fleet_name), json.dumps(state), ex=DISPATCH_STATE_TTL_SEC
+        )
+
+    def get_route_lengths(self, fleet_name, feasible, redis_conn):
+        # route lengths of the feasible combinations, nan for the rest. Cells of the last
+        # run are reused if the sherpa and trip poses are unchanged, only the rows/cols
+        # of new/moved sherpas and trips are sent to the router module, as a single job
+        sherpa_poses = [val["pose"] for val in self.sherpa_q.values()]
+        pickup_poses = [val["pose"] for val in self.pickup_q.values()]
+        route_lengths = np.full(feasible.shape, np.nan)
+
+        if self.prev_state is not None:
+            prev_route_lengths = np.array(self.prev_state["route_lengths"], dtype=float)
+            prev_rows = {pose: i for i, pose in enumerate(self.prev_state["pickup_poses"])}
+            prev_cols = {pose: j for j, pose in enumerate(self.prev_state["sherpa_poses"])}
+            row_map = [prev_rows.get(get_pose_key(pose), -1) for pose in pickup_poses]
+            col_map = [prev_cols.get(get_pose_key(pose), -1) for pose in sherpa_poses]
+            rows = [i for i, prev_i in enumerate(row_map) if prev_i != -1]
+            cols = [j for j, prev_j in enumerate(col_map) if prev_j != -1]
+            if rows and cols and prev_route_lengths.size > 0:
+                route_lengths[np.ix_(rows, cols)] = prev_route_lengths[
+                    np.ix_([row_map[i] for i in rows], [col_map[j] for j in cols])
+                ]
+
+        missing = feasible & np.isnan(route_lengths)
+        rows = np.flatnonzero(missing.any(axis=1))
+        cols = np.flatnonzero(missing.any(axis=0))
+        self.logger.info(
+            f"route lengths of {fleet_name}: {int((feasible & ~missing).sum())} reused, {int(missing.sum())} to be computed"
+        )
+        if rows.size > 0:
+            block = route_lengths[np.ix_(rows, cols)]
+            block_missing = missing[np.ix_(rows, cols)]
+            block[block_missing] = utils_util.get_route_lengths_matrix(
+                [sherpa_poses[j] for j in cols],
+                [pickup_poses[i] for i in rows],
+                fleet_name,
+                redis_conn,
+            ).T[block_missing]
+            route_lengths[np.ix_(rows, cols)] = block
+
+        return route_lengths
+
+    def assemble_cost_matrix(self, fleet_name):
+        feasible = self.get_feasibility_mask()
+        with redis.from_url(os.getenv("FM_REDIS_URI")) as redis_conn:
+            self.prev_state = self.load_dispatch_state(redis_conn, fleet_name)
+            self.route_lengths = self.get_route_lengths(fleet_name, feasible, redis_conn)
+
+        return self.get_cost_matrices(
+            feasible, np.where(feasible, self.route_lengths, np.inf)
+        )
+
+    def assign_with_warm_start(self, fleet_name, cost_matrix, pickups, sherpas):
+        # the assignment of the last run is reused if the cost matrix hasn't changed
+        cost_matrix_hash = hashlib.sha1(
+            json.dumps([pickups, sherpas]).encode()
+            + np.ascontiguousarray(cost_matrix).tobytes()
+        ).hexdigest()
+
+        if (
+            self.prev_state is not None
+            and self.prev_state["cost_matrix_hash"] == cost_matrix_hash
+        ):
+            self.logger.info(
+                f"cost matrix of {fleet_name} unchanged, reusing the last assignment"
+            )
+            assignments = {
+                pickup: sherpa for pickup, sherpa in self.prev_state["assignments"]
+            }
+            raw_assignments = None
+        else:
+            assignments, raw_assignments = self.assign(cost_matrix, pickups, sherpas)
+
+        with redis.from_url(os.getenv("FM_REDIS_URI")) as redis_conn:
+            self.save_dispatch_state(redis_conn, fleet_name, cost_matrix_hash, assignments)
+
+        return assignments, raw_assignments
+
+    def update_pending_trips(self, assignments):
 
         for pickup, sherpa_name in assignments.items():
-            ptrip: PendingTrip = dbsession.get_pending_trip_with_trip_id(pickup)
+            ptrip: PendingTrip = self.pending_trips[pickup]
             ptrip.sherpa_name = sherpa_name
             ptrip.trip.status = TripStatus.ASSIGNED
             ptrip.trip.sherpa_name = sherpa_name
@@ -396,12 +546,14 @@ class OptimalDispatch:
                 or self.any_change_in_sherpa_availability(dbsession, fleet.name)
                 or self.any_trips_cancelled(dbsession, fleet.name)
             ):
-                if self.all_data_available(dbsession, fleet.name):
+                snapshot = dbsession.get_dispatch_snapshot(fleet.name)
+                if self.all_data_available(snapshot):
                     self.logger.info(f"need to create/update assignments for {fleet.name}")
-                    self.update_sherpa_q(dbsession, fleet.name)
+                    self.map_version = get_map_version(dbsession.get_map_files(fleet.name))
+                    self.update_sherpa_q(snapshot)
                     self.logger.info(f"updated sherpa_q {self.sherpa_q}")
 
-                    self.update_pickup_q(dbsession, fleet.name)
+                    self.update_pickup_q(snapshot)
                     self.logger.info(f"updated pickup_q {self.pickup_q}")
 
                     pickup_list = list(self.pickup_q.keys())
@@ -433,8 +585,11 @@ class OptimalDispatch:
                         text,
                     )
 
-                    assignments, raw_assignments = self.assign(
-                        priority_normalised_cost_matrix, pickup_list, sherpa_list
+                    assignments, raw_assignments = self.assign_with_warm_start(
+                        fleet.name,
+                        priority_normalised_cost_matrix,
+                        pickup_list,
+                        sherpa_list,
                     )
 
                     self.logger.info(f"Raw assignments: {raw_assignments}\n")
@@ -445,7 +600,7 @@ class OptimalDispatch:
                         )
                     self.logger.info("\n")
 
-                    self.update_pending_trips(dbsession, assignments)
+                    self.update_pending_trips(assignments)
                     self.update_last_assignment_time(dbsession, fleet.name)
                 else:
                     self.logger.info(
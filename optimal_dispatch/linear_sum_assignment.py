@@ -0,0 +1,57 @@
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import min_weight_full_bipartite_matching
+
+# same convention as hungarian.py, cells with value <= MIN_VALUE cannot be assigned
+from optimal_dispatch.hungarian import MIN_VALUE
+
+# scipy based alternatives to hungarian_assignment, the cost matrix is maximised
+# ROWS represent TASKS (pickups), COLUMNS represent Agents (sherpas)
+# Both handle rectangular matrices, no padding/clamping of values is required
+
+
+def get_assignment(cost_matrix, row_ind, col_ind, pickups, sherpas):
+    assignment = {}
+    raw_assignments = [-1] * cost_matrix.shape[0]
+    for i, j in zip(row_ind, col_ind):
+        if j >= cost_matrix.shape[1] or cost_matrix[i, j] <= MIN_VALUE:
+            continue
+        assignment.update({pickups[i]: sherpas[j]})
+        raw_assignments[i] = int(j)
+
+    return assignment, raw_assignments
+
+
+def lsa_assignment(cost_matrix, pickups, sherpas):
+    cost_matrix = np.where(cost_matrix > MIN_VALUE, cost_matrix, 0.0)
+    row_ind, col_ind = linear_sum_assignment(cost_matrix, maximize=True)
+    return get_assignment(cost_matrix, row_ind, col_ind, pickups, sherpas)
+
+
+def sparse_lsa_assignment(cost_matrix, pickups, sherpas):
+    # only the cells that can be assigned are added to the bipartite graph. Every task
+    # also gets a dummy agent of cost K(value 0), so that a full matching always exists,
+    # minimising K - value is then the same as maximising the value
+    num_pickups, num_sherpas = cost_matrix.shape
+    if num_pickups == 0 or num_sherpas == 0:
+        return {}, [-1] * num_pickups
+
+    rows, cols = np.nonzero(cost_matrix > MIN_VALUE)
+    if rows.size == 0:
+        return {}, [-1] * num_pickups
+
+    values = cost_matrix[rows, cols]
+    K = 2 * values.max() + 1
+    graph = csr_matrix(
+        (
+            np.concatenate([K - values, np.full(num_pickups, K)]),
+            (
+                np.concatenate([rows, np.arange(num_pickups)]),
+                np.concatenate([cols, num_sherpas + np.arange(num_pickups)]),
+            ),
+        ),
+        shape=(num_pickups, num_sherpas + num_pickups),
+    )
+    row_ind, col_ind = min_weight_full_bipartite_matching(graph)
+    return get_assignment(cost_matrix, row_ind, col_ind, pickups, sherpas)
@@ -1,18 +1,22 @@
 import redis
 import json
-import time
 import os
 import sys
+import time
+from multiprocessing import Process
 import numpy as np
 import logging
 import logging.config
 
 
 # ati code imports
+from core.constants import RouterJobQueues, RouterPoolKeys
 from utils.router_utils import get_dense_path
-from utils.util import report_error, proc_retry
+from utils.util import report_error, proc_retry, push_job_result
+import utils.station_route_lengths as srl
 import utils.log_utils as lu
 from models.db_session import DBSession
+from models.mongo_client import FMMongo
 
 # to avoid mule router module logs
 logging.getLogger().level == logging.ERROR
@@ -26,136 +30,399 @@ from utils.util import are_poses_close
 from utils.router_utils import AllRouterModules
 
 
-def init_routers():
-    with DBSession() as dbsession:
-        fleet_names = dbsession.get_all_fleet_names()
+# route jobs served by every router worker, BLPOP checks the lists in order,
+# map updates of the worker's fleets are served before any route job
+WORKER_JOB_QUEUES = [
+    RouterJobQueues.MAP_UPDATE,
+    RouterJobQueues.ROUTE_LENGTH,
+    RouterJobQueues.ROUTE_LENGTH_MATRIX,
+    RouterJobQueues.ROUTE_LENGTH_PAIRS,
+    RouterJobQueues.ROUTE_WPS,
+    RouterJobQueues.DENSE_PATH,
+]
+
+# seconds to block on the job queues before blocking again
+BLOCK_TIMEOUT = 5
+
+# seconds a worker blocks on the job queues while it has station route lengths to compute,
+# rows of the matrix are computed when no job is waiting, at least every
+# STATION_RL_STEP_INTERVAL secs under load
+STATION_RL_BLOCK_TIMEOUT = 0.01
+STATION_RL_STEP_INTERVAL = 1
+
+DEFAULT_NUM_ROUTER_WORKERS = 2
+
+
+def get_worker_job_queues(shard):
+    return [f"{job_queue}:{shard}" for job_queue in WORKER_JOB_QUEUES]
+
+
+def init_routers(fleet_names):
     all_router_modules = AllRouterModules(fleet_names)
     return all_router_modules
 
 
+def handle_map_update(redis_conn, all_router_modules, str_job, job_timeout_ms):
+    # worker exits, the router pool restarts it with the updated maps
+    logger = logging.getLogger("control_module_router")
+    fleet_name = str_job.decode()
+    logger.info(f"Got a map update for {fleet_name}, will restart the router worker")
+    return True
+
+
+def handle_rl_job(redis_conn, all_router_modules, str_job, job_timeout_ms):
+    logger = logging.getLogger("control_module_router")
+    logger.info(f"Got a route length estimation job {str_job.decode('utf-8')}")
+    control_router_rl_job = json.loads(str_job.decode("utf-8"))
+    pose_1 = control_router_rl_job[0]
+    pose_2 = control_router_rl_job[1]
+    fleet_name = control_router_rl_job[2]
+    job_id = control_router_rl_job[3]
+    try:
+        route_length = all_router_modules.get_route_lengths_matrix(
+            fleet_name, [pose_1], [pose_2]
+        )[0, 0]
+    except Exception as e:
+        logger.info(
+            f"unable to find route length between {pose_1} and {pose_2} of {fleet_name} \n Exception {e}"
+        )
+        route_length = np.inf
+
+    push_job_result(
+        redis_conn, f"result_{job_id}", json.dumps(float(route_length)), job_timeout_ms
+    )
+    logger.info(f"Result : {control_router_rl_job} - {route_length}")
+
+
+def handle_rl_matrix_job(redis_conn, all_router_modules, str_job, job_timeout_ms):
+    logger = logging.getLogger("control_module_router")
+    control_router_rl_matrix_job = json.loads(str_job.decode("utf-8"))
+    sources = control_router_rl_matrix_job[0]
+    targets = control_router_rl_matrix_job[1]
+    fleet_name = control_router_rl_matrix_job[2]
+    job_id = control_router_rl_matrix_job[3]
+    logger.info(
+        f"Got a route length matrix job {job_id}, {len(sources)} sources x {len(targets)} targets of {fleet_name}"
+    )
+
+    try:
+        route_lengths = all_router_modules.get_route_lengths_matrix(
+            fleet_name, sources, targets
+        )
+    except Exception as e:
+        logger.info(f"unable to find route lengths matrix of {fleet_name} \n Exception {e}")
+        route_lengths = np.full((len(sources), len(targets)), np.inf)
+
+    push_job_result(
+        redis_conn,
+        f"result_rl_matrix_job_{job_id}",
+        json.dumps(route_lengths.tolist()),
+        job_timeout_ms,
+    )
+    logger.info(f"Result of route length matrix job {job_id}: {route_lengths.tolist()}")
+
+
+def handle_rl_pairs_job(redis_conn, all_router_modules, str_job, job_timeout_ms):
+    logger = logging.getLogger("control_module_router")
+    control_router_rl_pairs_job = json.loads(str_job.decode("utf-8"))
+    sources = control_router_rl_pairs_job[0]
+    targets = control_router_rl_pairs_job[1]
+    fleet_name = control_router_rl_pairs_job[2]
+    job_id = control_router_rl_pairs_job[3]
+    logger.info(
+        f"Got a route length pairs job {job_id}, {len(sources)} pairs of {fleet_name}"
+    )
+
+    try:
+        route_lengths = all_router_modules.get_route_lengths_pairs(
+            fleet_name, sources, targets
+        )
+    except Exception as e:
+        logger.info(f"unable to find route lengths pairs of {fleet_name} \n Exception {e}")
+        route_lengths = np.full(len(sources), np.inf)
+
+    push_job_result(
+        redis_conn,
+        f"result_rl_pairs_job_{job_id}",
+        json.dumps(route_lengths.tolist()),
+        job_timeout_ms,
+    )
+    logger.info(f"Result of route length pairs job {job_id}: {route_lengths.tolist()}")
+
+
+def handle_wps_job(redis_conn, all_router_modules, str_job, job_timeout_ms):
+    logger = logging.getLogger("control_module_router")
+    logger.info(f"got a route preview estimation job {str_job.decode('utf-8')}")
+    control_router_wps_job = json.loads(str_job.decode("utf-8"))
+    station_poses = control_router_wps_job[0]
+    fleet_name = control_router_wps_job[1]
+    job_id = control_router_wps_job[2]
+    try:
+        rm = all_router_modules.get_router_module(fleet_name)
+        start_pose = station_poses[0]
+        dest_poses = station_poses[1:]
+        wps_list = rm.get_path_wps(start_pose, dest_poses)
+        logger.info(f"result of wps req: {wps_list}")
+
+    except Exception as e:
+        logger.info(f"unable to get route for poses {station_poses} \n Exception {e}")
+        wps_list = []
+
+    push_job_result(
+        redis_conn, f"result_wps_job_{job_id}", json.dumps(wps_list), job_timeout_ms
+    )
+
+
+def handle_dp_rl_job(redis_conn, all_router_modules, str_job, job_timeout_ms):
+    logger = logging.getLogger("control_module_router")
+    logger.info(f"Got a dp_rl job {str_job.decode('utf-8')}")
+    control_router_get_route_job = json.loads(str_job.decode("utf-8"))
+    pose_1 = control_router_get_route_job[0]
+    pose_2 = control_router_get_route_job[1]
+    fleet_name = control_router_get_route_job[2]
+    job_id = control_router_get_route_job[3]
+
+    dp_rl_result = [[], [], [], 0]
+    if not are_poses_close(pose_1, pose_2):
+        try:
+            rm = all_router_modules.get_router_module(fleet_name)
+            final_route, visa_obj, rl = rm.get_route(pose_1, pose_2)
+            x_vals, y_vals, t_vals, _ = get_dense_path(final_route)
+            dp_rl_result = [
+                x_vals.tolist(),
+                y_vals.tolist(),
+                t_vals.tolist(),
+                rl,
+            ]
+        except Exception as e:
+            logger.info(
+                f"unable to find route between {pose_1} and {pose_2} of {fleet_name} \n Exception {e}"
+            )
+
+    push_job_result(
+        redis_conn, f"result_dp_rl_job_{job_id}", json.dumps(dp_rl_result), job_timeout_ms
+    )
+
+
+job_handlers = {
+    RouterJobQueues.MAP_UPDATE: handle_map_update,
+    RouterJobQueues.ROUTE_LENGTH: handle_rl_job,
+    RouterJobQueues.ROUTE_LENGTH_MATRIX: handle_rl_matrix_job,
+    RouterJobQueues.ROUTE_LENGTH_PAIRS: handle_rl_pairs_job,
+    RouterJobQueues.ROUTE_WPS: handle_wps_job,
+    RouterJobQueues.DENSE_PATH: handle_dp_rl_job,
+}
+
+
 @proc_retry()
 @report_error
-def start_router_module():
+def start_router_worker(shard):
+    # serves route jobs of the fleets assigned to the shard, returns on a map update
     with redis.from_url(os.getenv("FM_REDIS_URI")) as redis_conn:
         logger = logging.getLogger("control_module_router")
-        all_router_modules = init_routers()
-        logger.info(f"Intialized the router modules")
+        fleet_names = [
+            fleet_name.decode()
+            for fleet_name, fleet_shard in redis_conn.hgetall(
+                RouterPoolKeys.FLEET_SHARDS
+            ).items()
+            if int(fleet_shard) == shard
+        ]
+        all_router_modules = init_routers(fleet_names)
+        job_timeout_ms = int(redis_conn.get("default_job_timeout_ms").decode())
+        job_queues = get_worker_job_queues(shard)
+        worker_key = f"{RouterPoolKeys.WORKER}:{shard}"
+        redis_conn.hset(
+            worker_key,
+            mapping={
+                "pid": os.getpid(),
+                "fleets": json.dumps(fleet_names),
+                "started_at": time.time(),
+                "heartbeat": time.time(),
+                "jobs_served": 0,
+            },
+        )
+        logger.info(f"Intialized router worker {shard} for fleets {fleet_names}")
+
+        station_rl_step_at = time.time()
         while True:
-            add_router_for = redis_conn.get("add_router_for")
-            update_router_for = redis_conn.get("update_router_for")
-
-            if add_router_for is not None:
-                fleet_name = add_router_for.decode()
-                all_router_modules.add_router_module(fleet_name)
-                redis_conn.delete("add_router_for")
-                logger.info(f"Added router module for {fleet_name}")
-
-            if update_router_for is not None:
-                fleet_name = update_router_for.decode()
-                all_router_modules.add_router_module(fleet_name)
-                redis_conn.delete("update_router_for")
-                logger.info(f"Updated router module for {fleet_name}")
-
-            keys = redis_conn.keys("control_router_rl_job_*")
-            job_values = redis_conn.mget(keys)
-
-            for key, str_job in zip(keys, job_values):
-                logger.info(f"Got a route length estimation job {str_job.decode('utf-8')}")
-                control_router_rl_job = json.loads(str_job.decode("utf-8"))
-                pose_1 = control_router_rl_job[0]
-                pose_2 = control_router_rl_job[1]
-                fleet_name = control_router_rl_job[2]
-                job_id = control_router_rl_job[3]
-                route_length = 0
-                if not are_poses_close(pose_1, pose_2):
-                    try:
-                        route_length = redis_conn.get(f"rl_{str(pose_1)}_{str(pose_2)}")
-                        rm = all_router_modules.get_router_module(fleet_name)
-                        if route_length is None:
-                            route_length = rm.get_route_length(pose_1, pose_2)
-                            redis_conn.set(f"rl_{str(pose_1)}_{str(pose_2)}", route_length)
-                        else:
-                            route_length = float(route_length)
-                    except Exception as e:
-                        logger.info(
-                            f"unable to find route length between {pose_1} and {pose_2} of {fleet_name} \n Exception {e}"
-                        )
-                        route_length = json.dumps(np.inf)
+            # blocks until a job is pushed to any of the worker queues, no polling
+            pending = all_router_modules.has_pending_station_route_lengths()
+            job = redis_conn.blpop(
+                job_queues, timeout=STATION_RL_BLOCK_TIMEOUT if pending else BLOCK_TIMEOUT
+            )
+            if pending and (
+                job is None or time.time() - station_rl_step_at > STATION_RL_STEP_INTERVAL
+            ):
+                all_router_modules.update_station_route_lengths()
+                station_rl_step_at = time.time()
 
-                redis_conn.setex(
-                    f"result_{job_id}",
-                    int(redis_conn.get("default_job_timeout_ms").decode()),
-                    route_length,
-                )
+            if job is None:
+                redis_conn.hset(worker_key, "heartbeat", time.time())
+                continue
 
-                logger.info(f"Result : {control_router_rl_job} - {route_length}")
-                redis_conn.delete(key)
-
-            keys = redis_conn.keys("control_router_wps_job_*")
-            job_values = redis_conn.mget(keys)
-
-            for key, str_job in zip(keys, job_values):
-                try:
-                    logger.info(
-                        f"got a route preview estimation job {str_job.decode('utf-8')}"
-                    )
-                    control_router_wps_job = json.loads(str_job.decode("utf-8"))
-                    station_poses = control_router_wps_job[0]
-                    fleet_name = control_router_wps_job[1]
-                    job_id = control_router_wps_job[2]
-                    rm = all_router_modules.get_router_module(fleet_name)
-                    start_pose = station_poses[0]
-                    dest_poses = station_poses[1:]
-                    wps_list = rm.get_path_wps(start_pose, dest_poses)
-                    logger.info(f"result of wps req: {wps_list}")
-                    redis_conn.delete(key)
-
-                except Exception as e:
-                    logger.info(
-                        f"unable to get route for poses {station_poses} \n Exception {e}"
-                    )
-                    wps_list = []
-
-                redis_conn.setex(
-                    f"result_wps_job_{job_id}",
-                    int(redis_conn.get("default_job_timeout_ms").decode()),
-                    json.dumps(wps_list),
-                )
+            queue_name, str_job = job
+            job_queue = queue_name.decode().rsplit(":", 1)[0]
+            job_handler = job_handlers[job_queue]
+            if job_handler(redis_conn, all_router_modules, str_job, job_timeout_ms):
+                return
+
+            with redis_conn.pipeline() as pipe:
+                pipe.hset(worker_key, "heartbeat", time.time())
+                pipe.hincrby(worker_key, "jobs_served", 1)
+                pipe.execute()
+
+
+def get_num_router_workers():
+    with FMMongo() as fm_mongo:
+        optimal_dispatch_config = fm_mongo.get_document_from_fm_config("optimal_dispatch")
+    return optimal_dispatch_config.get("router_workers", DEFAULT_NUM_ROUTER_WORKERS)
+
+
+def assign_fleet_shards(redis_conn, fleet_names, num_workers):
+    # fleets are spread evenly across the workers
+    fleet_shards = {
+        fleet_name: i % num_workers for i, fleet_name in enumerate(sorted(fleet_names))
+    }
+    redis_conn.delete(RouterPoolKeys.FLEET_SHARDS)
+    if fleet_shards:
+        redis_conn.hset(RouterPoolKeys.FLEET_SHARDS, mapping=fleet_shards)
+    return fleet_shards
+
+
+def get_shard_for_new_fleet(fleet_shards, num_workers):
+    num_fleets = [0] * num_workers
+    for shard in fleet_shards.values():
+        num_fleets[shard] += 1
+    return num_fleets.index(min(num_fleets))
+
+
+def start_worker_process(shard):
+    worker = Process(
+        target=start_router_worker, args=(shard,), name=f"router_worker_{shard}"
+    )
+    worker.start()
+    return worker
+
+
+def check_worker_processes(redis_conn, workers, stopping):
+    # restarts the workers which exited, terminates the ones which didn't exit within the
+    # job timeout, doesn't wait for a worker to exit
+    logger = logging.getLogger("control_module_router")
+    for shard, worker in workers.items():
+        deadline = stopping.get(shard)
+        if worker.is_alive():
+            if deadline is None or time.time() < deadline:
+                continue
+            logger.info(f"router worker {shard} did not exit, terminating it")
+            worker.terminate()
+            worker.join(timeout=1)
+        elif deadline is None:
+            logger.info(
+                f"router worker {shard} ended with exitcode: {worker.exitcode}, restarting it"
+            )
+
+        stopping.pop(shard, None)
+        workers[shard] = start_worker_process(shard)
+        redis_conn.hincrby(f"{RouterPoolKeys.WORKER}:{shard}", "restarts", 1)
+        logger.info(f"restarted router worker {shard}, pid: {workers[shard].pid}")
 
-            keys = redis_conn.keys("control_router_dp_rl_job_*")
-            job_values = redis_conn.mget(keys)
-
-            for key, str_job in zip(keys, job_values):
-                logger.info(f"Got a dp_rl job {str_job.decode('utf-8')}")
-                control_router_get_route_job = json.loads(str_job.decode("utf-8"))
-                pose_1 = control_router_get_route_job[0]
-                pose_2 = control_router_get_route_job[1]
-                fleet_name = control_router_get_route_job[2]
-                job_id = control_router_get_route_job[3]
-
-                route_length = 0
-                dp_rl_result = [[], [], [], 0]
-                if not are_poses_close(pose_1, pose_2):
-                    try:
-                        rm = all_router_modules.get_router_module(fleet_name)
-                        final_route, visa_obj, rl = rm.get_route(pose_1, pose_2)
-                        x_vals, y_vals, t_vals, _ = get_dense_path(final_route)
-                        dp_rl_result = [
-                            x_vals.tolist(),
-                            y_vals.tolist(),
-                            t_vals.tolist(),
-                            rl,
-                        ]
-                    except Exception as e:
-                        logger.info(
-                            f"unable to find route between {pose_1} and {pose_2} of {fleet_name} \n Exception {e}"
-                        )
 
-                redis_conn.setex(
-                    f"result_dp_rl_job_{job_id}",
-                    int(redis_conn.get("default_job_timeout_ms").decode()),
-                    json.dumps(dp_rl_result),
+def update_pool_health(redis_conn, workers, fleet_shards):
+    # queue depth, liveness and load of every worker, reported by fm_health_stats
+    with redis_conn.pipeline() as pipe:
+        for shard in workers:
+            pipe.hgetall(f"{RouterPoolKeys.WORKER}:{shard}")
+            for job_queue in get_worker_job_queues(shard):
+                pipe.llen(job_queue)
+        results = pipe.execute()
+
+    pool_health = []
+    num_queues = len(WORKER_JOB_QUEUES)
+    for k, (shard, worker) in enumerate(workers.items()):
+        worker_info = {
+            key.decode(): val.decode()
+            for key, val in results[k * (num_queues + 1)].items()
+        }
+        queue_depths = results[k * (num_queues + 1) + 1 : (k + 1) * (num_queues + 1)]
+        heartbeat = float(worker_info.get("heartbeat", 0))
+        pool_health.append(
+            {
+                "shard": shard,
+                "pid": worker.pid,
+                "alive": worker.is_alive(),
+                "fleets": [
+                    fleet_name
+                    for fleet_name, fleet_shard in fleet_shards.items()
+                    if fleet_shard == shard
+                ],
+                "queue_depth": dict(zip(WORKER_JOB_QUEUES, queue_depths)),
+                "jobs_served": int(worker_info.get("jobs_served", 0)),
+                "restarts": int(worker_info.get("restarts", 0)),
+                "secs_since_heartbeat": round(time.time() - heartbeat, 1),
+            }
+        )
+
+    redis_conn.set(RouterPoolKeys.POOL_HEALTH, json.dumps(pool_health))
+
+
+@proc_retry()
+@report_error
+def start_router_module():
+    # router pool - fleets are sharded across router worker processes, each loading only
+    # the maps of its fleets. A map update restarts the worker serving the fleet
+    with redis.from_url(os.getenv("FM_REDIS_URI")) as redis_conn:
+        logger = logging.getLogger("control_module_router")
+        with DBSession() as dbsession:
+            fleet_names = dbsession.get_all_fleet_names()
+
+        # sized from the config alone, fleets added later go to the least loaded worker
+        num_workers = max(1, get_num_router_workers())
+        fleet_shards = assign_fleet_shards(redis_conn, fleet_names, num_workers)
+        job_timeout_ms = int(redis_conn.get("default_job_timeout_ms").decode())
+
+        workers = {}
+        # shard: time by which a worker asked to exit has to, see check_worker_processes
+        stopping = {}
+        try:
+            for shard in range(num_workers):
+                redis_conn.delete(f"{RouterPoolKeys.WORKER}:{shard}")
+                workers[shard] = start_worker_process(shard)
+            logger.info(
+                f"started {num_workers} router workers, fleet shards: {fleet_shards}"
+            )
+
+            while True:
+                job = redis_conn.blpop(
+                    RouterJobQueues.MAP_UPDATE, timeout=1 if stopping else BLOCK_TIMEOUT
                 )
-                redis_conn.delete(key)
+                if job is not None:
+                    fleet_name = job[1].decode()
+                    if fleet_name not in fleet_shards:
+                        fleet_shards[fleet_name] = get_shard_for_new_fleet(
+                            fleet_shards, num_workers
+                        )
+                        redis_conn.hset(
+                            RouterPoolKeys.FLEET_SHARDS,
+                            fleet_name,
+                            fleet_shards[fleet_name],
+                        )
+                    shard = fleet_shards[fleet_name]
+                    # station route lengths of the old map aren't served meanwhile
+                    srl.invalidate_station_route_lengths(fleet_name)
+                    if shard in stopping:
+                        # the worker started next loads the updated map
+                        logger.info(f"map update for {fleet_name}, worker {shard} exiting")
+                    else:
+                        logger.info(
+                            f"map update for {fleet_name}, restarting router worker {shard}"
+                        )
+                        redis_conn.rpush(
+                            f"{RouterJobQueues.MAP_UPDATE}:{shard}", fleet_name
+                        )
+                        stopping[shard] = time.time() + job_timeout_ms / 1000
 
-            time.sleep(0.2)
+                check_worker_processes(redis_conn, workers, stopping)
+                update_pool_health(redis_conn, workers, fleet_shards)
+        finally:
+            for worker in workers.values():
+                worker.terminate()
@@ -0,0 +1,167 @@
+import os
+import time
+import datetime
+import redis
+import logging
+import logging.config
+
+# ati code imports
+import utils.log_utils as lu
+import utils.util as utils_util
+import models.misc_models as mm
+from models.db_session import DBSession
+from models.mongo_client import FMMongo
+from utils.redis_pool import get_redis_conn
+from optimal_dispatch.dispatcher import OptimalDispatch
+
+# get log config
+logging.config.dictConfig(lu.get_log_config_dict())
+
+
+# Handlers don't run optimal dispatch themselves, they mark the fleets which need one as
+# dirty(trigger_optimal_dispatch). The scheduler process collects the triggers, waits till
+# no new trigger has come for a fleet for debounce_window_ms(or the fleet has been dirty for
+# MAX_DELAY_FACTOR x debounce_window_ms) and runs a single optimal dispatch for all of them.
+# Fleets are dispatched one after the other, so there is at most one run per fleet at a time.
+
+OPTIMAL_DISPATCH_TRIGGERS = "optimal_dispatch_triggers"
+DEFAULT_DEBOUNCE_WINDOW_MS = 500
+MAX_DELAY_FACTOR = 5
+
+# seconds to block on the trigger list when no fleet is dirty
+BLOCK_TIMEOUT = 5
+
+# seconds the scheduler uses the optimal dispatch config before reading it again
+CONFIG_REFRESH_SEC = 10
+
+
+def get_metrics_key(fleet_name):
+    return f"optimal_dispatch_metrics:{fleet_name}"
+
+
+def trigger_optimal_dispatch(fleet_names, redis_conn=None):
+    if not fleet_names:
+        return
+
+    if redis_conn is None:
+        redis_conn = get_redis_conn()
+
+    with redis_conn.pipeline() as pipe:
+        for fleet_name in fleet_names:
+            pipe.hincrby(get_metrics_key(fleet_name), "triggers", 1)
+            pipe.rpush(OPTIMAL_DISPATCH_TRIGGERS, fleet_name)
+        pipe.execute()
+
+
+def get_optimal_dispatch_config():
+    with FMMongo() as fm_mongo:
+        return fm_mongo.get_document_from_fm_config("optimal_dispatch")
+
+
+def run_optimal_dispatch(fleet_name, optimal_dispatch_config):
+    try:
+        with DBSession() as dbsession:
+            optimal_dispatch = OptimalDispatch(optimal_dispatch_config)
+            optimal_dispatch.run(dbsession, [fleet_name])
+        return True
+    except Exception as e:
+        logging.getLogger("optimal_dispatch").error(f"couldn't run optimal dispatch, {e}")
+        with DBSession() as dbsession:
+            utils_util.maybe_add_notification(
+                dbsession,
+                [fleet_name],
+                f"Unable to run optimal dispatch for fleet {[fleet_name]}",
+                mm.NotificationLevels.alert,
+                mm.NotificationModules.optimal_dispatch,
+            )
+        return False
+
+
+def collect_triggers(redis_conn, dirty_fleets, timeout):
+    # blocks for atmost timeout secs for the first trigger, drains the rest without blocking
+    if timeout >= 1:
+        trigger = redis_conn.blpop(OPTIMAL_DISPATCH_TRIGGERS, timeout=int(timeout))
+        triggers = [trigger[1]] if trigger else []
+    else:
+        time.sleep(max(timeout, 0))
+        triggers = []
+
+    while True:
+        trigger = redis_conn.lpop(OPTIMAL_DISPATCH_TRIGGERS)
+        if trigger is None:
+            break
+        triggers.append(trigger)
+
+    now = time.time()
+    for trigger in triggers:
+        fleet_name = trigger.decode()
+        dirty_fleet = dirty_fleets.setdefault(
+            fleet_name, {"first_trigger": now, "last_trigger": now, "num_triggers": 0}
+        )
+        dirty_fleet["last_trigger"] = now
+        dirty_fleet["num_triggers"] += 1
+
+
+def get_due_time(dirty_fleet, debounce_window):
+    return min(
+        dirty_fleet["last_trigger"] + debounce_window,
+        dirty_fleet["first_trigger"] + MAX_DELAY_FACTOR * debounce_window,
+    )
+
+
+@utils_util.proc_retry()
+@utils_util.report_error
+def start_optimal_dispatch_scheduler():
+    logger = logging.getLogger("optimal_dispatch")
+    dirty_fleets = {}
+    with redis.from_url(os.getenv("FM_REDIS_URI")) as redis_conn:
+        logger.info("started optimal dispatch scheduler")
+        config_read_at = 0
+        while True:
+            if time.time() - config_read_at > CONFIG_REFRESH_SEC:
+                optimal_dispatch_config = get_optimal_dispatch_config()
+                config_read_at = time.time()
+            debounce_window = (
+                optimal_dispatch_config.get("debounce_window_ms", DEFAULT_DEBOUNCE_WINDOW_MS)
+                / 1000
+            )
+
+            timeout = BLOCK_TIMEOUT
+            if dirty_fleets:
+                next_due_time = min(
+                    get_due_time(dirty_fleet, debounce_window)
+                    for dirty_fleet in dirty_fleets.values()
+                )
+                timeout = min(BLOCK_TIMEOUT, next_due_time - time.time())
+            collect_triggers(redis_conn, dirty_fleets, timeout)
+
+            for fleet_name in list(dirty_fleets.keys()):
+                dirty_fleet = dirty_fleets[fleet_name]
+                if get_due_time(dirty_fleet, debounce_window) > time.time():
+                    continue
+
+                del dirty_fleets[fleet_name]
+                t1 = time.time()
+                success = run_optimal_dispatch(fleet_name, optimal_dispatch_config)
+                run_time_ms = round((time.time() - t1) * 1000, 1)
+                logger.info(
+                    f"ran optimal dispatch for {fleet_name} in {run_time_ms} ms, coalesced {dirty_fleet['num_triggers']} triggers"
+                )
+
+                with redis_conn.pipeline() as pipe:
+                    metrics_key = get_metrics_key(fleet_name)
+                    pipe.hincrby(metrics_key, "runs", 1)
+                    pipe.hincrby(metrics_key, "coalesced", dirty_fleet["num_triggers"] - 1)
+                    if not success:
+                        pipe.hincrby(metrics_key, "failures", 1)
+                    pipe.hset(
+                        metrics_key,
+                        mapping={
+                            "last_run_ms": run_time_ms,
+                            "last_run_at": utils_util.dt_to_str(datetime.datetime.now()),
+                            "last_trigger_delay_ms": round(
+                                (t1 - dirty_fleet["first_trigger"]) * 1000, 1
+                            ),
+                        },
+                    )
+                    pipe.execute()
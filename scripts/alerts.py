@@ -1,4 +1,3 @@
-import ast
 import logging
 import logging.config
 import logging
@@ -9,6 +8,7 @@ from slack_sdk.webhook import WebhookClient
 import asyncio
 
 # ati code imports
+import utils.comms as utils_comms
 from utils.util import report_error
 import utils.log_utils as lu
 import models.misc_models as mm
@@ -38,7 +38,7 @@ async def forward_alerts(alert_config):
     while True:
         message = await psub.get_message(ignore_subscribe_messages=True, timeout=5)
         if message:
-            data = ast.literal_eval(message["data"])
+            data = utils_comms.decode_msg(message["data"])
             if data["type"] != mm.NotificationLevels.alert:
                 continue
 
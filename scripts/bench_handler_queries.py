@@ -0,0 +1,82 @@
+import sys
+import datetime
+import os
+import json
+
+# ati code imports
+import utils.util as utils_util
+from handlers.default.handlers import Handlers
+from handlers.default.query_budgets import (
+    QUERY_BUDGETS,
+    count_queries,
+    get_sherpa_status_msg,
+    get_trip_status_msg,
+)
+from models.db_session import DBSession
+
+
+# Counts the SQL statements run by Handlers for sherpa_status, trip_status msgs of the
+# sherpas in the DB and checks them against QUERY_BUDGETS, see
+# handlers/default/query_budgets.py. Msgs repeat the current state of the sherpa(pose,
+# mode, trip progress), the changes are rolled back. Run it on a test setup, the handlers
+# may still send requests to the sherpas.
+# usage: python scripts/bench_handler_queries.py [num_sherpas]
+# exits with 1 if a msg went over its budget, results are saved to
+# FM_LOG_DIR/bench_handler_queries.json
+
+
+def run_benchmark(num_sherpas):
+    handler = Handlers()
+    msgs = []
+    with DBSession() as dbsession:
+        for sherpa_name in dbsession.get_all_sherpa_names()[:num_sherpas]:
+            sherpa, ongoing_trip, _, trip_analytics = dbsession.get_sherpa_working_set(
+                sherpa_name
+            )
+            if sherpa.status is None or sherpa.status.pose is None:
+                continue
+            msgs.append(get_sherpa_status_msg(sherpa))
+            if ongoing_trip:
+                msgs.append(get_trip_status_msg(sherpa, ongoing_trip, trip_analytics))
+
+    results = []
+    over_budget = False
+    for msg in msgs:
+        query_counter = count_queries(handler, msg)
+        budget = QUERY_BUDGETS[msg.type]
+        try:
+            query_counter.check_budget(budget, f"{msg.type} of {msg.source}")
+        except AssertionError as e:
+            over_budget = True
+            print(e)
+        results.append(
+            {
+                "msg_type": msg.type,
+                "sherpa_name": msg.source,
+                "num_statements": query_counter.count,
+                "budget": budget,
+            }
+        )
+
+    result = {
+        "msgs": results,
+        "over_budget": over_budget,
+        "fm_tag": os.getenv("FM_TAG"),
+        "timestamp": utils_util.dt_to_str(datetime.datetime.now()),
+    }
+    return result
+
+
+if __name__ == "__main__":
+    num_sherpas = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+
+    result = run_benchmark(num_sherpas)
+    print(json.dumps(result, indent=2))
+
+    results_path = os.path.join(
+        os.getenv("FM_LOG_DIR", "."), "bench_handler_queries.json"
+    )
+    with open(results_path, "a") as f:
+        f.write(json.dumps(result) + "\n")
+
+    sys.exit(1 if result["over_budget"] else 0)
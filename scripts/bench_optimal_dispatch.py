@@ -0,0 +1,119 @@
+import sys
+import os
+import time
+import json
+import logging
+import datetime
+import numpy as np
+
+# ati code imports
+from core.constants import FleetStatus
+from optimal_dispatch.dispatcher import OptimalDispatch
+import utils.util as utils_util
+
+
+ASSIGNMENT_METHODS = ["hungarian", "linear_sum_assignment", "sparse_linear_sum_assignment"]
+
+
+# Measures the CPU time of optimal dispatch on a synthetic dispatch run, no DB/router
+# needed, route lengths are random. Cost matrix assembly and every assignment backend
+# are timed, assignments of the backends are checked against hungarian(dlib).
+# usage: python scripts/bench_optimal_dispatch.py [num_trips] [num_sherpas] [num_runs]
+# results are saved to FM_LOG_DIR/bench_optimal_dispatch.json
+
+
+def get_synthetic_optimal_dispatch(num_trips, num_sherpas, rng):
+    optimal_dispatch = OptimalDispatch(
+        {
+            "method": "hungarian",
+            "prioritise_waiting_stations": True,
+            "eta_power_factor": 0.1,
+            "priority_power_factor": 0.7,
+            "max_trips_to_consider": num_trips,
+        }
+    )
+    optimal_dispatch.logger = logging.getLogger("optimal_dispatch")
+
+    stations = [f"station_{k}" for k in range(50)]
+    for j in range(num_sherpas):
+        optimal_dispatch.sherpa_q[f"sherpa_{j}"] = {
+            "pose": rng.uniform(0, 100, 3).tolist(),
+            "remaining_eta": float(rng.uniform(0, 300)),
+            "exclude_stations": [str(s) for s in rng.choice(stations, 2, replace=False)],
+            "fleet_status": FleetStatus.STARTED,
+            "parking_mode": bool(rng.uniform() < 0.1),
+        }
+
+    sherpa_names = list(optimal_dispatch.sherpa_q.keys())
+    for i in range(num_trips):
+        pinned = rng.uniform() < 0.05
+        optimal_dispatch.pickup_q[i] = {
+            "pose": rng.uniform(0, 100, 3).tolist(),
+            "priority": float(rng.uniform(1, 5)),
+            "route": [str(s) for s in rng.choice(stations, 3, replace=False)],
+            "sherpa_name": str(rng.choice(sherpa_names)) if pinned else None,
+            "booked_by": "bench",
+        }
+
+    return optimal_dispatch
+
+
+def run_benchmark(num_trips, num_sherpas, num_runs):
+    rng = np.random.default_rng(0)
+    optimal_dispatch = get_synthetic_optimal_dispatch(num_trips, num_sherpas, rng)
+    route_lengths = rng.uniform(10, 500, (num_trips, num_sherpas))
+
+    cost_matrix_ms = []
+    for _ in range(num_runs):
+        t1 = time.process_time()
+        feasible = optimal_dispatch.get_feasibility_mask()
+        _, _, priority_normalised_cost_matrix = optimal_dispatch.get_cost_matrices(
+            feasible, route_lengths
+        )
+        cost_matrix_ms.append((time.process_time() - t1) * 1000)
+
+    pickups = list(optimal_dispatch.pickup_q.keys())
+    sherpas = list(optimal_dispatch.sherpa_q.keys())
+    assignment_results = {}
+    expected_assignment = None
+    for method in ASSIGNMENT_METHODS:
+        assign = getattr(optimal_dispatch, method)
+        assignment_ms = []
+        for _ in range(num_runs):
+            t1 = time.process_time()
+            assignment, _ = assign(priority_normalised_cost_matrix, pickups, sherpas)
+            assignment_ms.append((time.process_time() - t1) * 1000)
+
+        if expected_assignment is None:
+            expected_assignment = assignment
+        assignment_results[method] = {
+            "cpu_ms_p50": round(float(np.percentile(assignment_ms, 50)), 3),
+            "cpu_ms_max": round(float(np.max(assignment_ms)), 3),
+            "num_assigned": len(assignment),
+            "same_as_hungarian": assignment == expected_assignment,
+        }
+
+    result = {
+        "num_trips": num_trips,
+        "num_sherpas": num_sherpas,
+        "num_runs": num_runs,
+        "cost_matrix_cpu_ms_p50": round(float(np.percentile(cost_matrix_ms, 50)), 3),
+        "cost_matrix_cpu_ms_max": round(float(np.max(cost_matrix_ms)), 3),
+        "assignment": assignment_results,
+        "fm_tag": os.getenv("FM_TAG"),
+        "timestamp": utils_util.dt_to_str(datetime.datetime.now()),
+    }
+    return result
+
+
+if __name__ == "__main__":
+    num_trips = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    num_sherpas = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    num_runs = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+
+    result = run_benchmark(num_trips, num_sherpas, num_runs)
+    print(json.dumps(result, indent=2))
+
+    results_path = os.path.join(os.getenv("FM_LOG_DIR", "."), "bench_optimal_dispatch.json")
+    with open(results_path, "a") as f:
+        f.write(json.dumps(result) + "\n")
@@ -0,0 +1,84 @@
+import sys
+import datetime
+import os
+import time
+import json
+import asyncio
+import redis
+import numpy as np
+
+# ati code imports
+from models.request_models import FMHealthCheck
+from app.routers.dependencies import process_req_with_response
+from utils.rq_utils import Queues
+import utils.util as utils_util
+
+
+# Measures the latency of app.routers.dependencies.process_req_with_response, the path of
+# every synchronous HTTP API call(enqueue, handler run by the rq worker, wait for the
+# completion), against running rq workers. FMHealthCheck is used as the request as it
+# needs no fleet/sherpa and the handler returns right away, so the latency is mostly the
+# overhead of the request path. Redis commands processed per request are reported too.
+# usage: python scripts/bench_process_req.py [num_samples] [concurrency]
+# Run once on the old and once on the new build, results are saved to
+# FM_LOG_DIR/bench_process_req.json for comparison.
+
+
+def get_total_commands(redis_conn):
+    return int(redis_conn.info("stats")["total_commands_processed"])
+
+
+async def timed_request(queue, latencies_ms):
+    t1 = time.perf_counter()
+    await process_req_with_response(queue, FMHealthCheck(ttl=10), "self")
+    latencies_ms.append((time.perf_counter() - t1) * 1000)
+
+
+async def run_requests(queue, num_samples, concurrency):
+    latencies_ms = []
+    for i in range(0, num_samples, concurrency):
+        batch_size = min(concurrency, num_samples - i)
+        await asyncio.gather(
+            *[timed_request(queue, latencies_ms) for _ in range(batch_size)]
+        )
+    return latencies_ms
+
+
+def run_benchmark(num_samples, concurrency):
+    queue = Queues.queues_dict["misc_handler"]
+    with redis.from_url(os.getenv("FM_REDIS_URI")) as redis_conn:
+        commands_before = get_total_commands(redis_conn)
+        t1 = time.perf_counter()
+        latencies_ms = asyncio.run(run_requests(queue, num_samples, concurrency))
+        total_time = time.perf_counter() - t1
+        commands_after = get_total_commands(redis_conn)
+
+    latencies_ms = np.array(latencies_ms)
+    result = {
+        "num_samples": num_samples,
+        "concurrency": concurrency,
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 3),
+        "p99_ms": round(float(np.percentile(latencies_ms, 99)), 3),
+        "max_ms": round(float(np.max(latencies_ms)), 3),
+        "mean_ms": round(float(np.mean(latencies_ms)), 3),
+        "requests_per_sec": round(num_samples / total_time, 1),
+        # includes the commands of the rq workers and the rest of FM, if running
+        "redis_commands_per_request": round(
+            (commands_after - commands_before) / num_samples, 1
+        ),
+        "fm_tag": os.getenv("FM_TAG"),
+        "timestamp": utils_util.dt_to_str(datetime.datetime.now()),
+    }
+    return result
+
+
+if __name__ == "__main__":
+    num_samples = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+
+    result = run_benchmark(num_samples, concurrency)
+    print(json.dumps(result, indent=2))
+
+    results_path = os.path.join(os.getenv("FM_LOG_DIR", "."), "bench_process_req.json")
+    with open(results_path, "a") as f:
+        f.write(json.dumps(result) + "\n")
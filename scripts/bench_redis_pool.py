@@ -0,0 +1,81 @@
+import sys
+import datetime
+import os
+import time
+import json
+import redis
+import numpy as np
+
+# ati code imports
+import utils.util as utils_util
+from utils.redis_pool import get_redis_conn
+
+
+# Measures the per message overhead of publishing to redis the way utils.comms did
+# before(new connection per message, redis.from_url) against the process wide pool
+# (utils.redis_pool.get_redis_conn). Messages are published to a channel nobody
+# subscribes to, so only the client side cost is measured.
+# usage: python scripts/bench_redis_pool.py [num_msgs]
+# results are saved to FM_LOG_DIR/bench_redis_pool.json
+
+
+BENCH_CHANNEL = "channel:bench_redis_pool"
+
+
+def publish_with_new_connection(msg):
+    pub = redis.from_url(os.getenv("FM_REDIS_URI"), decode_responses=True)
+    pub.publish(BENCH_CHANNEL, msg)
+
+
+def publish_with_pool(msg):
+    pub = get_redis_conn(decode_responses=True)
+    pub.publish(BENCH_CHANNEL, msg)
+
+
+def time_publish(publish, num_msgs):
+    msg = str({"type": "bench", "data": "x" * 256})
+    latencies_ms = []
+    for _ in range(num_msgs):
+        t1 = time.perf_counter()
+        publish(msg)
+        latencies_ms.append((time.perf_counter() - t1) * 1000)
+
+    latencies_ms = np.array(latencies_ms)
+    return {
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 4),
+        "p99_ms": round(float(np.percentile(latencies_ms, 99)), 4),
+        "mean_ms": round(float(np.mean(latencies_ms)), 4),
+    }
+
+
+def get_connections_received(redis_conn):
+    return int(redis_conn.info("stats")["total_connections_received"])
+
+
+def run_benchmark(num_msgs):
+    result = {"num_msgs": num_msgs}
+    with redis.from_url(os.getenv("FM_REDIS_URI")) as redis_conn:
+        for name, publish in [
+            ("new_connection", publish_with_new_connection),
+            ("pool", publish_with_pool),
+        ]:
+            connections_before = get_connections_received(redis_conn)
+            result[name] = time_publish(publish, num_msgs)
+            result[name]["connections_opened"] = (
+                get_connections_received(redis_conn) - connections_before
+            )
+
+    result["fm_tag"] = os.getenv("FM_TAG")
+    result["timestamp"] = utils_util.dt_to_str(datetime.datetime.now())
+    return result
+
+
+if __name__ == "__main__":
+    num_msgs = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+    result = run_benchmark(num_msgs)
+    print(json.dumps(result, indent=2))
+
+    results_path = os.path.join(os.getenv("FM_LOG_DIR", "."), "bench_redis_pool.json")
+    with open(results_path, "a") as f:
+        f.write(json.dumps(result) + "\n")
@@ -0,0 +1,130 @@
+import sys
+import datetime
+import os
+import time
+import json
+import redis
+import numpy as np
+
+# ati code imports
+from models.db_session import DBSession
+import utils.util as utils_util
+
+# router job queues, the router pool and the route length cache are not in the old build
+try:
+    from core.constants import RouterJobQueues, RouterPoolKeys
+    from utils.route_length_cache import get_stats_key
+except ImportError:
+    RouterJobQueues = RouterPoolKeys = get_stats_key = None
+
+
+# Measures the latency of utils.util.get_route_length as seen by a caller (handlers,
+# optimal dispatch) against a running router module.
+# usage: python scripts/bench_route_length.py <fleet_name> [num_samples] [--no-cache]
+# --no-cache reloads the map of the fleet before the run, which evicts the route length
+# cache of the fleet, samples are cold until all the station pairs have been requested.
+# On the old build(no router pool), the cached route length is cleared before every call
+# instead, every sample is a round trip through the router module.
+# Route length cache hits/misses during the run are reported along with the latencies,
+# when the build has the route length cache.
+# Run once on the old and once on the new build, results are saved to
+# FM_LOG_DIR/bench_route_length.json for comparison.
+
+
+def get_station_pairs(fleet_name):
+    with DBSession() as dbsession:
+        stations = dbsession.get_all_stations_in_fleet(fleet_name)
+        poses = [station.pose for station in stations if station.pose]
+
+    pairs = []
+    for i in range(len(poses)):
+        for j in range(len(poses)):
+            if i != j:
+                pairs.append((poses[i], poses[j]))
+    return pairs
+
+
+def has_router_pool(redis_conn, fleet_name):
+    return RouterPoolKeys is not None and redis_conn.hexists(
+        RouterPoolKeys.FLEET_SHARDS, fleet_name
+    )
+
+
+def clear_cached_route_length(redis_conn, pose_1, pose_2):
+    # route length cache of the old build
+    redis_conn.delete(f"rl_{str(pose_1)}_{str(pose_2)}")
+
+
+def reload_fleet_map(redis_conn, fleet_name, timeout=120):
+    # map update restarts the router worker of the fleet, wait for the new worker
+    shard = int(redis_conn.hget(RouterPoolKeys.FLEET_SHARDS, fleet_name))
+    worker_key = f"{RouterPoolKeys.WORKER}:{shard}"
+    started_at = redis_conn.hget(worker_key, "started_at")
+    redis_conn.rpush(RouterJobQueues.MAP_UPDATE, fleet_name)
+    t1 = time.time()
+    while redis_conn.hget(worker_key, "started_at") == started_at:
+        if time.time() - t1 > timeout:
+            raise TimeoutError(f"router worker {shard} did not restart in {timeout} secs")
+        time.sleep(0.5)
+
+
+def get_cache_stats(redis_conn, fleet_name):
+    if get_stats_key is None:
+        return {}
+    stats = redis_conn.hgetall(get_stats_key(fleet_name))
+    return {key.decode(): int(val) for key, val in stats.items()}
+
+
+def run_benchmark(fleet_name, num_samples, use_cache):
+    pairs = get_station_pairs(fleet_name)
+    if not pairs:
+        raise ValueError(f"need atleast two stations in {fleet_name} to run the benchmark")
+
+    latencies_ms = []
+    with redis.from_url(os.getenv("FM_REDIS_URI")) as redis_conn:
+        clear_per_call = False
+        if not use_cache:
+            if has_router_pool(redis_conn, fleet_name):
+                reload_fleet_map(redis_conn, fleet_name)
+            else:
+                clear_per_call = True
+
+        stats_before = get_cache_stats(redis_conn, fleet_name)
+        for i in range(num_samples):
+            pose_1, pose_2 = pairs[i % len(pairs)]
+            if clear_per_call:
+                clear_cached_route_length(redis_conn, pose_1, pose_2)
+            t1 = time.perf_counter()
+            utils_util.get_route_length(pose_1, pose_2, fleet_name, redis_conn)
+            latencies_ms.append((time.perf_counter() - t1) * 1000)
+        stats_after = get_cache_stats(redis_conn, fleet_name)
+
+    latencies_ms = np.array(latencies_ms)
+    result = {
+        "fleet_name": fleet_name,
+        "num_samples": num_samples,
+        "use_cache": use_cache,
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 3),
+        "p99_ms": round(float(np.percentile(latencies_ms, 99)), 3),
+        "max_ms": round(float(np.max(latencies_ms)), 3),
+        "mean_ms": round(float(np.mean(latencies_ms)), 3),
+        "cache_stats": {
+            key: val - stats_before.get(key, 0) for key, val in stats_after.items()
+        },
+        "fm_tag": os.getenv("FM_TAG"),
+        "timestamp": utils_util.dt_to_str(datetime.datetime.now()),
+    }
+    return result
+
+
+if __name__ == "__main__":
+    fleet_name = sys.argv[1]
+    num_samples = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    use_cache = "--no-cache" not in sys.argv
+
+    result = run_benchmark(fleet_name, num_samples, use_cache)
+    print(json.dumps(result, indent=2))
+
+    results_path = os.path.join(os.getenv("FM_LOG_DIR", "."), "bench_route_length.json")
+    with open(results_path, "a") as f:
+        f.write(json.dumps(result) + "\n")
@@ -0,0 +1,126 @@
+import sys
+import datetime
+import os
+import time
+import json
+
+# ati code imports
+import core.constants as cc
+import core.handler_configuration as hc
+import models.request_models as rqm
+import utils.util as utils_util
+from models.db_session import DBSession
+from utils.redis_pool import get_redis_conn
+from utils.rq_utils import Queues
+from utils.status_ingest import push_status_msg, get_buffer_key
+
+
+# Load test of the sherpa_status fast path(utils/status_ingest.py) against running rq
+# workers. num_sherpas sherpas of the DB send sherpa_status msgs(their current pose, mode
+# fleet) at msgs_per_sec each for duration secs, the same way sherpa_ws.reader does.
+# Reports the msgs/s offered and the msgs/s the workers drained and applied, including
+# the time taken to drain the backlog after the last msg was sent.
+# usage: python scripts/bench_status_ingest.py [num_sherpas] [msgs_per_sec] [duration]
+# results are printed and appended as a json line to FM_LOG_DIR/bench_status_ingest.json
+
+# secs to wait for the workers to drain the buffered msgs after the last msg was sent
+DRAIN_TIMEOUT = 60
+
+
+def get_stats(redis_conn):
+    stats = redis_conn.hgetall(cc.StatusIngestKeys.STATS)
+    return {key.decode(): int(val) for key, val in stats.items()}
+
+
+def get_status_msgs(num_sherpas):
+    status_msgs = []
+    with DBSession() as dbsession:
+        for sherpa_status in dbsession.get_all_sherpa_status()[:num_sherpas]:
+            if sherpa_status.pose is None:
+                continue
+            status_msgs.append(
+                {
+                    "type": cc.MessageType.SHERPA_STATUS,
+                    "source": sherpa_status.sherpa_name,
+                    "sherpa_name": sherpa_status.sherpa_name,
+                    "mode": "fleet",
+                    "current_pose": sherpa_status.pose,
+                    "battery_status": -1,
+                }
+            )
+    return status_msgs
+
+
+def is_drained(redis_conn, queues):
+    return not any(
+        redis_conn.exists(get_buffer_key(queue.name)) or len(queue) for queue in queues
+    )
+
+
+def run_load_test(num_sherpas, msgs_per_sec, duration):
+    redis_conn = get_redis_conn()
+    handler_obj = hc.HandlerConfiguration.get_handler()
+    status_msgs = get_status_msgs(num_sherpas)
+    queues = [
+        Queues.queues_dict[f"{status_msg['sherpa_name']}_update_handler"]
+        for status_msg in status_msgs
+    ]
+
+    stats_before = get_stats(redis_conn)
+    num_sent = 0
+    t_start = time.time()
+    while time.time() - t_start < duration:
+        t_round = time.time()
+        for queue, status_msg in zip(queues, status_msgs):
+            status_msg["timestamp"] = time.time()
+            msg = rqm.SherpaStatusMsg.from_dict(status_msg)
+            push_status_msg(queue, handler_obj, msg, ttl=3, job_timeout=10)
+            num_sent += 1
+        time.sleep(max(0, 1 / msgs_per_sec - (time.time() - t_round)))
+    send_time = time.time() - t_start
+
+    while not is_drained(redis_conn, queues) and time.time() - t_start < (
+        duration + DRAIN_TIMEOUT
+    ):
+        time.sleep(0.1)
+    total_time = time.time() - t_start
+
+    stats_after = get_stats(redis_conn)
+    stats = {
+        key: stats_after.get(key, 0) - stats_before.get(key, 0)
+        for key in [
+            "msgs_received",
+            "msgs_drained",
+            "msgs_applied",
+            "msgs_dropped",
+            "batches",
+        ]
+    }
+
+    return {
+        "num_sherpas": len(status_msgs),
+        "msgs_per_sec_per_sherpa": msgs_per_sec,
+        "duration": duration,
+        "num_sent": num_sent,
+        "offered_msgs_per_sec": round(num_sent / send_time, 2),
+        "drained_msgs_per_sec": round(stats["msgs_drained"] / total_time, 2),
+        "applied_msgs_per_sec": round(stats["msgs_applied"] / total_time, 2),
+        "drain_lag_secs": round(total_time - send_time, 3),
+        "msgs_per_batch": round(stats["msgs_drained"] / max(stats["batches"], 1), 2),
+        "stats": stats,
+        "fm_tag": os.getenv("FM_TAG"),
+        "timestamp": utils_util.dt_to_str(datetime.datetime.now()),
+    }
+
+
+if __name__ == "__main__":
+    num_sherpas = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    msgs_per_sec = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+    duration = float(sys.argv[3]) if len(sys.argv) > 3 else 30
+
+    result = run_load_test(num_sherpas, msgs_per_sec, duration)
+    print(json.dumps(result, indent=2))
+
+    results_path = os.path.join(os.getenv("FM_LOG_DIR", "."), "bench_status_ingest.json")
+    with open(results_path, "a") as f:
+        f.write(json.dumps(result) + "\n")
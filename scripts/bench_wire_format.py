@@ -0,0 +1,76 @@
+import sys
+import ast
+import datetime
+import os
+import time
+import json
+import numpy as np
+
+# ati code imports
+import utils.comms as utils_comms
+import utils.util as utils_util
+from models.db_session import DBSession
+from scripts.periodic_updates import get_fleet_status_msg
+
+
+# Measures encode/decode cost of the pub/sub wire format on real fleet_status msgs of
+# the fleets in the DB. legacy is str(msg) + ast.literal_eval, v1 is
+# utils.comms.encode_msg/decode_msg(orjson if installed, else json).
+# usage: python scripts/bench_wire_format.py [num_runs]
+# results are saved to FM_LOG_DIR/bench_wire_format.json
+
+
+def time_codec(msg, encode, decode, num_runs):
+    encode_ms = []
+    decode_ms = []
+    for _ in range(num_runs):
+        t1 = time.perf_counter()
+        data = encode(msg)
+        encode_ms.append((time.perf_counter() - t1) * 1000)
+
+        t1 = time.perf_counter()
+        decode(data)
+        decode_ms.append((time.perf_counter() - t1) * 1000)
+
+    return {
+        "encode_ms_p50": round(float(np.percentile(encode_ms, 50)), 4),
+        "decode_ms_p50": round(float(np.percentile(decode_ms, 50)), 4),
+        "size_bytes": len(data.encode()),
+    }
+
+
+def run_benchmark(num_runs):
+    results = {}
+    with DBSession() as dbsession:
+        for fleet in dbsession.get_all_fleets():
+            fleet_status_msg = get_fleet_status_msg(dbsession, fleet)
+            results[fleet.name] = {
+                "num_sherpas": len(fleet_status_msg.get("sherpa_status", {})),
+                "legacy": time_codec(fleet_status_msg, str, ast.literal_eval, num_runs),
+                "v1": time_codec(
+                    fleet_status_msg,
+                    utils_comms.encode_msg,
+                    utils_comms.decode_msg,
+                    num_runs,
+                ),
+            }
+
+    result = {
+        "num_runs": num_runs,
+        "json_codec": "orjson" if utils_comms.orjson is not None else "json",
+        "fleets": results,
+        "fm_tag": os.getenv("FM_TAG"),
+        "timestamp": utils_util.dt_to_str(datetime.datetime.now()),
+    }
+    return result
+
+
+if __name__ == "__main__":
+    num_runs = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    result = run_benchmark(num_runs)
+    print(json.dumps(result, indent=2))
+
+    results_path = os.path.join(os.getenv("FM_LOG_DIR", "."), "bench_wire_format.json")
+    with open(results_path, "a") as f:
+        f.write(json.dumps(result) + "\n")
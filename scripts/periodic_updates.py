@@ -5,51 +5,59 @@ import os
 import redis
 
 # ati code imports
+import core.constants as cc
 from utils.comms import send_status_update, send_notification
 from utils.util import get_table_as_dict, report_error, proc_retry
+from utils.config_utils import ConfigDefaults
+from utils.redis_pool import get_redis_conn
 import utils.trip_utils as tu
+from utils.fleet_state_diff import SnapshotDiffer
 from models.db_session import DBSession
+from models.mongo_client import FMMongo
 from models.fleet_models import SherpaStatus, Sherpa, Fleet, Station, StationStatus
 import models.misc_models as mm
 
 
-def get_fleet_status_msg(dbsession, fleet):
-    msg = {}
-    all_station_status = dbsession.get_all_station_status()
-    all_sherpa_status = dbsession.get_all_sherpa_status()
+# Updates are published per msg type at the rate set in comms config(periodic_updates_hz).
+# Handlers mark the fleets changed by a request as dirty(utils.comms.mark_fleets_dirty),
+# updates of a dirty fleet are published right away, but not more often than
+# dirty_updates_max_hz per msg type. sherpa_status, trip_status msgs don't mark fleets
+# dirty, they are seen at the periodic rate. So the DB load of this process is capped at
+# sum(periodic_updates_hz) + dirty_updates_max_hz x num msg types, queries per sec.
+# Between updates the process blocks on the dirty fleets list till the next update is due,
+# the DB is queried only when an update is due.
 
-    sherpa_status_update = {}
-    station_status_update = {}
+FLEET_MSG_TYPES = ["fleet_status", "ongoing_trips_status", "notifications"]
+GLOBAL_MSG_TYPES = ["visas_held", "visas_waiting", "alerts"]
 
-    if all_sherpa_status:
-        for sherpa_status in all_sherpa_status:
-            if sherpa_status.sherpa.fleet.name == fleet.name:
-                sherpa_status_update.update(
-                    {
-                        sherpa_status.sherpa_name: get_table_as_dict(
-                            SherpaStatus, sherpa_status
-                        )
-                    }
-                )
+# secs between updates of cc.PeriodicUpdatesKeys.STATS
+STATS_INTERVAL = 10
 
-                sherpa_status_update[sherpa_status.sherpa_name].update(
-                    get_table_as_dict(Sherpa, sherpa_status.sherpa)
-                )
 
-    if all_station_status:
-        for station_status in all_station_status:
-            if station_status.station.fleet.name == fleet.name:
-                station_status_update.update(
-                    {
-                        station_status.station_name: get_table_as_dict(
-                            StationStatus, station_status
-                        )
-                    }
-                )
+def get_fleet_status_msg(dbsession, fleet):
+    msg = {}
+    sherpa_status_update = {}
+    station_status_update = {}
 
-                station_status_update[station_status.station_name].update(
-                    get_table_as_dict(Station, station_status.station)
+    for sherpa_status in dbsession.get_all_sherpa_status_in_fleet(fleet.name):
+        sherpa_status_update.update(
+            {sherpa_status.sherpa_name: get_table_as_dict(SherpaStatus, sherpa_status)}
+        )
+        sherpa_status_update[sherpa_status.sherpa_name].update(
+            get_table_as_dict(Sherpa, sherpa_status.sherpa)
+        )
+
+    for station_status in dbsession.get_all_station_status_in_fleet(fleet.name):
+        station_status_update.update(
+            {
+                station_status.station_name: get_table_as_dict(
+                    StationStatus, station_status
                 )
+            }
+        )
+        station_status_update[station_status.station_name].update(
+            get_table_as_dict(Station, station_status.station)
+        )
 
     msg.update({"sherpa_status": sherpa_status_update})
     msg.update({"station_status": station_status_update})
@@ -65,8 +73,11 @@ def get_ongoing_trips_status(dbsession, fleet):
     msg = {}
 
     all_ongoing_trips_fleet = dbsession.get_all_ongoing_trips_fleet(fleet.name)
-    for ongoing_trip in all_ongoing_trips_fleet:
-        msg.update({ongoing_trip.trip_id: tu.get_trip_status(ongoing_trip.trip)})
+    msg.update(
+        tu.get_trips_status(
+            dbsession, [ongoing_trip.trip for ongoing_trip in all_ongoing_trips_fleet]
+        )
+    )
 
     msg["type"] = "ongoing_trips_status"
     msg["fleet_name"] = fleet.name
@@ -198,31 +209,177 @@ def send_fleet_level_notifications(dbsession, fleet_name):
     send_notification(all_infos)
     send_notification(action_requests)
 
+
+class PublishRateController:
+    def __init__(self, periodic_updates_hz: dict, dirty_updates_max_hz: float):
+        default_hz = ConfigDefaults.comms["periodic_updates_hz"]
+        self.target_hz = {
+            msg_type: periodic_updates_hz.get(msg_type, default_hz[msg_type])
+            for msg_type in FLEET_MSG_TYPES + GLOBAL_MSG_TYPES
+        }
+        self.intervals = {msg_type: 1 / hz for msg_type, hz in self.target_hz.items()}
+        self.min_interval = 1 / dirty_updates_max_hz
+
+        # (msg type, fleet name): last published at, fleet name is None for global msgs
+        self.last_published = {}
+        # fleet name: msg types not published since the fleet was marked dirty
+        self.dirty = {}
+
+        # msg type: [num published, secs spent building and publishing]
+        self.stats = {msg_type: [0, 0.0] for msg_type in self.target_hz}
+        self.stats_since = time.time()
+
+    def mark_dirty(self, fleet_names):
+        for fleet_name in fleet_names:
+            self.dirty[fleet_name] = set(FLEET_MSG_TYPES)
+        if fleet_names:
+            # visas, alerts aren't specific to a fleet
+            self.dirty[None] = set(GLOBAL_MSG_TYPES)
+
+    def get_due_at(self, msg_type, fleet_name):
+        last_published = self.last_published.get((msg_type, fleet_name))
+        if last_published is None:
+            return 0
+        if msg_type in self.dirty.get(fleet_name, ()):
+            return last_published + self.min_interval
+        return last_published + self.intervals[msg_type]
+
+    def is_due(self, msg_type, fleet_name, now):
+        return self.get_due_at(msg_type, fleet_name) <= now
+
+    def get_next_due_at(self, fleet_names):
+        due_at = [
+            self.get_due_at(msg_type, fleet_name)
+            for fleet_name in fleet_names
+            for msg_type in FLEET_MSG_TYPES
+        ]
+        due_at.extend([self.get_due_at(msg_type, None) for msg_type in GLOBAL_MSG_TYPES])
+        return min(due_at)
+
+    def published(self, msg_type, fleet_name, now, build_time):
+        self.last_published[(msg_type, fleet_name)] = now
+        dirty_msg_types = self.dirty.get(fleet_name)
+        if dirty_msg_types is not None:
+            dirty_msg_types.discard(msg_type)
+            if not dirty_msg_types:
+                del self.dirty[fleet_name]
+
+        self.stats[msg_type][0] += 1
+        self.stats[msg_type][1] += build_time
+
+    def get_wait_time(self, fleet_names, now):
+        # till the next update is due, dirty marks wake the process up earlier
+        return max(0, self.get_next_due_at(fleet_names) - now)
+
+    def pop_stats(self, now):
+        elapsed = max(now - self.stats_since, 1e-6)
+        stats = {}
+        for msg_type, (num_published, build_time) in self.stats.items():
+            stats[msg_type] = {
+                "target_hz": self.target_hz[msg_type],
+                "published_hz": round(num_published / elapsed, 3),
+                "build_ms_avg": (
+                    round(build_time * 1000 / num_published, 3) if num_published else None
+                ),
+            }
+        self.stats = {msg_type: [0, 0.0] for msg_type in self.target_hz}
+        self.stats_since = now
+        return stats
+
+
+def get_comms_config():
+    with FMMongo() as fm_mongo:
+        return fm_mongo.get_document_from_fm_config("comms")
+
+
+def wait_for_dirty_fleets(redis_conn, timeout):
+    # blocks for atmost timeout secs(redis >= 6 takes fractional secs) for the first dirty
+    # mark, pops the rest without blocking
+    dirty_fleets = set()
+    if timeout > 0:
+        dirty_mark = redis_conn.blpop(cc.PeriodicUpdatesKeys.DIRTY_FLEETS, timeout=timeout)
+        if dirty_mark:
+            dirty_fleets.add(dirty_mark[1])
+
+    with redis_conn.pipeline() as pipe:
+        pipe.lrange(cc.PeriodicUpdatesKeys.DIRTY_FLEETS, 0, -1)
+        pipe.delete(cc.PeriodicUpdatesKeys.DIRTY_FLEETS)
+        dirty_marks, _ = pipe.execute()
+    dirty_fleets.update(dirty_marks)
+    return dirty_fleets
+
+
+def publish_fleet_msg(dbsession, snapshot_differ, msg_type, fleet):
+    if msg_type == "fleet_status":
+        fleet_status_msg = get_fleet_status_msg(dbsession, fleet)
+        send_status_update(snapshot_differ.get_update(fleet_status_msg))
+    elif msg_type == "ongoing_trips_status":
+        ongoing_trip_msg = get_ongoing_trips_status(dbsession, fleet)
+        send_status_update(snapshot_differ.get_update(ongoing_trip_msg))
+    elif msg_type == "notifications":
+        send_fleet_level_notifications(dbsession, fleet.name)
+
+
+def publish_global_msg(dbsession, msg_type):
+    if msg_type == "visas_held":
+        send_status_update(get_visas_held_msg(dbsession))
+    elif msg_type == "visas_waiting":
+        send_status_update(get_waiting_visa_msg(dbsession))
+    elif msg_type == "alerts":
+        for alert_msg in get_all_alert_notifications(dbsession):
+            send_notification(alert_msg)
+
+
 @proc_retry()
 @report_error
 def send_periodic_updates():
     logging.getLogger().info("starting periodic updates script")
+    comms_config = get_comms_config()
+    rate_controller = PublishRateController(
+        comms_config.get("periodic_updates_hz", {}),
+        comms_config.get(
+            "dirty_updates_max_hz", ConfigDefaults.comms["dirty_updates_max_hz"]
+        ),
+    )
+    redis_conn = get_redis_conn(decode_responses=True)
+
+    # fleet status, ongoing trips are sent as deltas, see utils/fleet_state_diff.py
+    snapshot_differ = SnapshotDiffer()
+    # fleets as of the last update, read again whenever an update is due
+    fleet_names = []
+    wait_time = 0
     with DBSession() as dbsession:
         while True:
+            rate_controller.mark_dirty(wait_for_dirty_fleets(redis_conn, wait_time))
+            wait_time = rate_controller.get_wait_time(fleet_names, time.time())
+            if wait_time > 0:
+                continue
+
             all_fleets = dbsession.get_all_fleets()
             for fleet in all_fleets:
-                fleet_status_msg = get_fleet_status_msg(dbsession, fleet)
-                send_status_update(fleet_status_msg)
-
-                ongoing_trip_msg = get_ongoing_trips_status(dbsession, fleet)
-                send_status_update(ongoing_trip_msg)
-
-                send_fleet_level_notifications(dbsession, fleet.name)
+                for msg_type in FLEET_MSG_TYPES:
+                    now = time.time()
+                    if rate_controller.is_due(msg_type, fleet.name, now):
+                        publish_fleet_msg(dbsession, snapshot_differ, msg_type, fleet)
+                        rate_controller.published(
+                            msg_type, fleet.name, now, time.time() - now
+                        )
 
-            visa_msg = get_visas_held_msg(dbsession)
-            send_status_update(visa_msg)
+            for msg_type in GLOBAL_MSG_TYPES:
+                now = time.time()
+                if rate_controller.is_due(msg_type, None, now):
+                    publish_global_msg(dbsession, msg_type)
+                    rate_controller.published(msg_type, None, now, time.time() - now)
 
-            waiting_visa_msg = get_waiting_visa_msg(dbsession)
-            send_status_update(waiting_visa_msg)
+            dbsession.session.expire_all()
 
-            all_alerts = get_all_alert_notifications(dbsession)
-            for alert_msg in all_alerts:
-                send_notification(alert_msg)
+            now = time.time()
+            if now - rate_controller.stats_since >= STATS_INTERVAL:
+                stats = rate_controller.pop_stats(now)
+                redis_conn.hset(
+                    cc.PeriodicUpdatesKeys.STATS,
+                    mapping={msg_type: json.dumps(val) for msg_type, val in stats.items()},
+                )
 
-            dbsession.session.expire_all()
-            time.sleep(2)
\ No newline at end of file
+            fleet_names = [fleet.name for fleet in all_fleets]
+            wait_time = rate_controller.get_wait_time(fleet_names, time.time())
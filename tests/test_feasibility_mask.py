@@ -0,0 +1,118 @@
+import logging
+import random
+import numpy as np
+
+from core.constants import FleetStatus
+from optimal_dispatch.dispatcher import OptimalDispatch
+
+
+STATIONS = [f"st{i}" for i in range(6)]
+FLEET_STATUSES = [
+    FleetStatus.STARTED,
+    FleetStatus.STOPPED,
+    FleetStatus.PAUSED,
+    FleetStatus.MAINTENANCE,
+]
+
+
+def get_dispatcher(pickup_q, sherpa_q, max_trips_to_consider):
+    optimal_dispatch = OptimalDispatch(
+        {"method": "hungarian", "max_trips_to_consider": max_trips_to_consider}
+    )
+    optimal_dispatch.logger = logging.getLogger()
+    optimal_dispatch.pickup_q = pickup_q
+    optimal_dispatch.sherpa_q = sherpa_q
+    return optimal_dispatch
+
+
+def get_feasibility_mask_loop(pickup_q, sherpa_q, max_trips_to_consider):
+    # per cell checks of assemble_cost_matrix before it was vectorized
+    feasible = np.zeros((len(pickup_q), len(sherpa_q)), dtype=bool)
+    for i, pickup_q_val in enumerate(pickup_q.values()):
+        for j, (sherpa_name_q, sherpa_q_val) in enumerate(sherpa_q.items()):
+            sherpa_name = pickup_q_val["sherpa_name"]
+            excluded = [
+                station
+                for station in pickup_q_val["route"]
+                if station in sherpa_q_val["exclude_stations"]
+            ]
+            park_booking = pickup_q_val["booked_by"].find(f"park_{sherpa_name_q}") != -1
+            if len(excluded) > 0:
+                continue
+            elif sherpa_q_val["fleet_status"] == FleetStatus.MAINTENANCE:
+                continue
+            elif sherpa_q_val["fleet_status"] == FleetStatus.STOPPED and not park_booking:
+                continue
+            elif sherpa_q_val["parking_mode"] is True and not park_booking:
+                continue
+            elif i + 1 > max_trips_to_consider:
+                continue
+            elif sherpa_name and sherpa_name != sherpa_name_q:
+                continue
+            feasible[i, j] = True
+    return feasible
+
+
+def get_random_queues(rng, num_pickups, num_sherpas):
+    sherpa_names = [f"S{j}" for j in range(num_sherpas)]
+    sherpa_q = {
+        sherpa_name: {
+            "exclude_stations": rng.sample(STATIONS + ["other"], rng.randint(0, 2)),
+            "fleet_status": rng.choice(FLEET_STATUSES),
+            "parking_mode": rng.random() < 0.2,
+        }
+        for sherpa_name in sherpa_names
+    }
+    pickup_q = {}
+    for i in range(num_pickups):
+        booked_by, sherpa_name = "user", None
+        if sherpa_names:
+            booked_by = rng.choice([booked_by, "park_" + rng.choice(sherpa_names)])
+            sherpa_name = rng.choice([None, None, rng.choice(sherpa_names)])
+        pickup_q[i + 1] = {
+            "route": rng.sample(STATIONS, rng.randint(1, 3)),
+            "booked_by": booked_by,
+            "sherpa_name": sherpa_name,
+        }
+    return pickup_q, sherpa_q
+
+
+def test_feasibility_mask_matches_loop():
+    rng = random.Random(7)
+    for _ in range(200):
+        num_pickups, num_sherpas = rng.randint(0, 6), rng.randint(0, 5)
+        max_trips_to_consider = rng.randint(1, 6)
+        pickup_q, sherpa_q = get_random_queues(rng, num_pickups, num_sherpas)
+        optimal_dispatch = get_dispatcher(pickup_q, sherpa_q, max_trips_to_consider)
+
+        feasible = optimal_dispatch.get_feasibility_mask()
+
+        assert feasible.shape == (num_pickups, num_sherpas)
+        assert np.array_equal(
+            feasible, get_feasibility_mask_loop(pickup_q, sherpa_q, max_trips_to_consider)
+        )
+
+
+def test_park_booking_allowed_when_fleet_stopped():
+    sherpa_q = {
+        "S1": {
+            "exclude_stations": [],
+            "fleet_status": FleetStatus.STOPPED,
+            "parking_mode": False,
+        },
+        "S2": {
+            "exclude_stations": [],
+            "fleet_status": FleetStatus.STOPPED,
+            "parking_mode": True,
+        },
+    }
+    pickup_q = {
+        1: {"route": ["st0"], "booked_by": "park_S1", "sherpa_name": None},
+        2: {"route": ["st0"], "booked_by": "park_S2", "sherpa_name": "S2"},
+        3: {"route": ["st1"], "booked_by": "user", "sherpa_name": None},
+    }
+    optimal_dispatch = get_dispatcher(pickup_q, sherpa_q, 10)
+
+    feasible = optimal_dispatch.get_feasibility_mask()
+
+    assert feasible.tolist() == [[True, False], [False, True], [False, False]]
@@ -0,0 +1,129 @@
+import copy
+import random
+
+from utils.fleet_state_diff import (
+    DELTA_SUFFIX,
+    SnapshotTracker,
+    apply_delta,
+    diff_snapshots,
+)
+
+
+def get_random_value(rng, depth):
+    kind = rng.choice(["int", "str", "list", "none", "dict"] if depth < 3 else ["int"])
+    if kind == "int":
+        return rng.randint(0, 5)
+    if kind == "str":
+        return rng.choice(["a", "b", "c"])
+    if kind == "list":
+        return [rng.randint(0, 3) for _ in range(rng.randint(0, 3))]
+    if kind == "none":
+        return None
+    return get_random_snapshot(rng, depth + 1)
+
+
+def get_random_snapshot(rng, depth=0):
+    keys = rng.sample(range(6), rng.randint(0, 4))
+    return {f"k{i}": get_random_value(rng, depth) for i in keys}
+
+
+def mutate(rng, snapshot, depth=0):
+    new = copy.deepcopy(snapshot)
+    for key in list(new.keys()):
+        action = rng.random()
+        if action < 0.2:
+            del new[key]
+        elif action < 0.4:
+            new[key] = get_random_value(rng, depth)
+        elif action < 0.6 and isinstance(new[key], dict):
+            new[key] = mutate(rng, new[key], depth + 1)
+    if rng.random() < 0.3:
+        new[f"k{rng.randint(0, 8)}"] = get_random_value(rng, depth)
+    return new
+
+
+def get_delta(old, new, seq, msg_type="fleet_status", fleet_name="fleet_1"):
+    changed, removed = diff_snapshots(old, new)
+    return {
+        "type": f"{msg_type}{DELTA_SUFFIX}",
+        "fleet_name": fleet_name,
+        "seq": seq,
+        "changed": changed,
+        "removed": removed,
+    }
+
+
+def test_random_round_trip():
+    rng = random.Random(3)
+    for _ in range(500):
+        old = get_random_snapshot(rng)
+        new = mutate(rng, old)
+        assert apply_delta(copy.deepcopy(old), get_delta(old, new, 1)) == new
+
+
+def test_removed_nested_key():
+    old = {"sherpas": {"S1": {"pose": [0, 0, 0], "trip_id": 4}, "S2": {"pose": [1, 0, 0]}}}
+    new = {"sherpas": {"S1": {"pose": [0, 0, 0]}, "S2": {"pose": [1, 0, 0]}}}
+
+    changed, removed = diff_snapshots(old, new)
+
+    assert changed == {}
+    assert removed == [["sherpas", "S1", "trip_id"]]
+    assert apply_delta(copy.deepcopy(old), get_delta(old, new, 1)) == new
+
+
+def test_dict_replaced_by_scalar():
+    old = {"a": {"b": 1, "c": {"d": 2}}, "e": 3}
+    new = {"a": None, "e": {"f": 4}}
+
+    changed, removed = diff_snapshots(old, new)
+
+    assert changed == {"a": None, "e": {"f": 4}}
+    assert removed == []
+    assert apply_delta(copy.deepcopy(old), get_delta(old, new, 1)) == new
+
+
+def test_applied_delta_isnt_modified():
+    # decoded msgs are shared by the subscribers
+    snapshots = [{"a": {"b": 1}}, {"a": {"b": 1}, "c": {"d": 1}}, {"a": {"b": 1}, "c": {}}]
+    deltas = [
+        get_delta(snapshots[i], snapshots[i + 1], i + 1) for i in range(len(snapshots) - 1)
+    ]
+    sent = copy.deepcopy(deltas)
+
+    state = copy.deepcopy(snapshots[0])
+    for delta in deltas:
+        apply_delta(state, delta)
+
+    assert state == snapshots[-1]
+    assert deltas == sent
+
+
+def test_tracker_seq_gap():
+    tracker = SnapshotTracker()
+    snapshots = [
+        {"type": "fleet_status", "fleet_name": "fleet_1", "n": n} for n in range(5)
+    ]
+
+    keyframe = dict(snapshots[0], seq=0, keyframe=True)
+    assert tracker.update(keyframe) == keyframe
+
+    snapshot = tracker.update(get_delta(snapshots[0], snapshots[1], 1))
+    assert snapshot == dict(snapshots[1], seq=1, keyframe=True)
+
+    # seq 2 was missed, nothing is rebuilt until the next keyframe
+    assert tracker.update(get_delta(snapshots[2], snapshots[3], 3)) is None
+    assert tracker.get_snapshot("fleet_status", "fleet_1") is None
+    assert tracker.update(get_delta(snapshots[3], snapshots[4], 4)) is None
+
+    keyframe = dict(snapshots[4], seq=5, keyframe=True)
+    assert tracker.update(keyframe) == keyframe
+    assert tracker.get_snapshot("fleet_status", "fleet_1") == keyframe
+
+
+def test_tracker_passes_other_msgs():
+    tracker = SnapshotTracker()
+    msg = {"type": "visas_held", "fleet_name": "fleet_1", "visas": []}
+
+    assert tracker.update(msg) is msg
+    assert tracker.get_keys() == []
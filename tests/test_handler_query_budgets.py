@@ -0,0 +1,90 @@
+import core.constants as cc
+import models.fleet_models as fm
+import models.trip_models as tm
+from core.common import get_fm_engine
+from handlers.default.handlers import Handlers
+from handlers.default.query_budgets import (
+    QUERY_BUDGETS,
+    count_queries,
+    get_sherpa_status_msg,
+    get_trip_status_msg,
+)
+from models.db_session import DBSession
+
+
+def reset_db():
+    engine = get_fm_engine()
+    fm.Base.metadata.drop_all(bind=engine)
+    tm.Base.metadata.drop_all(bind=engine)
+    fm.Base.metadata.create_all(bind=engine)
+    tm.Base.metadata.create_all(bind=engine)
+
+
+def add_sherpa_on_trip(dbsession, sherpa_name="S1", fleet_name="fleet_1"):
+    # sherpa in fleet mode, en route to st_b on the first leg of a trip
+    fleet = fm.Fleet(name=fleet_name, status=cc.FleetStatus.STARTED)
+    dbsession.add_to_session(fleet)
+    for name, pose in [("st_a", [0.0, 0.0, 0.0]), ("st_b", [5.0, 0.0, 0.0])]:
+        dbsession.add_to_session(fm.Station(name=name, pose=pose, fleet_id=fleet.id))
+        dbsession.add_to_session(fm.StationStatus(station_name=name, disabled=False))
+
+    dbsession.add_to_session(
+        fm.Sherpa(name=sherpa_name, hwid="abcd", hashed_api_key="abcd", fleet_id=fleet.id)
+    )
+    sherpa_status = fm.SherpaStatus(
+        sherpa_name=sherpa_name,
+        initialized=True,
+        disabled=False,
+        inducted=True,
+        idle=False,
+        pose=[1.0, 0.0, 0.0],
+        battery_status=80.0,
+        mode="fleet",
+        assign_next_task=False,
+        continue_curr_task=False,
+        other_info={},
+    )
+    dbsession.add_to_session(sherpa_status)
+
+    trip = dbsession.create_trip(["st_a", "st_b"], 1.0, fleet_name=fleet_name)
+    trip.assign_sherpa(sherpa_name)
+    trip.start()
+    # set by the router when the trip is assigned
+    trip.etas_at_start = [0.0, 10.0]
+    trip.etas = [0.0, 10.0]
+    ongoing_trip = dbsession.create_ongoing_trip(sherpa_name, trip.id)
+    trip_leg = dbsession.create_trip_leg(trip.id, "st_a", "st_b")
+    ongoing_trip.next_idx_aug = 1
+    ongoing_trip.start_leg(trip_leg.id)
+    sherpa_status.trip_id = trip.id
+    sherpa_status.trip_leg_id = trip_leg.id
+    dbsession.add_to_session(
+        tm.TripAnalytics(
+            sherpa_name=sherpa_name,
+            trip_id=trip.id,
+            trip_leg_id=trip_leg.id,
+            from_station="st_a",
+            to_station="st_b",
+            progress=0.2,
+            num_trip_msg=0,
+        )
+    )
+
+
+def test_handler_query_budgets():
+    reset_db()
+    with DBSession() as dbsession:
+        add_sherpa_on_trip(dbsession)
+
+    with DBSession() as dbsession:
+        sherpa, ongoing_trip, _, trip_analytics = dbsession.get_sherpa_working_set("S1")
+        msgs = [
+            get_sherpa_status_msg(sherpa),
+            get_trip_status_msg(sherpa, ongoing_trip, trip_analytics),
+        ]
+
+    handler = Handlers()
+    for msg in msgs:
+        query_counter = count_queries(handler, msg)
+        assert query_counter.count > 0, msg.type
+        query_counter.check_budget(QUERY_BUDGETS[msg.type], msg.type)
@@ -0,0 +1,79 @@
+import itertools
+import numpy as np
+
+from optimal_dispatch.hungarian import MIN_VALUE
+from optimal_dispatch.linear_sum_assignment import lsa_assignment, sparse_lsa_assignment
+
+
+ASSIGNMENT_BACKENDS = [lsa_assignment, sparse_lsa_assignment]
+
+
+def get_best_value(cost_matrix):
+    # max total value over all the assignments, cells <= MIN_VALUE can't be assigned
+    num_pickups, num_sherpas = cost_matrix.shape
+    best_value = 0.0
+    for sherpas in itertools.permutations(
+        list(range(num_sherpas)) + [None] * num_pickups, num_pickups
+    ):
+        value = sum(
+            cost_matrix[i, j]
+            for i, j in enumerate(sherpas)
+            if j is not None and cost_matrix[i, j] > MIN_VALUE
+        )
+        best_value = max(best_value, value)
+    return best_value
+
+
+def check_assignment(cost_matrix, assignment, raw_assignments, pickups, sherpas):
+    assert len(raw_assignments) == len(pickups)
+    assert len(set(assignment.values())) == len(assignment)
+    value = 0.0
+    for i, j in enumerate(raw_assignments):
+        if j == -1:
+            assert pickups[i] not in assignment
+            continue
+        assert cost_matrix[i, j] > MIN_VALUE
+        assert assignment[pickups[i]] == sherpas[j]
+        value += cost_matrix[i, j]
+    return value
+
+
+def get_random_cost_matrix(rng, num_pickups, num_sherpas):
+    # priority normalised cost matrix, infeasible cells(inf route length) are 0
+    cost_matrix = rng.uniform(MIN_VALUE, 1, (num_pickups, num_sherpas))
+    cost_matrix[rng.random((num_pickups, num_sherpas)) < 0.3] = 0.0
+    cost_matrix[rng.random((num_pickups, num_sherpas)) < 0.1] = -np.inf
+    return cost_matrix
+
+
+def test_backends_match_brute_force():
+    rng = np.random.default_rng(11)
+    for _ in range(100):
+        shape = (int(rng.integers(1, 5)), int(rng.integers(1, 5)))
+        cost_matrix = get_random_cost_matrix(rng, *shape)
+        pickups = [f"trip_{i}" for i in range(shape[0])]
+        sherpas = [f"S{j}" for j in range(shape[1])]
+        best_value = get_best_value(cost_matrix)
+        for assign in ASSIGNMENT_BACKENDS:
+            assignment, raw_assignments = assign(cost_matrix, pickups, sherpas)
+            value = check_assignment(
+                cost_matrix, assignment, raw_assignments, pickups, sherpas
+            )
+            assert np.isclose(value, best_value), assign.__name__
+
+
+def test_non_square_infeasible_cells():
+    # more trips than sherpas, trip_1 can't go to any sherpa
+    cost_matrix = np.array([[0.5, 0.0], [0.0, -np.inf], [0.2, 0.9]])
+    pickups = ["trip_0", "trip_1", "trip_2"]
+    sherpas = ["S0", "S1"]
+    for assign in ASSIGNMENT_BACKENDS:
+        assignment, raw_assignments = assign(cost_matrix, pickups, sherpas)
+        assert assignment == {"trip_0": "S0", "trip_2": "S1"}, assign.__name__
+        assert raw_assignments == [0, -1, 1], assign.__name__
+
+
+def test_nothing_feasible():
+    cost_matrix = np.zeros((2, 3))
+    for assign in ASSIGNMENT_BACKENDS:
+        assert assign(cost_matrix, ["t0", "t1"], ["S0", "S1", "S2"]) == ({}, [-1, -1])
@@ -0,0 +1,89 @@
+import asyncio
+import json
+
+from app.updates_hub import MAX_PENDING_SNAPSHOTS, UpdatesClient, UpdatesHub
+from utils.fleet_state_diff import DELTA_SUFFIX
+
+
+def get_msgs(client):
+    return [json.loads(encoded_msg) for encoded_msg in asyncio.run(client.get())]
+
+
+def get_keyframe(seq, fleet_name="fleet_1", **snapshot):
+    return dict(
+        type="fleet_status", fleet_name=fleet_name, seq=seq, keyframe=True, **snapshot
+    )
+
+
+def get_delta(seq, changed, fleet_name="fleet_1"):
+    return {
+        "type": f"fleet_status{DELTA_SUFFIX}",
+        "fleet_name": fleet_name,
+        "seq": seq,
+        "changed": changed,
+        "removed": [],
+    }
+
+
+def test_put_coalesces_snapshots_of_a_key():
+    client = UpdatesClient()
+    client.put(("fleet_status", "fleet_1"), "1")
+    client.put(("fleet_status", "fleet_2"), "2")
+    client.put(("fleet_status", "fleet_1"), "3")
+
+    assert asyncio.run(client.get()) == ["2", "3"]
+    assert client.num_dropped == 1
+    assert not client.has_pending.is_set()
+
+
+def test_put_drops_oldest_beyond_max_pending():
+    client = UpdatesClient(deltas=True)
+    for i in range(MAX_PENDING_SNAPSHOTS + 1):
+        client.synced.add(("fleet_status", f"fleet_{i}"))
+        client.put(("fleet_status", f"fleet_{i}"), str(i))
+
+    encoded_msgs = asyncio.run(client.get())
+    assert len(encoded_msgs) == MAX_PENDING_SNAPSHOTS
+    assert encoded_msgs[0] == "1"
+    assert client.num_dropped == 1
+    # a delta on top of the dropped snapshot can't be applied, resync with a snapshot
+    assert ("fleet_status", "fleet_0") not in client.synced
+
+
+def test_legacy_client_gets_full_snapshots():
+    hub = UpdatesHub()
+    client = UpdatesClient()
+    hub.clients.add(client)
+
+    hub.broadcast(get_keyframe(0, n=0, m=0))
+    hub.broadcast(get_delta(1, {"n": 1}))
+
+    assert get_msgs(client) == [
+        {"type": "fleet_status", "fleet_name": "fleet_1", "n": 1, "m": 0}
+    ]
+
+
+def test_delta_client_resyncs_after_filter_change():
+    hub = UpdatesHub()
+    client = UpdatesClient(fleet_names=["fleet_1"], deltas=True)
+    hub.clients.add(client)
+
+    hub.broadcast(get_keyframe(0, n=0))
+    assert get_msgs(client) == [get_keyframe(0, n=0)]
+
+    hub.broadcast(get_delta(1, {"n": 1}))
+    assert get_msgs(client) == [get_delta(1, {"n": 1})]
+
+    # deltas of fleet_1 are missed while it is filtered out
+    client.set_filters(fleet_names=["fleet_2"])
+    hub.broadcast(get_delta(2, {"n": 2}))
+    assert not client.pending
+    assert ("fleet_status", "fleet_1") not in client.synced
+
+    # wanted again, the next update is sent as the full snapshot, deltas after that
+    client.set_filters(fleet_names=["fleet_1"])
+    hub.broadcast(get_delta(3, {"n": 3}))
+    assert get_msgs(client) == [get_keyframe(3, n=3)]
+
+    hub.broadcast(get_delta(4, {"n": 4}))
+    assert get_msgs(client) == [get_delta(4, {"n": 4})]
@@ -3,20 +3,26 @@ import logging.config
 import os
 import time
 from typing import Dict
-import redis
 import math
 import requests
 import threading
 import json
+import ast
 from enum import Enum
 from rq.job import Job
 from pydantic import BaseModel
 import asyncio
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # ati code imports
 import app.routers.dependencies as dpd
 import utils.log_utils as lu
 import utils.util as utils_util
+from utils.redis_pool import get_redis_conn
 import core.constants as cc
 from models.mongo_client import FMMongo
 from models.fleet_models import SherpaEvent
@@ -29,6 +35,45 @@ from models.trip_models import OngoingTrip
 logging.config.dictConfig(lu.get_log_config_dict())
 
 
+# wire format of the msgs published to redis channels. Payloads are prefixed with the
+# version, payloads without a version are python reprs(str(msg)) published by older
+# builds, decode_msg handles both while a rollout is in progress.
+# JSON is encoded with orjson if installed, else with json.
+WIRE_FORMAT_V1 = "v1:"
+
+
+def _json_default(obj):
+    # numpy values, anything else is sent as its str
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    return str(obj)
+
+
+def dumps_json(msg) -> str:
+    if orjson is not None:
+        return orjson.dumps(
+            msg,
+            default=_json_default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY,
+        ).decode()
+    return json.dumps(msg, default=_json_default)
+
+
+def encode_msg(msg) -> str:
+    return WIRE_FORMAT_V1 + dumps_json(msg)
+
+
+def decode_msg(data):
+    if isinstance(data, bytes):
+        data = data.decode()
+
+    if data.startswith(WIRE_FORMAT_V1):
+        payload = data[len(WIRE_FORMAT_V1) :]
+        return orjson.loads(payload) if orjson is not None else json.loads(payload)
+
+    return ast.literal_eval(data)
+
+
 def convert_to_dict(msg):
     if isinstance(msg, BaseModel):
         body = msg.dict()
@@ -48,8 +93,13 @@ def convert_to_dict(msg):
 
 
 # utility for communication between sherpa and fleet manager
+# secs to wait for a sherpa to ack a request, the rq worker running the job is held up
+# meanwhile(jobs of other sherpas on a simple worker too, see utils/rq_utils.py)
+SHERPA_REQ_ACK_TIMEOUT = 10
+
+
 def send_req_to_sherpa(dbsession, sherpa: Sherpa, msg: FMReq) -> Dict:
-    with redis.from_url(os.getenv("FM_REDIS_URI")) as redis_conn:
+    with get_redis_conn() as redis_conn:
         body = convert_to_dict(msg)
 
         body["timestamp"] = time.time()
@@ -81,7 +131,11 @@ def send_req_to_sherpa(dbsession, sherpa: Sherpa, msg: FMReq) -> Dict:
             logging.getLogger().info(f"Ack not reqd for req_id: {req_id}")
             return
 
+        ack_deadline = time.time() + SHERPA_REQ_ACK_TIMEOUT
         while redis_conn.get(f"success_{req_id}") is None:
+            if time.time() > ack_deadline:
+                logging.getLogger().error(f"no ack for req id {req_id}, req sent: {body}")
+                raise Exception(f"{sherpa.name} did not respond to the request")
             time.sleep(0.005)
 
         success = json.loads(redis_conn.get(f"success_{req_id}"))
@@ -97,7 +151,7 @@ def send_req_to_sherpa(dbsession, sherpa: Sherpa, msg: FMReq) -> Dict:
 
 
 async def send_async_req_to_sherpa(dbsession, sherpa: Sherpa, msg: FMReq) -> Dict:
-    with redis.from_url(os.getenv("FM_REDIS_URI")) as redis_conn:
+    with get_redis_conn() as redis_conn:
         body = convert_to_dict(msg)
 
         body["timestamp"] = time.time()
@@ -118,7 +172,11 @@ async def send_async_req_to_sherpa(dbsession, sherpa: Sherpa, msg: FMReq) -> Dic
         send_ws_msg_to_sherpa(body, sherpa)
         await asyncio.sleep(0.005)
 
+        ack_deadline = time.time() + SHERPA_REQ_ACK_TIMEOUT
         while redis_conn.get(f"success_{req_id}") is None:
+            if time.time() > ack_deadline:
+                logging.getLogger().error(f"no ack for req id {req_id}, req sent: {body}")
+                raise Exception(f"{sherpa.name} did not respond to the request")
             await asyncio.sleep(0.005)
 
         success = json.loads(redis_conn.get(f"success_{req_id}"))
@@ -149,43 +207,47 @@ def send_move_msg(
     return send_req_to_sherpa(dbsession, sherpa, move_msg)
 
 
+def mark_fleets_dirty(fleet_names):
+    # updates of the fleets are published early by periodic_updates
+    if fleet_names:
+        get_redis_conn().rpush(cc.PeriodicUpdatesKeys.DIRTY_FLEETS, *fleet_names)
+
+
 def send_status_update(msg):
-    pub = redis.from_url(os.getenv("FM_REDIS_URI"), decode_responses=True)
-    pub.publish("channel:status_updates", str(msg))
+    pub = get_redis_conn(decode_responses=True)
+    pub.publish("channel:status_updates", encode_msg(msg))
 
 
 def send_ws_msg_to_sherpa(msg, sherpa):
-    pub = redis.from_url(os.getenv("FM_REDIS_URI"), decode_responses=True)
-    pub.publish(f"channel:{sherpa.name}", str(msg))
+    pub = get_redis_conn(decode_responses=True)
+    pub.publish(f"channel:{sherpa.name}", encode_msg(msg))
 
 
 def send_notification(msg):
-    pub = redis.from_url(os.getenv("FM_REDIS_URI"), decode_responses=True)
-    pub.publish("channel:notifications", str(msg))
+    pub = get_redis_conn(decode_responses=True)
+    pub.publish("channel:notifications", encode_msg(msg))
 
 
 def close_websocket_for_sherpa(sherpa_name):
     msg = {"close_ws": True}
-    pub = redis.from_url(os.getenv("FM_REDIS_URI"), decode_responses=True)
-    pub.publish(f"channel:{sherpa_name}", str(msg))
+    pub = get_redis_conn(decode_responses=True)
+    pub.publish(f"channel:{sherpa_name}", encode_msg(msg))
 
 
 # conveyor related comms
+CANCEL_JOBS_BATCH_SIZE = 100
+
+
 def cancel_jobs_from_user(user, event):
-    with redis.from_url(os.getenv("FM_REDIS_URI")) as redis_conn:
+    queued_jobs_key = dpd.get_queued_jobs_key(user)
+    with get_redis_conn() as redis_conn:
         while True:
             if event.is_set():
                 break
-            queued_jobs = redis_conn.get("queued_jobs")
-            if queued_jobs is None:
-                queued_jobs = b"{}"
-            queued_jobs = json.loads(queued_jobs)
-
-            jobs_source = queued_jobs.get(user)
-            if jobs_source is None:
-                jobs_source = []
 
-            for job_id in jobs_source:
+            # jobs are popped, each job is cancelled only once
+            for job_id in redis_conn.spop(queued_jobs_key, CANCEL_JOBS_BATCH_SIZE):
+                job_id = job_id.decode()
                 logging.getLogger().info(f"Will cancel job(id:{job_id} from {user})")
                 job = Job.fetch(job_id, connection=redis_conn)
                 job.cancel()
@@ -199,8 +261,8 @@ def send_msg_to_plugin(msg_to_forward, channel_name):
         "channel_name": channel_name,
         "type": "forward_to_plugin_redis",
     }
-    pub = redis.from_url(os.getenv("FM_REDIS_URI"), decode_responses=True)
-    pub.publish("channel:plugin_comms", str(msg))
+    pub = get_redis_conn(decode_responses=True)
+    pub.publish("channel:plugin_comms", encode_msg(msg))
 
 
 def get_num_units_converyor(conveyor_name):
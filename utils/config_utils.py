@@ -86,7 +86,11 @@ class ConfigValidator:
             "properties": {
                 "method": {
                     "bsonType": "string",
-                    "enum": ["hungarian"],
+                    "enum": [
+                        "hungarian",
+                        "linear_sum_assignment",
+                        "sparse_linear_sum_assignment",
+                    ],
                     "description": "Algorithm used to solve taxi dispatch problem",
                 },
                 "prioritise_waiting_stations": {
@@ -111,6 +115,18 @@ class ConfigValidator:
                     "maximum": 25,
                     "description": "Max number of trips that will be considered for optimal dispatch, decrease to lessen computational cost",
                 },
+                "router_workers": {
+                    "bsonType": "int",
+                    "minimum": 1,
+                    "maximum": 16,
+                    "description": "Number of router worker processes, fleets are split across the workers",
+                },
+                "debounce_window_ms": {
+                    "bsonType": "int",
+                    "minimum": 0,
+                    "maximum": 10000,
+                    "description": "Optimal dispatch of a fleet is run once no trigger has come for the fleet for this long",
+                },
             },
         },
     }
@@ -155,7 +171,22 @@ class ConfigValidator:
                     "description": "sherpa will be considered disconnected, if no sherpa_status message was received in the last sherpa_heartbeat_interval seconds",
                     "minimum": 30,
                     "maximum": 90,
-                }
+                },
+                "periodic_updates_hz": {
+                    "bsonType": "object",
+                    "description": "Rate at which periodic updates are published, per message type(fleet_status, ongoing_trips_status, notifications, alerts, visas_held, visas_waiting)",
+                    "additionalProperties": {
+                        "bsonType": "number",
+                        "minimum": 0.05,
+                        "maximum": 10,
+                    },
+                },
+                "dirty_updates_max_hz": {
+                    "bsonType": "number",
+                    "minimum": 0.1,
+                    "maximum": 20,
+                    "description": "Updates of a fleet changed by a request are published right away, but not more often than this",
+                },
             },
         }
     }
@@ -177,6 +208,16 @@ class ConfigValidator:
                     "maximum": 50,
                     "description": "Jobs/requests queued up in any redis queue will timeout after generic_handler_job_timeout seconds",
                 },
+                "worker_mode": {
+                    "enum": ["fork", "simple"],
+                    "description": "fork - a rq worker per queue, forks per job. simple - jobs of the sherpa queues run in the worker process, sherpa queues are shared by sherpa_workers workers, other queues fork per job",
+                },
+                "sherpa_workers": {
+                    "bsonType": "int",
+                    "minimum": 1,
+                    "maximum": 64,
+                    "description": "Number of workers serving the sherpa queues in simple worker_mode, queues of a sherpa are served by one worker",
+                },
             },
         }
     }
@@ -465,14 +506,32 @@ class ConfigDefaults:
         "eta_power_factor": 0.1,
         "priority_power_factor": 0.7,
         "max_trips_to_consider": 5,
+        "router_workers": 2,
+        "debounce_window_ms": 500,
     }
     data_backup = {
         "keep_size_mb": 1000,
         "prune_unused_images": True,
         "prune_images_used_until_h": 48,
     }
-    comms = {"sherpa_heartbeat_interval": 60}
-    rq = {"default_job_timeout": 15, "generic_handler_job_timeout": 10}
+    comms = {
+        "sherpa_heartbeat_interval": 60,
+        "periodic_updates_hz": {
+            "fleet_status": 0.5,
+            "ongoing_trips_status": 0.5,
+            "notifications": 0.5,
+            "alerts": 0.5,
+            "visas_held": 0.5,
+            "visas_waiting": 0.5,
+        },
+        "dirty_updates_max_hz": 5,
+    }
+    rq = {
+        "default_job_timeout": 15,
+        "generic_handler_job_timeout": 10,
+        "worker_mode": "simple",
+        "sherpa_workers": 4,
+    }
     stations = {"dispatch_timeout": 10}
     master_fm = {
         "mfm_ip": "sanjaya.atimotors.com",
@@ -0,0 +1,141 @@
+import copy
+import json
+import time
+
+# ati code imports
+import utils.comms as utils_comms
+
+
+# Snapshots published periodically(fleet_status, ongoing_trips_status of a fleet) are
+# sent as deltas against the last published snapshot of the same type and fleet.
+# Every update has a sequence number(seq) per type and fleet, full snapshots(keyframes)
+# are sent every KEYFRAME_INTERVAL secs so that late joining/out of sync clients resync.
+#
+# keyframe: the snapshot as before + {"seq": n, "keyframe": True}
+# delta: {"type": f"{type}{DELTA_SUFFIX}", "fleet_name", "seq", "changed", "removed"}
+#   changed - nested dict of the keys added/changed, dicts are merged key by key
+#   removed - key paths removed, [[key, sub_key, ..], ..]
+# A delta applies only on top of the update with seq - 1.
+
+DELTA_MSG_TYPES = ["fleet_status", "ongoing_trips_status"]
+DELTA_SUFFIX = "_delta"
+KEYFRAME_INTERVAL = 10
+
+# added to the keyframes, not a part of the snapshot
+SEQ_KEYS = ["seq", "keyframe"]
+
+
+def normalize(msg):
+    # as the subscribers would see it, also a copy the caller can't modify
+    return json.loads(utils_comms.dumps_json(msg))
+
+
+def without_seq(snapshot: dict):
+    # snapshot as sent before deltas, for clients which don't track seq
+    return {key: val for key, val in snapshot.items() if key not in SEQ_KEYS}
+
+
+def diff_snapshots(old: dict, new: dict):
+    changed = {}
+    removed = []
+    for key, val in new.items():
+        if key not in old:
+            changed[key] = val
+        elif isinstance(val, dict) and isinstance(old[key], dict):
+            sub_changed, sub_removed = diff_snapshots(old[key], val)
+            if sub_changed:
+                changed[key] = sub_changed
+            removed.extend([[key] + path for path in sub_removed])
+        elif val != old[key]:
+            changed[key] = val
+
+    removed.extend([[key] for key in old if key not in new])
+    return changed, removed
+
+
+def merge_changed(state: dict, changed: dict):
+    for key, val in changed.items():
+        if isinstance(val, dict) and isinstance(state.get(key), dict):
+            merge_changed(state[key], val)
+        else:
+            # decoded deltas are shared by the subscribers, later deltas merge into state
+            state[key] = copy.deepcopy(val)
+
+
+def apply_delta(state: dict, delta: dict):
+    merge_changed(state, delta["changed"])
+    for path in delta["removed"]:
+        parent = state
+        for key in path[:-1]:
+            parent = parent.get(key, {})
+        parent.pop(path[-1], None)
+    return state
+
+
+class SnapshotDiffer:
+    # publisher side, keeps the last published snapshot per type and fleet
+    def __init__(self, keyframe_interval=KEYFRAME_INTERVAL):
+        self.keyframe_interval = keyframe_interval
+        self.published = {}
+
+    def get_update(self, msg: dict):
+        msg_type = msg.get("type")
+        if msg_type not in DELTA_MSG_TYPES:
+            return msg
+
+        msg = normalize(msg)
+        key = (msg_type, msg.get("fleet_name"))
+        last = self.published.get(key)
+        now = time.time()
+        seq = last["seq"] + 1 if last else 0
+
+        if last is None or now - last["keyframe_at"] >= self.keyframe_interval:
+            self.published[key] = {"seq": seq, "snapshot": msg, "keyframe_at": now}
+            return dict(msg, seq=seq, keyframe=True)
+
+        changed, removed = diff_snapshots(last["snapshot"], msg)
+        last.update({"seq": seq, "snapshot": msg})
+        return {
+            "type": f"{msg_type}{DELTA_SUFFIX}",
+            "fleet_name": msg.get("fleet_name"),
+            "seq": seq,
+            "changed": changed,
+            "removed": removed,
+        }
+
+
+class SnapshotTracker:
+    # subscriber side, rebuilds the full snapshots from keyframes and deltas
+    def __init__(self):
+        self.states = {}
+
+    def get_snapshot(self, msg_type, fleet_name):
+        state = self.states.get((msg_type, fleet_name))
+        return state["snapshot"] if state else None
+
+    def get_keys(self):
+        return list(self.states.keys())
+
+    def update(self, data: dict):
+        # full snapshot after applying data, None until a keyframe if a delta was missed
+        msg_type = data.get("type", "")
+        if msg_type.endswith(DELTA_SUFFIX):
+            key = (msg_type[: -len(DELTA_SUFFIX)], data.get("fleet_name"))
+            state = self.states.get(key)
+            if state is None or data["seq"] != state["seq"] + 1:
+                self.states.pop(key, None)
+                return None
+
+            apply_delta(state["snapshot"], data)
+            state["seq"] = data["seq"]
+            state["snapshot"]["seq"] = data["seq"]
+            return state["snapshot"]
+
+        if data.get("keyframe"):
+            # decoded msgs are shared by the subscribers, deltas are applied to a copy
+            key = (msg_type, data.get("fleet_name"))
+            snapshot = copy.deepcopy(data)
+            self.states[key] = {"seq": data["seq"], "snapshot": snapshot}
+            return snapshot
+
+        return data
@@ -0,0 +1,306 @@
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# ati code imports
+import core.constants as cc
+from utils.redis_pool import get_redis_conn
+
+
+# DB load per handler msg type. Handlers run every msg inside trace_msg(msg.type),
+# the statements run meanwhile(engine events, any engine of the process) are counted and
+# timed. Per msg type, the aggregates are kept in the process and flushed to redis every
+# FLUSH_INTERVAL secs by a thread(StatsFlusher), a forked rq work horse flushes at the end
+# of its job(flush_handler_db_stats). In redis:
+#   get_stats_key(msg_type) - hash, num_msgs, num_statements, rows, db_time_ms
+#   get_max_db_time_key(window) - sorted set, msg type: max db time of a msg(ms) in a
+#   MAX_DB_TIME_WINDOW secs window, NUM_MAX_DB_TIME_WINDOWS windows are read
+#   get_slow_queries_key(msg_type) - sorted set, normalized sql: max time(ms), the
+#   NUM_SLOW_QUERIES slowest statements
+# keys expire STATS_TTL secs after the last msg of the type.
+
+NUM_SLOW_QUERIES = 10
+
+# slowest statements of a msg kept
+NUM_SLOW_QUERIES_PER_MSG = 3
+
+STATS_TTL = 24 * 60 * 60
+
+FLUSH_INTERVAL = 1
+
+MAX_DB_TIME_WINDOW = 60
+NUM_MAX_DB_TIME_WINDOWS = 5
+
+# normalized sql is cut to this length
+MAX_SQL_LENGTH = 500
+
+# sets the score of a member if higher than the current score, keeps the top ARGV[3]
+RECORD_MAX_SCRIPT = """
+local current = redis.call('ZSCORE', KEYS[1], ARGV[1])
+if not current or tonumber(ARGV[2]) > tonumber(current) then
+    redis.call('ZADD', KEYS[1], ARGV[2], ARGV[1])
+end
+redis.call('ZREMRANGEBYRANK', KEYS[1], 0, -(tonumber(ARGV[3]) + 1))
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+"""
+
+_local = threading.local()
+
+_record_max_script = None
+
+# StatsFlusher of the process, started with the first msg
+_flusher = None
+
+
+def _reset_flusher():
+    global _flusher
+    # stats of the parent are flushed by the parent, the thread isn't running in the child
+    _flusher = None
+
+
+os.register_at_fork(after_in_child=_reset_flusher)
+
+
+def get_record_max_script(redis_conn):
+    global _record_max_script
+    if _record_max_script is None:
+        _record_max_script = redis_conn.register_script(RECORD_MAX_SCRIPT)
+    return _record_max_script
+
+
+def get_stats_key(msg_type):
+    return f"handler_db_stats:{msg_type}"
+
+
+def get_slow_queries_key(msg_type):
+    return f"handler_slow_queries:{msg_type}"
+
+
+def get_max_db_time_window(now=None):
+    return int((now or time.time()) // MAX_DB_TIME_WINDOW)
+
+
+def get_max_db_time_key(window):
+    return f"{cc.HandlerDBStatsKeys.MAX_DB_TIME}:{window}"
+
+
+def normalize_sql(statement):
+    # same shape of query, same string - params, literals, IN lists replaced
+    sql = re.sub(r"%\(\w+\)s|%s", "?", statement)
+    sql = re.sub(r"'(?:[^']|'')*'", "?", sql)
+    sql = re.sub(r"\b\d+(\.\d+)?\b", "?", sql)
+    sql = re.sub(r"\(\s*\?(\s*,\s*\?)+\s*\)", "(...)", sql)
+    sql = re.sub(r"\s+", " ", sql).strip()
+    return sql[:MAX_SQL_LENGTH]
+
+
+class MsgTrace:
+    def __init__(self, msg_type):
+        self.msg_type = msg_type
+        self.num_statements = 0
+        self.rows = 0
+        self.db_time = 0.0
+        # (secs, statement)
+        self.slow_queries = []
+
+    def record(self, statement, elapsed, rows):
+        self.num_statements += 1
+        self.rows += max(rows, 0)
+        self.db_time += elapsed
+        self.slow_queries.append((elapsed, statement))
+        if len(self.slow_queries) > NUM_SLOW_QUERIES_PER_MSG:
+            self.slow_queries.sort(key=lambda slow_query: slow_query[0], reverse=True)
+            self.slow_queries.pop()
+
+
+class MsgTypeStats:
+    # aggregates of the msgs of a type since the last flush
+    def __init__(self):
+        self.num_msgs = 0
+        self.num_statements = 0
+        self.rows = 0
+        self.db_time = 0.0
+        self.max_db_time = 0.0
+        # statement: max secs
+        self.slow_queries = {}
+
+    def add(self, trace):
+        self.num_msgs += 1
+        self.num_statements += trace.num_statements
+        self.rows += trace.rows
+        self.db_time += trace.db_time
+        self.max_db_time = max(self.max_db_time, trace.db_time)
+        for elapsed, statement in trace.slow_queries:
+            self.slow_queries[statement] = max(elapsed, self.slow_queries.get(statement, 0))
+
+    def get_slow_queries(self):
+        # normalized sql: max secs, the NUM_SLOW_QUERIES slowest
+        slow_queries = {}
+        for statement, elapsed in self.slow_queries.items():
+            sql = normalize_sql(statement)
+            slow_queries[sql] = max(elapsed, slow_queries.get(sql, 0))
+        return sorted(slow_queries.items(), key=lambda item: item[1], reverse=True)[
+            :NUM_SLOW_QUERIES
+        ]
+
+    def save(self, pipe, record_max, msg_type, max_db_time_key):
+        stats_key = get_stats_key(msg_type)
+        slow_queries_key = get_slow_queries_key(msg_type)
+        pipe.sadd(cc.HandlerDBStatsKeys.MSG_TYPES, msg_type)
+        pipe.hincrby(stats_key, "num_msgs", self.num_msgs)
+        pipe.hincrby(stats_key, "num_statements", self.num_statements)
+        pipe.hincrby(stats_key, "rows", self.rows)
+        pipe.hincrbyfloat(stats_key, "db_time_ms", round(self.db_time * 1000, 3))
+        pipe.expire(stats_key, STATS_TTL)
+        record_max(
+            keys=[max_db_time_key],
+            args=[
+                msg_type,
+                round(self.max_db_time * 1000, 3),
+                1000,
+                MAX_DB_TIME_WINDOW * (NUM_MAX_DB_TIME_WINDOWS + 1),
+            ],
+            client=pipe,
+        )
+        for sql, elapsed in self.get_slow_queries():
+            record_max(
+                keys=[slow_queries_key],
+                args=[sql, round(elapsed * 1000, 3), NUM_SLOW_QUERIES, STATS_TTL],
+                client=pipe,
+            )
+
+
+class StatsFlusher:
+    def __init__(self, interval=FLUSH_INTERVAL):
+        self.interval = interval
+        self.lock = threading.Lock()
+        # msg type: MsgTypeStats
+        self.stats = {}
+        self.thread = None
+
+    def add(self, trace):
+        with self.lock:
+            msg_type_stats = self.stats.get(trace.msg_type)
+            if msg_type_stats is None:
+                msg_type_stats = self.stats[trace.msg_type] = MsgTypeStats()
+            msg_type_stats.add(trace)
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self.run, name="handler_db_stats_flusher", daemon=True
+                )
+                self.thread.start()
+
+    def flush(self):
+        with self.lock:
+            stats, self.stats = self.stats, {}
+        if not stats:
+            return
+        redis_conn = get_redis_conn()
+        record_max = get_record_max_script(redis_conn)
+        max_db_time_key = get_max_db_time_key(get_max_db_time_window())
+        with redis_conn.pipeline() as pipe:
+            for msg_type, msg_type_stats in stats.items():
+                msg_type_stats.save(pipe, record_max, msg_type, max_db_time_key)
+            pipe.execute()
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                # stats are best effort
+                logging.getLogger().warning(f"unable to save handler db stats, {e}")
+
+
+def get_flusher():
+    global _flusher
+    if _flusher is None:
+        _flusher = StatsFlusher()
+    return _flusher
+
+
+def flush_handler_db_stats():
+    # the process is about to exit(rq work horse), don't wait for the thread
+    if _flusher is None:
+        return
+    try:
+        _flusher.flush()
+    except Exception as e:
+        logging.getLogger().warning(f"unable to save handler db stats, {e}")
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if getattr(_local, "trace", None) is not None:
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    trace = getattr(_local, "trace", None)
+    query_start = conn.info.get("query_start")
+    if trace is None or not query_start:
+        return
+    # rows returned, rowcount of inserts, updates is not counted
+    rows = cursor.rowcount if cursor.description is not None else 0
+    trace.record(statement, time.perf_counter() - query_start.pop(), rows)
+
+
+@contextmanager
+def trace_msg(msg_type):
+    # statements run in the block are recorded against msg_type
+    trace = MsgTrace(msg_type)
+    outer_trace = getattr(_local, "trace", None)
+    _local.trace = trace
+    try:
+        yield trace
+    finally:
+        _local.trace = outer_trace
+        get_flusher().add(trace)
+
+
+def get_max_db_time(redis_conn):
+    # msg type: max db time of a msg in the last NUM_MAX_DB_TIME_WINDOWS windows
+    max_db_time = {}
+    window = get_max_db_time_window()
+    with redis_conn.pipeline() as pipe:
+        for i in range(NUM_MAX_DB_TIME_WINDOWS):
+            pipe.zrange(get_max_db_time_key(window - i), 0, -1, withscores=True)
+        for window_max_db_time in pipe.execute():
+            for msg_type, db_time_ms in window_max_db_time:
+                max_db_time[msg_type] = max(db_time_ms, max_db_time.get(msg_type, 0))
+    return max_db_time
+
+
+def get_handler_db_stats():
+    redis_conn = get_redis_conn(decode_responses=True)
+    max_db_time = get_max_db_time(redis_conn)
+
+    all_stats = {}
+    for msg_type in sorted(redis_conn.smembers(cc.HandlerDBStatsKeys.MSG_TYPES)):
+        stats = redis_conn.hgetall(get_stats_key(msg_type))
+        if not stats:
+            continue
+        num_msgs = int(stats["num_msgs"])
+        slow_queries = redis_conn.zrevrange(
+            get_slow_queries_key(msg_type), 0, -1, withscores=True
+        )
+        all_stats[msg_type] = {
+            "num_msgs": num_msgs,
+            "num_statements": int(stats["num_statements"]),
+            "statements_per_msg": round(int(stats["num_statements"]) / num_msgs, 2),
+            "rows_per_msg": round(int(stats["rows"]) / num_msgs, 2),
+            "db_time_ms": round(float(stats["db_time_ms"]), 3),
+            "db_time_ms_per_msg": round(float(stats["db_time_ms"]) / num_msgs, 3),
+            "max_db_time_ms": max_db_time.get(msg_type),
+            "slow_queries": [
+                {"sql": sql, "max_ms": max_ms} for sql, max_ms in slow_queries
+            ],
+        }
+    return all_stats
@@ -1,8 +1,10 @@
 import os
-import redis
 import json
 from typing import List
 
+# ati code imports
+from utils.redis_pool import get_redis_conn
+
 
 def get_other_loggers():
     others_loggers = []
@@ -93,12 +95,12 @@ def set_log_config_dict(all_sherpas: List[str] = []):
         add_handler(log_name, log_config)
         add_logger(log_name, log_config)
 
-    with redis.from_url(os.getenv("FM_REDIS_URI")) as redis_conn:
+    with get_redis_conn() as redis_conn:
         redis_conn.set("log_dict_config", json.dumps(log_config))
 
 
 def get_log_config_dict():
-    with redis.from_url(os.getenv("FM_REDIS_URI")) as redis_conn:
+    with get_redis_conn() as redis_conn:
         log_config_dict = redis_conn.get("log_dict_config")
 
         if log_config_dict is None:
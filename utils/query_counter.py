@@ -0,0 +1,41 @@
+from sqlalchemy import event
+
+# ati code imports
+from core.common import get_fm_engine
+
+
+# Counts the SQL statements run on an engine(the pooled engine of the process by default)
+# inside a with block, so that the number of statements run by a handler can be checked
+# against a budget.
+#
+#   with QueryCounter() as query_counter:
+#       handler.handle(msg)
+#   query_counter.check_budget(6, msg.type)
+
+
+class QueryCounter:
+    def __init__(self, engine=None):
+        self.engine = engine if engine is not None else get_fm_engine()
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        self.statements = []
+        event.listen(self.engine, "before_cursor_execute", self.on_execute)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        event.remove(self.engine, "before_cursor_execute", self.on_execute)
+
+    def check_budget(self, budget, label=""):
+        if self.count > budget:
+            statements = "\n".join(self.statements)
+            raise AssertionError(
+                f"{label} ran {self.count} statements, budget {budget}\n{statements}"
+            )
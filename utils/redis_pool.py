@@ -0,0 +1,50 @@
+import os
+import asyncio
+import redis
+import aioredis
+
+
+# Process wide redis connection pools. Clients returned share the pool of the process,
+# so short lived calls(publish a msg, read a key) reuse an open connection instead of
+# connecting for every call. Closing the client(or using it as a context manager) only
+# returns the connection to the pool.
+# Pools are dropped in forked children(rq work horses, main.py processes), a child never
+# uses a connection of its parent.
+
+# decode_responses: pool
+_pools = {}
+
+# (decode_responses, event loop): pool, aioredis connections are bound to an event loop
+_async_pools = {}
+
+
+def _reset_pools():
+    _pools.clear()
+    _async_pools.clear()
+
+
+os.register_at_fork(after_in_child=_reset_pools)
+
+
+def get_redis_conn(decode_responses=False) -> redis.Redis:
+    pool = _pools.get(decode_responses)
+    if pool is None:
+        pool = redis.ConnectionPool.from_url(
+            os.getenv("FM_REDIS_URI"), decode_responses=decode_responses
+        )
+        _pools[decode_responses] = pool
+    return redis.Redis(connection_pool=pool)
+
+
+def get_async_redis_conn(decode_responses=False) -> aioredis.Redis:
+    key = (decode_responses, asyncio.get_running_loop())
+    pool = _async_pools.get(key)
+    if pool is None:
+        # pools of closed loops(asyncio.run in scripts) are not used anymore
+        for closed_key in [k for k in _async_pools if k[1].is_closed()]:
+            del _async_pools[closed_key]
+        pool = aioredis.ConnectionPool.from_url(
+            os.getenv("FM_REDIS_URI"), decode_responses=decode_responses
+        )
+        _async_pools[key] = pool
+    return aioredis.Redis(connection_pool=pool)
@@ -0,0 +1,127 @@
+import asyncio
+import json
+import logging
+
+# ati code imports
+import utils.comms as utils_comms
+from utils.redis_pool import get_async_redis_conn
+
+
+# One redis pubsub connection per process(event loop) shared by all the websocket
+# writers. Msgs of a channel are decoded once(utils.comms.decode_msg) and put to the
+# asyncio queue of every subscription of the channel, the writers await on their queue.
+# Decoded msgs are shared by the subscriptions, subscribers must not modify them.
+# Channels are subscribed to in redis on first use and are never unsubscribed, the set of
+# channels(status updates, notifications, plugin comms, one per sherpa) is small.
+# A full queue loses its oldest msg, except on lossless channels(sherpa requests), where
+# the new msg is rejected instead and a request waiting for an ack gets a failure reply.
+
+SUBSCRIPTION_QUEUE_SIZE = 100
+
+# secs the failure reply of a rejected sherpa request is kept for send_req_to_sherpa
+REJECTED_REQ_REPLY_TTL = 60
+
+# secs to wait before reconnecting to redis after the connection was lost
+RECONNECT_INTERVAL = 1
+
+logger = logging.getLogger("uvicorn")
+
+
+class RedisSubscriber:
+    def __init__(self):
+        self.subscriptions = {}
+        self.lossless_channels = set()
+        self.psub = None
+        self.reader_task = None
+        # connecting and subscribing are serialized, so that every SUBSCRIBE goes out on
+        # the connection the reader listens on
+        self.lock = asyncio.Lock()
+
+    async def subscribe(
+        self, channel, maxsize=SUBSCRIPTION_QUEUE_SIZE, lossless=False
+    ) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=maxsize)
+        if lossless:
+            self.lossless_channels.add(channel)
+        async with self.lock:
+            if channel not in self.subscriptions:
+                self.subscriptions[channel] = set()
+                if self.psub is not None:
+                    await self.psub.subscribe(channel)
+            self.subscriptions[channel].add(queue)
+
+        if self.reader_task is None or self.reader_task.done():
+            self.reader_task = asyncio.create_task(self.run())
+        return queue
+
+    def unsubscribe(self, channel, queue):
+        self.subscriptions.get(channel, set()).discard(queue)
+
+    def publish(self, channel, data):
+        for queue in self.subscriptions.get(channel, ()):
+            if queue.full():
+                if channel in self.lossless_channels:
+                    self.reject_msg(channel, data)
+                    continue
+                # subscriber isn't keeping up, drop its oldest msg
+                queue.get_nowait()
+                logger.warning(f"subscription queue of {channel} full, dropped a msg")
+            queue.put_nowait(data)
+
+    def reject_msg(self, channel, data):
+        req_id = data.get("req_id")
+        logger.error(
+            f"subscription queue of {channel} full, rejected msg {data.get('endpoint')}, "
+            f"req_id: {req_id}"
+        )
+        if req_id is not None and data.get("ack_reqd", True):
+            asyncio.create_task(self.reply_failure(req_id))
+
+    async def reply_failure(self, req_id):
+        # send_req_to_sherpa stops waiting and raises on success_{req_id} false
+        try:
+            await get_async_redis_conn().setex(
+                f"success_{req_id}", REJECTED_REQ_REPLY_TTL, json.dumps(False)
+            )
+        except Exception as e:
+            logger.error(f"unable to reply failure of rejected req_id: {req_id}, {e}")
+
+    async def run(self):
+        while True:
+            psub = None
+            try:
+                async with self.lock:
+                    psub = get_async_redis_conn(decode_responses=True).pubsub()
+                    await psub.subscribe(*self.subscriptions.keys())
+                    self.psub = psub
+                async for message in psub.listen():
+                    if message["type"] != "message":
+                        continue
+                    try:
+                        data = utils_comms.decode_msg(message["data"])
+                    except Exception as e:
+                        logger.error(f"unable to decode msg of {message['channel']}, {e}")
+                        continue
+                    self.publish(message["channel"], data)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"redis subscriber lost connection, will reconnect, {e}")
+            finally:
+                self.psub = None
+                if psub is not None:
+                    await psub.reset()
+            await asyncio.sleep(RECONNECT_INTERVAL)
+
+
+# event loop: RedisSubscriber
+_subscribers = {}
+
+
+def get_redis_subscriber() -> RedisSubscriber:
+    loop = asyncio.get_running_loop()
+    subscriber = _subscribers.get(loop)
+    if subscriber is None:
+        subscriber = RedisSubscriber()
+        _subscribers[loop] = subscriber
+    return subscriber
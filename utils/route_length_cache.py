@@ -0,0 +1,351 @@
+import os
+import json
+import hashlib
+import logging
+import redis
+import numpy as np
+from collections import OrderedDict
+
+# ati code imports
+import utils.util as utils_util
+
+
+# grid cell size used to quantize poses which are not at a station
+XY_RESOLUTION = 0.1
+THETA_RESOLUTION = 0.05
+
+# max entries in the per process LRU, shared by all the fleets
+LOCAL_CACHE_SIZE = 50000
+
+# redis namespaces expire if not written to for a week, namespaces which grow beyond
+# REDIS_NAMESPACE_MAX_ENTRIES are dropped and filled up again
+REDIS_NAMESPACE_TTL_SEC = 7 * 24 * 60 * 60
+REDIS_NAMESPACE_MAX_ENTRIES = 500000
+
+# fleet_name: namespace, stations of the loaded map, set by the router on map (re)load so
+# that callers can look up the cache before queuing a router job
+FLEETS_KEY = "rl_cache_fleets"
+
+# fleet_name: namespace of the loaded map, checked by the callers on every lookup so that
+# a map reload is seen right away
+FLEET_NAMESPACES_KEY = "rl_cache_fleet_namespaces"
+
+# max entries in the LRU of a caller process(RouteLengthLookup)
+LOOKUP_CACHE_SIZE = 10000
+
+
+def get_map_version(map_files):
+    # short digest of all the map file hashes of a fleet, changes with any map file
+    file_hashes = sorted(f"{mf.filename}:{mf.file_hash}" for mf in map_files)
+    return hashlib.sha1(",".join(file_hashes).encode()).hexdigest()[:12]
+
+
+def get_namespace(fleet_name, map_version):
+    return f"rl_cache:{fleet_name}:{map_version}"
+
+
+def get_stats_key(fleet_name):
+    return f"rl_cache_stats:{fleet_name}"
+
+
+def get_thresholds():
+    common_config = utils_util.get_mule_config().get("control").get("common")
+    return (
+        common_config.get("station_dist_thresh", 0.8),
+        common_config.get("station_theta_thresh", 0.2),
+    )
+
+
+def quantize_pose(pose, station_names, station_poses, dist_threshold, theta_threshold):
+    # poses close to a station snap to the station, rest to a grid cell
+    if station_poses is not None and len(station_poses) > 0:
+        xy_dist = np.linalg.norm(station_poses[:, :2] - np.array(pose[:2]), axis=1)
+        theta_dist = np.abs((station_poses[:, 2] - pose[2] + np.pi) % (2 * np.pi) - np.pi)
+        close = np.flatnonzero(
+            (xy_dist <= dist_threshold) & (theta_dist <= theta_threshold)
+        )
+        if close.size > 0:
+            nearest = close[np.argmin(xy_dist[close])]
+            return f"s:{station_names[nearest]}"
+
+    theta = (pose[2] + np.pi) % (2 * np.pi) - np.pi
+    return "g:{}_{}_{}".format(
+        int(round(pose[0] / XY_RESOLUTION)),
+        int(round(pose[1] / XY_RESOLUTION)),
+        int(round(theta / THETA_RESOLUTION)),
+    )
+
+
+class RouteLengthCache:
+    # route lengths keyed by quantized poses, namespaced by fleet and map version
+    # lookups go to the local LRU first, then to the redis namespace of the fleet
+    def __init__(self, redis_conn=None, max_size=LOCAL_CACHE_SIZE):
+        self.redis_conn = redis_conn or redis.from_url(os.getenv("FM_REDIS_URI"))
+        self.max_size = max_size
+        self.lru = OrderedDict()
+        self.namespaces = {}
+        self.station_names = {}
+        self.station_poses = {}
+        self.stats = {}
+
+        self.dist_threshold, self.theta_threshold = get_thresholds()
+        self.logger = logging.getLogger("control_module_router")
+
+    def reset_fleet(self, fleet_name, map_version, stations):
+        # map of the fleet got (re)loaded, drop everything cached for the fleet
+        for namespace in self.redis_conn.scan_iter(f"rl_cache:{fleet_name}:*"):
+            self.redis_conn.delete(namespace)
+
+        for key in [key for key in self.lru if key[0] == fleet_name]:
+            del self.lru[key]
+
+        self.namespaces[fleet_name] = get_namespace(fleet_name, map_version)
+        self.station_names[fleet_name] = [station.name for station in stations]
+        self.station_poses[fleet_name] = np.array(
+            [station.pose for station in stations], dtype=float
+        ).reshape(-1, 3)
+        self.stats[fleet_name] = {"local_hits": 0, "redis_hits": 0, "misses": 0}
+        with self.redis_conn.pipeline() as pipe:
+            pipe.hset(
+                FLEETS_KEY,
+                fleet_name,
+                json.dumps(
+                    {
+                        "namespace": self.namespaces[fleet_name],
+                        "station_names": self.station_names[fleet_name],
+                        "station_poses": self.station_poses[fleet_name].tolist(),
+                    }
+                ),
+            )
+            pipe.hset(FLEET_NAMESPACES_KEY, fleet_name, self.namespaces[fleet_name])
+            pipe.execute()
+        self.logger.info(
+            f"route length cache of {fleet_name} reset, namespace: {self.namespaces[fleet_name]}"
+        )
+
+    def quantize_pose(self, fleet_name, pose):
+        return quantize_pose(
+            pose,
+            self.station_names.get(fleet_name),
+            self.station_poses.get(fleet_name),
+            self.dist_threshold,
+            self.theta_threshold,
+        )
+
+    def get_keys(self, fleet_name, sources, targets):
+        source_keys = [self.quantize_pose(fleet_name, source) for source in sources]
+        target_keys = [self.quantize_pose(fleet_name, target) for target in targets]
+        return [f"{sk}|{tk}" for sk in source_keys for tk in target_keys]
+
+    def get_pair_keys(self, fleet_name, sources, targets):
+        source_keys = [self.quantize_pose(fleet_name, source) for source in sources]
+        target_keys = [self.quantize_pose(fleet_name, target) for target in targets]
+        return [f"{sk}|{tk}" for sk, tk in zip(source_keys, target_keys)]
+
+    def get_matrix(self, fleet_name, sources, targets):
+        # cached route lengths as a len(sources) x len(targets) array, nan if not cached
+        route_lengths = np.full(len(sources) * len(targets), np.nan)
+        namespace = self.namespaces.get(fleet_name)
+        if namespace is not None and route_lengths.size > 0:
+            keys = self.get_keys(fleet_name, sources, targets)
+            self.fill_cached(fleet_name, namespace, keys, route_lengths)
+        return route_lengths.reshape(len(sources), len(targets))
+
+    def get_pairs(self, fleet_name, sources, targets):
+        # cached route lengths from sources[i] to targets[i], nan if not cached
+        route_lengths = np.full(len(sources), np.nan)
+        namespace = self.namespaces.get(fleet_name)
+        if namespace is not None and route_lengths.size > 0:
+            keys = self.get_pair_keys(fleet_name, sources, targets)
+            self.fill_cached(fleet_name, namespace, keys, route_lengths)
+        return route_lengths
+
+    def fill_cached(self, fleet_name, namespace, keys, route_lengths):
+        # route_lengths[k] of the keys cached in the local LRU or redis
+        stats = self.stats[fleet_name]
+        redis_lookups = []
+        for k, key in enumerate(keys):
+            route_length = self.lru.get((fleet_name, key))
+            if route_length is None:
+                redis_lookups.append(k)
+            else:
+                self.lru.move_to_end((fleet_name, key))
+                route_lengths[k] = route_length
+                stats["local_hits"] += 1
+
+        if redis_lookups:
+            cached = self.redis_conn.hmget(namespace, [keys[k] for k in redis_lookups])
+            for k, route_length in zip(redis_lookups, cached):
+                if route_length is None:
+                    stats["misses"] += 1
+                    continue
+                route_lengths[k] = float(route_length)
+                self.add_to_lru(fleet_name, keys[k], route_lengths[k])
+                stats["redis_hits"] += 1
+
+    def set_matrix(self, fleet_name, sources, targets, route_lengths, computed):
+        # cache the computed cells, route lengths which couldn't be found are not cached
+        namespace = self.namespaces.get(fleet_name)
+        if namespace is None:
+            return
+        keys = self.get_keys(fleet_name, sources, targets)
+        self.save(fleet_name, namespace, keys, route_lengths.ravel(), computed.ravel())
+
+    def set_pairs(self, fleet_name, sources, targets, route_lengths, computed):
+        namespace = self.namespaces.get(fleet_name)
+        if namespace is None:
+            return
+        keys = self.get_pair_keys(fleet_name, sources, targets)
+        self.save(fleet_name, namespace, keys, route_lengths, computed)
+
+    def save(self, fleet_name, namespace, keys, route_lengths, computed):
+        to_cache = {}
+        for k in np.flatnonzero(computed & np.isfinite(route_lengths)):
+            to_cache[keys[k]] = float(route_lengths[k])
+            self.add_to_lru(fleet_name, keys[k], to_cache[keys[k]])
+
+        with self.redis_conn.pipeline() as pipe:
+            if to_cache:
+                pipe.hset(namespace, mapping=to_cache)
+                pipe.expire(namespace, REDIS_NAMESPACE_TTL_SEC)
+            pipe.hlen(namespace)
+            self.flush_stats(pipe, fleet_name)
+            results = pipe.execute()
+            namespace_size = results[2] if to_cache else results[0]
+
+        if namespace_size > REDIS_NAMESPACE_MAX_ENTRIES:
+            self.logger.info(f"{namespace} has {namespace_size} entries, dropping it")
+            self.redis_conn.delete(namespace)
+
+    def add_to_lru(self, fleet_name, key, route_length):
+        self.lru[(fleet_name, key)] = route_length
+        self.lru.move_to_end((fleet_name, key))
+        if len(self.lru) > self.max_size:
+            self.lru.popitem(last=False)
+
+    def flush_stats(self, pipe, fleet_name):
+        # counters are accumulated locally and added to redis once per lookup/update
+        stats = self.stats.get(fleet_name, {})
+        for name, count in stats.items():
+            if count:
+                pipe.hincrby(get_stats_key(fleet_name), name, count)
+                stats[name] = 0
+
+
+class RouteLengthLookup:
+    # route length cache as seen by the callers of utils.util.get_route_length, a LRU of
+    # the process in front of the redis namespace the router fills. Keys are the ones used
+    # by the router(quantize_pose with the stations of the loaded map), so a route length
+    # computed for any process is found without queuing a router job. Every lookup checks
+    # the namespace of the fleet(FLEET_NAMESPACES_KEY) in the same round trip as the redis
+    # lookup, entries of an old namespace are dropped as soon as the map is reloaded.
+    def __init__(self, max_size=LOOKUP_CACHE_SIZE):
+        self.max_size = max_size
+        self.lru = OrderedDict()
+        # fleet_name: (namespace, station names, station poses)
+        self.fleets = {}
+        # fleet_name: hits counted since the last lookup, added to get_stats_key
+        self.stats = {}
+        self.thresholds = None
+
+    def load_fleet(self, redis_conn, fleet_name):
+        # namespace, stations of the map loaded by the router, None if not loaded
+        fleet_info = redis_conn.hget(FLEETS_KEY, fleet_name)
+        fleet = self.fleets.pop(fleet_name, None)
+        if fleet is not None:
+            self.drop_namespace(fleet[0])
+        if fleet_info is None:
+            return None
+        fleet_info = json.loads(fleet_info)
+        fleet = (
+            fleet_info["namespace"],
+            fleet_info["station_names"],
+            np.array(fleet_info["station_poses"], dtype=float).reshape(-1, 3),
+        )
+        self.fleets[fleet_name] = fleet
+        return fleet
+
+    def drop_namespace(self, namespace):
+        for key in [key for key in self.lru if key[0] == namespace]:
+            del self.lru[key]
+
+    def get_key(self, fleet_name, pose_1, pose_2):
+        # (namespace, quantized poses), None if the fleet isn't loaded
+        fleet = self.fleets.get(fleet_name)
+        if fleet is None:
+            return None
+        if self.thresholds is None:
+            self.thresholds = get_thresholds()
+        namespace, station_names, station_poses = fleet
+        source_key = quantize_pose(pose_1, station_names, station_poses, *self.thresholds)
+        target_key = quantize_pose(pose_2, station_names, station_poses, *self.thresholds)
+        return namespace, f"{source_key}|{target_key}"
+
+    def get(self, redis_conn, fleet_name, pose_1, pose_2):
+        key = self.get_key(fleet_name, pose_1, pose_2)
+        route_length = self.lru.get(key) if key is not None else None
+        with redis_conn.pipeline() as pipe:
+            pipe.hget(FLEET_NAMESPACES_KEY, fleet_name)
+            if key is not None and route_length is None:
+                pipe.hget(*key)
+            self.flush_stats(pipe, fleet_name)
+            results = pipe.execute()
+
+        namespace = results[0].decode() if isinstance(results[0], bytes) else results[0]
+        if namespace is None:
+            # router hasn't loaded the fleet
+            return None
+
+        if key is None or key[0] != namespace:
+            # map got (re)loaded since the last lookup
+            if self.load_fleet(redis_conn, fleet_name) is None:
+                return None
+            key = self.get_key(fleet_name, pose_1, pose_2)
+            route_length = redis_conn.hget(*key)
+        elif route_length is not None:
+            self.lru.move_to_end(key)
+            self.add_hit(fleet_name, "local_hits")
+            return route_length
+        else:
+            route_length = results[1]
+
+        if route_length is None:
+            return None
+        route_length = float(route_length)
+        self.add_to_lru(key, route_length)
+        self.add_hit(fleet_name, "redis_hits")
+        return route_length
+
+    def set(self, fleet_name, pose_1, pose_2, route_length):
+        # route length got from the router, saved to redis by the router itself
+        key = self.get_key(fleet_name, pose_1, pose_2)
+        if key is not None and np.isfinite(route_length):
+            self.add_to_lru(key, float(route_length))
+
+    def add_to_lru(self, key, route_length):
+        self.lru[key] = route_length
+        self.lru.move_to_end(key)
+        if len(self.lru) > self.max_size:
+            self.lru.popitem(last=False)
+
+    def add_hit(self, fleet_name, name):
+        stats = self.stats.setdefault(fleet_name, {"local_hits": 0, "redis_hits": 0})
+        stats[name] += 1
+
+    def flush_stats(self, pipe, fleet_name):
+        # hits are added to redis with the next lookup of the fleet, no extra round trip
+        stats = self.stats.get(fleet_name, {})
+        for name, count in stats.items():
+            if count:
+                pipe.hincrby(get_stats_key(fleet_name), name, count)
+                stats[name] = 0
+
+
+_lookup = None
+
+
+def get_route_length_lookup():
+    global _lookup
+    if _lookup is None:
+        _lookup = RouteLengthLookup()
+    return _lookup
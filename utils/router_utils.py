@@ -1,9 +1,14 @@
 import sys
 import os
+import time
 import logging
+import numpy as np
 
 # ati code imports
 import utils.util as utils_util
+from utils.route_length_cache import RouteLengthCache, get_map_version
+import utils.station_route_lengths as srl
+from models.db_session import DBSession
 
 sys.path.append(os.environ["MULE_ROOT"])
 from mule.ati.control.bridge.router_planner_interface import RoutePlannerInterface
@@ -29,11 +34,61 @@ class RouterModule:
     def get_route(self, start_pose, end_pose):
         return self.router.solve_route(start_pose, end_pose)
 
+    def get_route_lengths_matrix(self, sources, targets, route_lengths=None):
+        # route_lengths[i, j] - route length from sources[i] to targets[j]
+        # only cells which are nan in the route_lengths passed are computed
+        if route_lengths is None:
+            route_lengths = np.full((len(sources), len(targets)), np.nan)
+
+        for i, source in enumerate(sources):
+            for j in np.flatnonzero(np.isnan(route_lengths[i])):
+                target = targets[j]
+                if utils_util.are_poses_close(source, target):
+                    route_lengths[i, j] = 0
+                    continue
+                try:
+                    route_lengths[i, j] = self.get_route_length(source, target)
+                except Exception as e:
+                    logging.info(
+                        f"unable to find route length between {source} and {target}, exception: {e}"
+                    )
+                    route_lengths[i, j] = np.inf
+
+        return route_lengths
+
+    def get_route_lengths_pairs(self, sources, targets, route_lengths=None):
+        # route_lengths[i] - route length from sources[i] to targets[i]
+        # only entries which are nan in the route_lengths passed are computed
+        if route_lengths is None:
+            route_lengths = np.full(len(sources), np.nan)
+
+        for i in np.flatnonzero(np.isnan(route_lengths)):
+            source, target = sources[i], targets[i]
+            if utils_util.are_poses_close(source, target):
+                route_lengths[i] = 0
+                continue
+            try:
+                route_lengths[i] = self.get_route_length(source, target)
+            except Exception as e:
+                logging.info(
+                    f"unable to find route length between {source} and {target}, exception: {e}"
+                )
+                route_lengths[i] = np.inf
+
+        return route_lengths
+
+
+# rows of the station route lengths matrix computed per update_station_route_lengths call
+STATION_RL_ROWS_PER_STEP = 1
+
 
 class AllRouterModules:
     def __init__(self, fleet_names):
         self.fleet_names = fleet_names
         self.router_modules = {}
+        self.rl_cache = RouteLengthCache()
+        # fleet_name: station route lengths being computed, see queue_station_route_lengths
+        self.station_rl_updates = {}
         for fleet_name in self.fleet_names:
             self.add_router_module(fleet_name)
 
@@ -44,12 +99,106 @@ class AllRouterModules:
             raise Exception(f"Unable to get router module for {fleet_name}")
         return rm
 
+    def get_route_lengths_matrix(self, fleet_name, sources, targets):
+        rm = self.get_router_module(fleet_name)
+        route_lengths = self.rl_cache.get_matrix(fleet_name, sources, targets)
+        to_compute = np.isnan(route_lengths)
+        if to_compute.any():
+            route_lengths = rm.get_route_lengths_matrix(sources, targets, route_lengths)
+        self.rl_cache.set_matrix(fleet_name, sources, targets, route_lengths, to_compute)
+        return route_lengths
+
+    def get_route_lengths_pairs(self, fleet_name, sources, targets):
+        rm = self.get_router_module(fleet_name)
+        route_lengths = self.rl_cache.get_pairs(fleet_name, sources, targets)
+        to_compute = np.isnan(route_lengths)
+        if to_compute.any():
+            route_lengths = rm.get_route_lengths_pairs(sources, targets, route_lengths)
+        self.rl_cache.set_pairs(fleet_name, sources, targets, route_lengths, to_compute)
+        return route_lengths
+
     @utils_util.report_error
     def add_router_module(self, fleet_name):
         try:
             map_path = os.path.join(os.environ["FM_STATIC_DIR"], f"{fleet_name}/map/")
             self.router_modules.update({fleet_name: RouterModule(map_path)})
+            with DBSession() as dbsession:
+                map_version = get_map_version(dbsession.get_map_files(fleet_name))
+                stations = [
+                    station
+                    for station in dbsession.get_all_stations_in_fleet(fleet_name)
+                    if station.pose
+                ]
+                self.rl_cache.reset_fleet(fleet_name, map_version, stations)
+                station_names = [station.name for station in stations]
+                station_poses = [station.pose for station in stations]
         except Exception as e:
             logging.error(
                 f"Unable to create router module for fleet {fleet_name}, exception: {e}"
             )
+            return
+
+        try:
+            self.queue_station_route_lengths(fleet_name, station_names, station_poses)
+        except Exception as e:
+            logging.error(
+                f"Unable to update station route lengths of fleet {fleet_name}, exception: {e}"
+            )
+
+    def queue_station_route_lengths(self, fleet_name, station_names, station_poses):
+        # all pairs station route lengths, recomputed only if map files/stations changed.
+        # The matrix is computed a few rows at a time(update_station_route_lengths) while
+        # the router worker serves jobs, callers go to the router module meanwhile.
+        map_digest = srl.get_map_digest(fleet_name, station_poses)
+        if map_digest == srl.get_saved_map_digest(fleet_name):
+            srl.restore_station_route_lengths(fleet_name)
+            logging.info(f"station route lengths of {fleet_name} are up to date")
+            return
+
+        self.station_rl_updates[fleet_name] = {
+            "station_names": station_names,
+            "station_poses": station_poses,
+            "map_digest": map_digest,
+            "route_lengths": np.full((len(station_poses), len(station_poses)), np.nan),
+            "next_row": 0,
+            "started_at": time.time(),
+        }
+
+    def has_pending_station_route_lengths(self):
+        return len(self.station_rl_updates) > 0
+
+    def update_station_route_lengths(self, num_rows=STATION_RL_ROWS_PER_STEP):
+        # computes the next rows of a queued station route lengths matrix, saved once all
+        # the rows are done
+        if not self.station_rl_updates:
+            return
+        fleet_name, update = next(iter(self.station_rl_updates.items()))
+        station_poses = update["station_poses"]
+        rows = slice(update["next_row"], update["next_row"] + num_rows)
+        try:
+            rm = self.get_router_module(fleet_name)
+            update["route_lengths"][rows] = rm.get_route_lengths_matrix(
+                station_poses[rows], station_poses, update["route_lengths"][rows]
+            )
+        except Exception as e:
+            logging.error(
+                f"Unable to update station route lengths of fleet {fleet_name}, exception: {e}"
+            )
+            del self.station_rl_updates[fleet_name]
+            return
+
+        update["next_row"] = rows.stop
+        if update["next_row"] < len(station_poses):
+            return
+
+        del self.station_rl_updates[fleet_name]
+        srl.save_station_route_lengths(
+            fleet_name,
+            update["station_names"],
+            station_poses,
+            update["route_lengths"],
+            update["map_digest"],
+        )
+        logging.info(
+            f"computed station route lengths of {fleet_name} for {len(station_poses)} stations in {time.time() - update['started_at']:.2f} secs"
+        )
@@ -1,28 +1,100 @@
 import logging
 from logging import WARNING
 import os
+import pickle
 import redis
 from rq import Queue
 import json
 from rq import Connection, Worker
+from rq.worker import RoundRobinWorker, SimpleWorker
 
 # ati code imports
 import utils.util as utils_util
+from core.db import set_process_role
+from models.mongo_client import FMMongo
+from utils.handler_db_stats import flush_handler_db_stats
+
+
+# rq config worker_mode
+# fork - a ForkingWorker per queue, forks a work horse per job
+# simple - jobs of the sherpa queues run in the worker process(warm imports, DB connection
+# pool), sherpa queues are spread over sherpa_workers workers, both queues of a sherpa on
+# the same worker so that its jobs run one after the other, in order. Other queues keep a
+# ForkingWorker each.
+# Jobs of a simple worker run one at a time, a slow job of a sherpa(e.g. waiting on the ack
+# of a request, bounded by utils.comms.SHERPA_REQ_ACK_TIMEOUT) holds up the other sherpas
+# of the worker, more sherpa_workers means fewer sherpas held up by one slow job.
+WORKER_MODE_FORK = "fork"
+WORKER_MODE_SIMPLE = "simple"
+DEFAULT_NUM_SHERPA_WORKERS = 4
+
+
+class ForkingWorker(Worker):
+    # the work horse exits(os._exit) after the job, flush the handler db stats of the job
+    def perform_job(self, job, queue):
+        try:
+            return super().perform_job(job, queue)
+        finally:
+            flush_handler_db_stats()
+
+
+class MultiplexedWorker(RoundRobinWorker, SimpleWorker):
+    # queues are served round robin, a sherpa with a backlog doesn't starve the others,
+    # jobs still run one after the other
+    pass
 
 
-def start_worker(queue):
+def start_worker(queue, worker_class=ForkingWorker):
+    # queue - queue name or list of queue names
+    set_process_role("rq_worker")
     with Connection():
-        Worker.log_result_lifespan = False
-        worker = Worker(
+        worker_class.log_result_lifespan = False
+        worker = worker_class(
             queue,
             disable_default_exception_handler=True,
             log_job_description=False,
             connection=redis.from_url(os.getenv("FM_REDIS_URI")),
         )
-        logging.info(f"Started worker for queue {queue}")
+        logging.info(f"Started {worker_class.__name__} for queue {queue}")
         worker.work(logging_level=WARNING, with_scheduler=True)
 
 
+def get_rq_config():
+    with FMMongo() as fm_mongo:
+        return fm_mongo.get_document_from_fm_config("rq")
+
+
+def get_sherpa_queue_names(sherpa):
+    return [f"{sherpa}_update_handler", f"{sherpa}_trip_update_handler"]
+
+
+def get_new_sherpa_worker_queues(sherpa, worker_mode):
+    # workers for the queues of a sherpa added after the start
+    q_names = get_sherpa_queue_names(sherpa)
+    if worker_mode == WORKER_MODE_FORK:
+        return [([q_name], ForkingWorker) for q_name in q_names]
+    return [(q_names, MultiplexedWorker)]
+
+
+def get_worker_queues(worker_mode, num_sherpa_workers):
+    # [(queue names, worker class)], a worker process each
+    if worker_mode == WORKER_MODE_FORK:
+        return [([q_name], ForkingWorker) for q_name in Queues.get_queues()]
+
+    all_sherpas = sorted(Queues.all_sherpas or [])
+    num_sherpa_workers = max(1, min(num_sherpa_workers, len(all_sherpas)))
+    sherpa_worker_queues = [[] for _ in range(num_sherpa_workers)] if all_sherpas else []
+    for i, sherpa in enumerate(all_sherpas):
+        sherpa_worker_queues[i % num_sherpa_workers].extend(get_sherpa_queue_names(sherpa))
+
+    worker_queues = [(q_names, MultiplexedWorker) for q_names in sherpa_worker_queues]
+    sherpa_q_names = [q_name for q_names in sherpa_worker_queues for q_name in q_names]
+    for q_name in Queues.get_queues():
+        if q_name not in sherpa_q_names:
+            worker_queues.append(([q_name], ForkingWorker))
+    return worker_queues
+
+
 # utils for redis rq
 class Queues:
     redis_conn = redis.from_url(
@@ -75,9 +147,32 @@ class Queues:
         return getattr(cls, qname)
 
 
-def signal_job_completion(job_id, redis_conn):
-    job_completion_key = f"job_{job_id}_completion"
-    redis_conn.rpush(job_completion_key, "completed")
+# completion of jobs enqueued with meta notify_completion is pushed to a per job list,
+# the API process waiting for the response BLPOPs on it instead of polling the job status
+JOB_COMPLETION_TTL = 60
+
+
+def get_job_completion_key(job_id):
+    return f"job_{job_id}_completion"
+
+
+def signal_job_completion(job, redis_conn, status, result=None, error_value=None):
+    if not job.meta.get("notify_completion"):
+        return
+
+    job_completion_key = get_job_completion_key(job.id)
+    completion = {"status": status, "result": result, "error_value": error_value}
+    try:
+        completion = pickle.dumps(completion)
+    except Exception:
+        # waiter falls back to fetching the job
+        completion = pickle.dumps({"status": status, "fetch_job": True})
+
+    with redis_conn.pipeline() as pipe:
+        pipe.rpush(job_completion_key, completion)
+        pipe.expire(job_completion_key, JOB_COMPLETION_TTL)
+        pipe.execute()
+
 
 def find_type_in_args(args):
     for arg in args:
@@ -91,6 +186,7 @@ def report_failure(job, connection, fail_type, value, traceback):
     job.meta["fail_type"] = fail_type
     job.meta["error_value"] = value
     job.save()
+    signal_job_completion(job, connection, "failed", error_value=value)
 
     type_value = find_type_in_args(job.args)
     if type_value is None:
@@ -104,17 +200,15 @@ def report_failure(job, connection, fail_type, value, traceback):
     error_dict = {
         "error_type": str(fail_type),
         "error_msg": value,
-        "Job arguments": job.type_value,
+        "Job arguments": type_value,
         "module": job.func_name,
         "code": "rq",
     }
     utils_util.write_fm_error_to_json_file("rq_failure", error_dict)
-    # signal_job_completion(job.id, connection)
 
 
 def report_success(job, connection, result, *args, **kwargs):
-    pass
-    # signal_job_completion(job.id, connection)
+    signal_job_completion(job, connection, "finished", result=result)
 
 
 def enqueue(queue: Queue, func, *args, **kwargs):
@@ -0,0 +1,187 @@
+import os
+import glob
+import json
+import hashlib
+import numpy as np
+
+
+# All pairs station to station route lengths of a fleet, computed by the router module
+# when the map of the fleet is loaded. Saved in a sub directory of the map folder, so
+# that they are not treated as map files, and memory mapped by the processes reading them.
+# The matrix is saved as route_lengths_{digest}.npy, index.json names the matrix it goes
+# with, replacing index.json is the single commit point of an update. The matrix of the
+# previous index is kept for the readers which loaded that index but not the matrix yet.
+# A map update renames index.json to index.stale.json(invalidate_station_route_lengths),
+# readers miss until the router module has saved the matrix of the new map or found the
+# stale one up to date(restore_station_route_lengths).
+STATION_RL_DIR = "station_route_lengths"
+ROUTE_LENGTHS_FILE = "route_lengths.npy"
+INDEX_FILE = "index.json"
+STALE_INDEX_FILE = "index.stale.json"
+
+# loaded station route lengths of this process, fleet_name: (index mtime, pose index, array)
+_loaded = {}
+
+
+def get_station_rl_dir(fleet_name):
+    return os.path.join(os.environ["FM_STATIC_DIR"], fleet_name, "map", STATION_RL_DIR)
+
+
+def get_pose_key(pose):
+    return tuple(round(float(val), 3) for val in pose[:3])
+
+
+def get_map_digest(fleet_name, station_poses):
+    # digest of the map files on disk and the station poses the matrix was computed for
+    map_path = os.path.join(os.environ["FM_STATIC_DIR"], fleet_name, "map")
+    sha1 = hashlib.sha1()
+    for file_name in sorted(os.listdir(map_path)):
+        file_path = os.path.join(map_path, file_name)
+        if file_name.startswith(".") or not os.path.isfile(file_path):
+            continue
+        sha1.update(file_name.encode())
+        with open(file_path, "rb") as f:
+            for data in iter(lambda: f.read(65536), b""):
+                sha1.update(data)
+    sha1.update(json.dumps(station_poses).encode())
+    return sha1.hexdigest()
+
+
+def get_saved_map_digest(fleet_name):
+    # digest of the saved matrix, invalidated or not
+    station_rl_dir = get_station_rl_dir(fleet_name)
+    for index_file in [INDEX_FILE, STALE_INDEX_FILE]:
+        index_path = os.path.join(station_rl_dir, index_file)
+        if os.path.exists(index_path):
+            with open(index_path, "r") as f:
+                return json.load(f).get("map_digest")
+    return None
+
+
+def invalidate_station_route_lengths(fleet_name):
+    # map of the fleet is being updated, readers stop using the saved matrix right away
+    station_rl_dir = get_station_rl_dir(fleet_name)
+    try:
+        os.replace(
+            os.path.join(station_rl_dir, INDEX_FILE),
+            os.path.join(station_rl_dir, STALE_INDEX_FILE),
+        )
+    except FileNotFoundError:
+        pass
+
+
+def restore_station_route_lengths(fleet_name):
+    # saved matrix is up to date with the updated map
+    station_rl_dir = get_station_rl_dir(fleet_name)
+    try:
+        os.replace(
+            os.path.join(station_rl_dir, STALE_INDEX_FILE),
+            os.path.join(station_rl_dir, INDEX_FILE),
+        )
+    except FileNotFoundError:
+        pass
+
+
+def save_station_route_lengths(
+    fleet_name, station_names, station_poses, route_lengths, map_digest
+):
+    station_rl_dir = get_station_rl_dir(fleet_name)
+    os.makedirs(station_rl_dir, exist_ok=True)
+
+    # the new matrix is written under its own name, readers see it only once the new
+    # index is in place, processes which have the old matrix memory mapped keep reading it
+    index_path = os.path.join(station_rl_dir, INDEX_FILE)
+    prev_rl_file = get_route_lengths_file(index_path) or get_route_lengths_file(
+        os.path.join(station_rl_dir, STALE_INDEX_FILE)
+    )
+    rl_file = f"route_lengths_{map_digest[:12]}.npy"
+    rl_path = os.path.join(station_rl_dir, rl_file)
+    with open(f"{rl_path}.tmp", "wb") as f:
+        np.save(f, np.asarray(route_lengths, dtype=np.float32))
+    os.replace(f"{rl_path}.tmp", rl_path)
+
+    with open(f"{index_path}.tmp", "w") as f:
+        json.dump(
+            {
+                "map_digest": map_digest,
+                "route_lengths_file": rl_file,
+                "station_names": station_names,
+                "station_poses": station_poses,
+            },
+            f,
+        )
+    os.replace(f"{index_path}.tmp", index_path)
+    if os.path.exists(os.path.join(station_rl_dir, STALE_INDEX_FILE)):
+        os.remove(os.path.join(station_rl_dir, STALE_INDEX_FILE))
+
+    for old_rl_path in glob.glob(os.path.join(station_rl_dir, "route_lengths*.npy")):
+        if os.path.basename(old_rl_path) not in [rl_file, prev_rl_file]:
+            os.remove(old_rl_path)
+
+
+def get_route_lengths_file(index_path):
+    # matrix file named by the index, None if there is no index
+    if not os.path.exists(index_path):
+        return None
+    with open(index_path, "r") as f:
+        return json.load(f).get("route_lengths_file", ROUTE_LENGTHS_FILE)
+
+
+def load_station_route_lengths(fleet_name):
+    # returns pose index and the memory mapped route lengths, None if not available
+    station_rl_dir = get_station_rl_dir(fleet_name)
+    index_path = os.path.join(station_rl_dir, INDEX_FILE)
+    try:
+        index_mtime = os.stat(index_path).st_mtime_ns
+    except FileNotFoundError:
+        _loaded.pop(fleet_name, None)
+        return None
+
+    loaded = _loaded.get(fleet_name)
+    if loaded is None or loaded[0] != index_mtime:
+        with open(index_path, "r") as f:
+            index = json.load(f)
+        pose_index = {
+            get_pose_key(pose): i for i, pose in enumerate(index["station_poses"])
+        }
+        rl_file = index.get("route_lengths_file", ROUTE_LENGTHS_FILE)
+        route_lengths = np.load(os.path.join(station_rl_dir, rl_file), mmap_mode="r")
+        loaded = (index_mtime, pose_index, route_lengths)
+        _loaded[fleet_name] = loaded
+
+    return loaded[1], loaded[2]
+
+
+def get_station_route_lengths_matrix(fleet_name, sources, targets):
+    # len(sources) x len(targets) array, nan for poses which are not station poses
+    route_lengths = np.full((len(sources), len(targets)), np.nan)
+    loaded = load_station_route_lengths(fleet_name)
+    if loaded is None:
+        return route_lengths
+
+    pose_index, station_route_lengths = loaded
+    rows = [pose_index.get(get_pose_key(source)) for source in sources]
+    cols = [pose_index.get(get_pose_key(target)) for target in targets]
+    valid_rows = [i for i, row in enumerate(rows) if row is not None]
+    valid_cols = [j for j, col in enumerate(cols) if col is not None]
+    if valid_rows and valid_cols:
+        route_lengths[np.ix_(valid_rows, valid_cols)] = station_route_lengths[
+            np.ix_([rows[i] for i in valid_rows], [cols[j] for j in valid_cols])
+        ]
+    return route_lengths
+
+
+def get_station_route_lengths_pairs(fleet_name, sources, targets):
+    # route lengths from sources[i] to targets[i], nan for poses which aren't station poses
+    route_lengths = np.full(len(sources), np.nan)
+    loaded = load_station_route_lengths(fleet_name)
+    if loaded is None:
+        return route_lengths
+
+    pose_index, station_route_lengths = loaded
+    for i, (source, target) in enumerate(zip(sources, targets)):
+        row = pose_index.get(get_pose_key(source))
+        col = pose_index.get(get_pose_key(target))
+        if row is not None and col is not None:
+            route_lengths[i] = station_route_lengths[row, col]
+    return route_lengths
@@ -0,0 +1,110 @@
+import logging
+import pickle
+
+# ati code imports
+import core.constants as cc
+from utils.redis_pool import get_redis_conn
+from utils.rq_utils import enqueue
+
+
+# Fast path for sherpa_status, trip_status msgs. Instead of a rq job per msg, msgs are
+# buffered in a redis list per sherpa queue({sherpa}_update_handler,
+# {sherpa}_trip_update_handler) and a single drain job is enqueued on the queue while
+# msgs are pending. The drain job takes all the buffered msgs, drops the superseded
+# sherpa_status msgs and applies the rest in order in one transaction
+# (Handlers.handle_batch). Msgs pushed after a drain job took the buffer enqueue another
+# drain job, so no msg is left behind and a sherpa's msgs are applied in order.
+
+# buffered msgs beyond this are dropped, oldest first, with an error log and counted in
+# cc.StatusIngestKeys.STATS msgs_dropped
+MAX_BUFFERED_MSGS = 500
+
+# secs, buffered msgs of a sherpa nobody drains are deleted after this
+BUFFER_TTL = 60
+
+
+def get_buffer_key(queue_name):
+    return f"status_batch:{queue_name}"
+
+
+def get_scheduled_key(queue_name):
+    return f"status_batch_scheduled:{queue_name}"
+
+
+def push_status_msg(queue, handler, msg, ttl, job_timeout, redis_conn=None):
+    if redis_conn is None:
+        redis_conn = get_redis_conn()
+
+    buffer_key = get_buffer_key(queue.name)
+    with redis_conn.pipeline() as pipe:
+        pipe.rpush(buffer_key, pickle.dumps(msg))
+        pipe.ltrim(buffer_key, -MAX_BUFFERED_MSGS, -1)
+        pipe.expire(buffer_key, BUFFER_TTL)
+        # expires with the drain job(ttl), a dropped job doesn't block the next one
+        pipe.set(get_scheduled_key(queue.name), 1, nx=True, ex=ttl)
+        pipe.hincrby(cc.StatusIngestKeys.STATS, "msgs_received", 1)
+        num_buffered, _, _, scheduled, _ = pipe.execute()
+
+    if num_buffered > MAX_BUFFERED_MSGS:
+        redis_conn.hincrby(cc.StatusIngestKeys.STATS, "msgs_dropped", 1)
+        logging.getLogger("status_updates").error(
+            f"{queue.name} has {num_buffered} msgs buffered, dropped the oldest one, "
+            f"drain jobs aren't keeping up"
+        )
+
+    if scheduled:
+        enqueue(
+            queue,
+            handle_status_batch,
+            handler,
+            queue.name,
+            ttl=ttl,
+            job_timeout=job_timeout,
+        )
+
+
+def pop_status_batch(queue_name, redis_conn):
+    # msgs pushed after this enqueue a new drain job
+    buffer_key = get_buffer_key(queue_name)
+    with redis_conn.pipeline() as pipe:
+        pipe.delete(get_scheduled_key(queue_name))
+        pipe.lrange(buffer_key, 0, -1)
+        pipe.delete(buffer_key)
+        _, buffered_msgs, _ = pipe.execute()
+    return [pickle.loads(buffered_msg) for buffered_msg in buffered_msgs]
+
+
+def coalesce_status_msgs(msgs):
+    # a sherpa_status is superseded by the next one unless the mode changes, the mode
+    # changes are handled(sherpa init, mode change records) as before
+    coalesced = []
+    for msg in msgs:
+        if (
+            coalesced
+            and msg.type == cc.MessageType.SHERPA_STATUS
+            and coalesced[-1].type == cc.MessageType.SHERPA_STATUS
+            and coalesced[-1].mode == msg.mode
+        ):
+            coalesced[-1] = msg
+        else:
+            coalesced.append(msg)
+    return coalesced
+
+
+def handle_status_batch(handler, queue_name, **kwargs):
+    redis_conn = get_redis_conn()
+    msgs = pop_status_batch(queue_name, redis_conn)
+    if not msgs:
+        return
+
+    coalesced = coalesce_status_msgs(msgs)
+    logging.getLogger("status_updates").info(
+        f"applying {len(coalesced)} of {len(msgs)} msgs buffered on {queue_name}"
+    )
+    handler.handle_batch(coalesced)
+
+    with redis_conn.pipeline() as pipe:
+        pipe.hincrby(cc.StatusIngestKeys.STATS, "batches", 1)
+        pipe.hincrby(cc.StatusIngestKeys.STATS, "msgs_drained", len(msgs))
+        pipe.hincrby(cc.StatusIngestKeys.STATS, "msgs_applied", len(coalesced))
+        pipe.execute()
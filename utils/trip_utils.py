@@ -11,74 +11,98 @@ from utils.util import get_table_as_dict
 # Master FM update_trip_inforequest model has to be in sync with this
 
 
+# trips serialized per ongoing trips query, bounds the IN list, rows held at a time
+TRIP_STATUS_CHUNK_SIZE = 500
+
+
 def get_trip_status(trip: Trip):
-    trip_status = {}
     with DBSession() as dbsession:
-        ongoing_trip: OngoingTrip = dbsession.get_ongoing_trip_with_trip_id(trip.id)
-
-        booking_time = None
-        end_time = None
-        start_time = None
-        updated_at = None
-        trip_leg = None
-        trip_analytics = None
-
-        if trip.booking_time:
-            booking_time = util.dt_to_str(trip.booking_time)
-        if trip.start_time:
-            start_time = util.dt_to_str(trip.start_time)
-        if trip.end_time:
-            end_time = util.dt_to_str(trip.end_time)
-        if trip.updated_at:
-            updated_at = util.dt_to_str(trip.updated_at)
-
-        if ongoing_trip:
-            trip_leg = ongoing_trip.trip_leg
-            trip_analytics: TripAnalytics = dbsession.get_trip_analytics(
-                ongoing_trip.trip_leg_id
+        return get_trips_status(dbsession, [trip])[trip.id]
+
+
+def iter_trips_status(dbsession: DBSession, trips, chunk_size=TRIP_STATUS_CHUNK_SIZE):
+    # yields {trip_id: trip status} per chunk of trips, the ongoing trips, current legs
+    # and analytics of a chunk are fetched in one query
+    for i in range(0, len(trips), chunk_size):
+        chunk = trips[i : i + chunk_size]
+        ongoing_trips = {
+            ongoing_trip.trip_id: (ongoing_trip, trip_analytics)
+            for ongoing_trip, trip_analytics in dbsession.get_ongoing_trips_with_analytics(
+                [trip.id for trip in chunk]
             )
-
-        trip_details = {
-            "status": trip.status,
-            "route_lengths": trip.route_lengths,
-            "etas_at_start": trip.etas_at_start,
-            "etas": trip.etas,
-            "trip_leg_id": trip_leg.id if trip_leg else None,
-            "next_idx_aug": ongoing_trip.next_idx_aug if ongoing_trip else None,
-            "trip_leg_from_station": trip_leg.from_station if trip_leg else None,
-            "trip_leg_to_station": trip_leg.to_station if trip_leg else None,
-            "trip_metadata": trip.trip_metadata,
-            "route": trip.augmented_route,
-            "priority": trip.priority,
-            "scheduled": trip.scheduled,
-            "time_period": trip.time_period,
-            "booking_id": trip.booking_id,
-            "booking_time": booking_time,
-            "start_time": start_time,
-            "end_time": end_time,
-            "updated_at": updated_at,
-            "booked_by": trip.booked_by,
         }
-
-        # all clients need to change for duplicated trip leg details to be removed from trip_details
-        # all_clients - summon button, sanjaya, conveyor, ies
-        trip_leg_details = {
-            "id": trip_leg.id if trip_leg else None,
-            "status": trip_leg.status if trip_leg else None,
-            "progress": trip_analytics.progress if trip_analytics else None,
-            "route_length": trip_analytics.route_length if trip_analytics else None,
-            "from_station": trip_leg.from_station if trip_leg else None,
-            "to_station": trip_leg.to_station if trip_leg else None,
-            "stoppage_reason": trip_leg.stoppage_reason if trip_leg else None,
+        yield {
+            trip.id: serialize_trip_status(trip, *ongoing_trips.get(trip.id, (None, None)))
+            for trip in chunk
         }
 
-        trip_status = {
-            "trip_id": trip.id,
-            "sherpa_name": trip.sherpa_name,
-            "fleet_name": trip.fleet_name,
-            "trip_details": trip_details,
-            "trip_leg_details": trip_leg_details,
-        }
+
+def get_trips_status(dbsession: DBSession, trips):
+    trips_status = {}
+    for chunk_status in iter_trips_status(dbsession, list(trips)):
+        trips_status.update(chunk_status)
+    return trips_status
+
+
+def serialize_trip_status(
+    trip: Trip, ongoing_trip: OngoingTrip = None, trip_analytics: TripAnalytics = None
+):
+    booking_time = None
+    end_time = None
+    start_time = None
+    updated_at = None
+    trip_leg = ongoing_trip.trip_leg if ongoing_trip else None
+
+    if trip.booking_time:
+        booking_time = util.dt_to_str(trip.booking_time)
+    if trip.start_time:
+        start_time = util.dt_to_str(trip.start_time)
+    if trip.end_time:
+        end_time = util.dt_to_str(trip.end_time)
+    if trip.updated_at:
+        updated_at = util.dt_to_str(trip.updated_at)
+
+    trip_details = {
+        "status": trip.status,
+        "route_lengths": trip.route_lengths,
+        "etas_at_start": trip.etas_at_start,
+        "etas": trip.etas,
+        "trip_leg_id": trip_leg.id if trip_leg else None,
+        "next_idx_aug": ongoing_trip.next_idx_aug if ongoing_trip else None,
+        "trip_leg_from_station": trip_leg.from_station if trip_leg else None,
+        "trip_leg_to_station": trip_leg.to_station if trip_leg else None,
+        "trip_metadata": trip.trip_metadata,
+        "route": trip.augmented_route,
+        "priority": trip.priority,
+        "scheduled": trip.scheduled,
+        "time_period": trip.time_period,
+        "booking_id": trip.booking_id,
+        "booking_time": booking_time,
+        "start_time": start_time,
+        "end_time": end_time,
+        "updated_at": updated_at,
+        "booked_by": trip.booked_by,
+    }
+
+    # all clients need to change for duplicated trip leg details to be removed from trip_details
+    # all_clients - summon button, sanjaya, conveyor, ies
+    trip_leg_details = {
+        "id": trip_leg.id if trip_leg else None,
+        "status": trip_leg.status if trip_leg else None,
+        "progress": trip_analytics.progress if trip_analytics else None,
+        "route_length": trip_analytics.route_length if trip_analytics else None,
+        "from_station": trip_leg.from_station if trip_leg else None,
+        "to_station": trip_leg.to_station if trip_leg else None,
+        "stoppage_reason": trip_leg.stoppage_reason if trip_leg else None,
+    }
+
+    trip_status = {
+        "trip_id": trip.id,
+        "sherpa_name": trip.sherpa_name,
+        "fleet_name": trip.fleet_name,
+        "trip_details": trip_details,
+        "trip_leg_details": trip_leg_details,
+    }
 
     return trip_status
 
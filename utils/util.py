@@ -17,6 +17,14 @@ import functools
 import aiofiles
 import re
 
+# ati code imports
+from core.constants import RouterJobQueues, RouterPoolKeys
+from utils.station_route_lengths import (
+    get_station_route_lengths_matrix,
+    get_station_route_lengths_pairs,
+)
+from utils.redis_pool import get_redis_conn
+
 TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
 IES_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
 
@@ -190,31 +198,158 @@ def rq_perf():
     return column_names, data
 
 
+def push_job_result(redis_conn, result_key, result, ttl_ms):
+    # result is pushed to a list so that the waiting caller can BLPOP on it
+    with redis_conn.pipeline() as pipe:
+        pipe.rpush(result_key, result)
+        pipe.pexpire(result_key, ttl_ms)
+        pipe.execute()
+
+
+def wait_for_job_result(redis_conn, result_key, timeout_ms):
+    timeout = max(1, int(np.ceil(timeout_ms / 1000)))
+    result = redis_conn.blpop(result_key, timeout=timeout)
+    if result is None:
+        raise Exception(f"Timed out waiting for {result_key}, timeout: {timeout} seconds")
+    return result[1]
+
+
+def get_router_job_queue(redis_conn, job_queue, fleet_name):
+    # job queue of the router worker serving the fleet
+    shard = redis_conn.hget(RouterPoolKeys.FLEET_SHARDS, fleet_name)
+    if shard is None:
+        # fleets get a shard when the router pool starts or on their first map update
+        raise Exception(f"No router worker serves {fleet_name}, unknown fleet")
+    return f"{job_queue}:{int(shard)}"
+
+
+def get_batch_job_timeout_ms(redis_conn, num_routes):
+    # default_job_timeout_ms is the budget of a route, the router module solves the routes
+    # of a batched job one after the other
+    return int(redis_conn.get("default_job_timeout_ms").decode()) * max(1, num_routes)
+
+
 def get_route_length(pose_1, pose_2, fleet_name, redis_conn=None):
+    from utils.route_length_cache import get_route_length_lookup
+
     job_id = generate_random_job_id()
 
     if redis_conn is None:
-        redis_conn = redis.from_url(os.getenv("FM_REDIS_URI"))
-
-    route_length = redis_conn.get(f"rl_{str(pose_1)}_{str(pose_2)}")
-    if route_length is None:
-        control_router_rl_job = [pose_1, pose_2, fleet_name, job_id]
-        redis_conn.setex(
-            f"control_router_rl_job_{job_id}",
+        redis_conn = get_redis_conn()
+
+    # station to station route lengths are precomputed, see utils/station_route_lengths.py
+    route_length = get_station_route_lengths_matrix(fleet_name, [pose_1], [pose_2])[0, 0]
+    if not np.isnan(route_length):
+        return float(route_length)
+
+    # route lengths cached by the router module, LRU of the process then redis, see
+    # utils/route_length_cache.py
+    rl_lookup = get_route_length_lookup()
+    route_length = rl_lookup.get(redis_conn, fleet_name, pose_1, pose_2)
+    if route_length is not None:
+        return route_length
+
+    control_router_rl_job = [pose_1, pose_2, fleet_name, job_id]
+    redis_conn.rpush(
+        get_router_job_queue(redis_conn, RouterJobQueues.ROUTE_LENGTH, fleet_name),
+        json.dumps(control_router_rl_job),
+    )
+    route_length = json.loads(
+        wait_for_job_result(
+            redis_conn,
+            f"result_{job_id}",
             int(redis_conn.get("default_job_timeout_ms").decode()),
-            json.dumps(control_router_rl_job),
         )
-        while not redis_conn.get(f"result_{job_id}"):
-            time.sleep(0.005)
-
-        route_length = json.loads(redis_conn.get(f"result_{job_id}"))
-        redis_conn.delete(f"result_{job_id}")
-    else:
-        route_length = float(route_length)
+    )
+    rl_lookup.set(fleet_name, pose_1, pose_2, route_length)
 
     return route_length
 
 
+# route lengths from every pose in sources to every pose in targets as a
+# len(sources) x len(targets) array, served by the router module as a single job
+def get_route_lengths_matrix(sources, targets, fleet_name, redis_conn=None):
+    if len(sources) == 0 or len(targets) == 0:
+        return np.zeros((len(sources), len(targets)))
+
+    # station to station cells come from the precomputed matrix, only the sources and
+    # targets with any other cell are sent to the router module
+    route_lengths = get_station_route_lengths_matrix(fleet_name, sources, targets)
+    missing = np.isnan(route_lengths)
+    rows = np.flatnonzero(missing.any(axis=1))
+    cols = np.flatnonzero(missing.any(axis=0))
+    if rows.size == 0:
+        return route_lengths
+
+    job_id = generate_random_job_id()
+
+    if redis_conn is None:
+        redis_conn = get_redis_conn()
+
+    control_router_rl_matrix_job = [
+        [sources[i] for i in rows],
+        [targets[j] for j in cols],
+        fleet_name,
+        job_id,
+    ]
+    redis_conn.rpush(
+        get_router_job_queue(redis_conn, RouterJobQueues.ROUTE_LENGTH_MATRIX, fleet_name),
+        json.dumps(control_router_rl_matrix_job),
+    )
+    router_route_lengths = json.loads(
+        wait_for_job_result(
+            redis_conn,
+            f"result_rl_matrix_job_{job_id}",
+            get_batch_job_timeout_ms(redis_conn, rows.size * cols.size),
+        )
+    )
+    router_route_lengths = np.array(router_route_lengths, dtype=float).reshape(
+        rows.size, cols.size
+    )
+
+    block = route_lengths[np.ix_(rows, cols)]
+    block_missing = missing[np.ix_(rows, cols)]
+    block[block_missing] = router_route_lengths[block_missing]
+    route_lengths[np.ix_(rows, cols)] = block
+
+    return route_lengths
+
+
+# route lengths from sources[i] to targets[i] as an array, pairs which are not station to
+# station are served by the router module as a single job
+def get_route_lengths_pairs(sources, targets, fleet_name, redis_conn=None):
+    route_lengths = get_station_route_lengths_pairs(fleet_name, sources, targets)
+    missing = np.flatnonzero(np.isnan(route_lengths))
+    if missing.size == 0:
+        return route_lengths
+
+    job_id = generate_random_job_id()
+
+    if redis_conn is None:
+        redis_conn = get_redis_conn()
+
+    control_router_rl_pairs_job = [
+        [sources[i] for i in missing],
+        [targets[i] for i in missing],
+        fleet_name,
+        job_id,
+    ]
+    redis_conn.rpush(
+        get_router_job_queue(redis_conn, RouterJobQueues.ROUTE_LENGTH_PAIRS, fleet_name),
+        json.dumps(control_router_rl_pairs_job),
+    )
+    router_route_lengths = json.loads(
+        wait_for_job_result(
+            redis_conn,
+            f"result_rl_pairs_job_{job_id}",
+            get_batch_job_timeout_ms(redis_conn, missing.size),
+        )
+    )
+    route_lengths[missing] = np.array(router_route_lengths, dtype=float)
+
+    return route_lengths
+
+
 def check_if_notification_alert_present(dbsession, log: str, log_level: str, enitity_names: list):
     import models.misc_models as mm
 